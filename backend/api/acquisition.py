@@ -0,0 +1,130 @@
+"""
+Acquisition report: how many copies each title needs
+
+For every book, over the last ``window_days``:
+
+- utilization: loan-days over copy-days, i.e. the share of the time an
+  average copy was out
+- hold pressure: active holds per copy
+- forecast loans over the next ``horizon_days``: exponentially smoothed
+  weekly loan starts, extrapolated, plus the patrons already queued
+
+``suggested_copies`` is the number of copies that would carry the forecast
+loan-days at ``target_utilization``. The report is ranked by ``copy_delta``,
+the difference from the current ``total_copies``. Positive deltas are
+titles to buy more of, negative ones are shelf space to reclaim.
+
+Weeks are counted back from ``now``, so the newest week is always complete.
+When ``window_days`` is not a multiple of 7 the oldest week is the short
+one, and its count is scaled up to a full week's worth.
+
+Copy-days use the current ``total_copies`` for the whole window, since copy
+counts are not historised.
+
+The job reads each loan once into flat per-book arrays indexed by a dense
+book index, then derives every metric in one pass over those arrays. No
+query is made per book.
+"""
+from array import array
+from datetime import timedelta
+from math import ceil
+
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from catalog.models import Book, BookDemandForecast
+from transactions.models import Reservation, Transaction, TransactionHistory
+from .cache import bump_generation
+
+DEFAULT_WINDOW_DAYS = 90
+DEFAULT_HORIZON_DAYS = 30
+DEFAULT_TARGET_UTILIZATION = 0.8
+# Weight of the latest week in the smoothed weekly loan rate
+SMOOTHING = 0.3
+# Loan length assumed for books with no returned loan in the window
+DEFAULT_LOAN_DAYS = 14
+
+DAY = 86400.0
+
+
+def compute_forecasts(window_days=DEFAULT_WINDOW_DAYS, horizon_days=DEFAULT_HORIZON_DAYS,
+                      target_utilization=DEFAULT_TARGET_UTILIZATION, now=None):
+    """Unsaved ``BookDemandForecast`` for every book"""
+    now = now or timezone.now()
+    start = now - timedelta(days=window_days)
+    weeks = max(1, ceil(window_days / 7))
+    # Days covered by the oldest week; the others are 7 days long
+    oldest_week_days = window_days - 7 * (weeks - 1)
+    
+    books = list(Book.objects.values_list('id', 'total_copies'))
+    position = {book_id: i for i, (book_id, _) in enumerate(books)}
+    size = len(books)
+    loan_days = array('d', [0.0]) * size
+    loans = array('l', [0]) * size
+    finished = array('l', [0]) * size
+    finished_days = array('d', [0.0]) * size
+    # weekly[i * weeks + w]: loans of book i started in week w of the window,
+    # the last week being the 7 days up to now
+    weekly = array('l', [0]) * (size * weeks)
+    holds = array('l', [0]) * size
+    
+    overlapping = Q(issue_date__lt=now) & (Q(return_date__isnull=True) | Q(return_date__gte=start))
+    for model in (Transaction, TransactionHistory):
+        rows = model.objects.filter(overlapping).values_list('book_id', 'issue_date', 'return_date')
+        for book_id, issued, returned in rows.iterator(chunk_size=20000):
+            i = position.get(book_id)
+            if i is None:
+                continue
+            end = min(returned or now, now)
+            loan_days[i] += max((end - max(issued, start)).total_seconds(), 0) / DAY
+            if issued >= start:
+                loans[i] += 1
+                weeks_ago = min(int((now - issued).total_seconds() // (7 * DAY)), weeks - 1)
+                weekly[(i + 1) * weeks - 1 - weeks_ago] += 1
+            if returned is not None:
+                finished[i] += 1
+                finished_days[i] += (returned - issued).total_seconds() / DAY
+    
+    active = Reservation.objects.filter(status='active').values('book_id').annotate(count=Count('id'))
+    for row in active.values_list('book_id', 'count'):
+        i = position.get(row[0])
+        if i is not None:
+            holds[i] = row[1]
+    
+    forecasts = []
+    for i, (book_id, total_copies) in enumerate(books):
+        copies = max(total_copies, 1)
+        rate = weekly[i * weeks] * 7 / oldest_week_days
+        for week in range(i * weeks + 1, (i + 1) * weeks):
+            rate = SMOOTHING * weekly[week] + (1 - SMOOTHING) * rate
+        forecast_loans = rate * horizon_days / 7 + holds[i]
+        average_loan_days = finished_days[i] / finished[i] if finished[i] else DEFAULT_LOAN_DAYS
+        suggested = max(1, ceil(forecast_loans * average_loan_days / (horizon_days * target_utilization)))
+        forecasts.append(BookDemandForecast(
+            book_id=book_id,
+            total_copies=total_copies,
+            loans=loans[i],
+            utilization=round(loan_days[i] / (copies * window_days), 4),
+            active_holds=holds[i],
+            hold_pressure=round(holds[i] / copies, 4),
+            average_loan_days=round(average_loan_days, 2),
+            forecast_loans=round(forecast_loans, 2),
+            suggested_copies=suggested,
+            copy_delta=suggested - total_copies,
+            window_days=window_days,
+            horizon_days=horizon_days,
+            computed_at=now,
+        ))
+    return forecasts
+
+
+def build_acquisition_report(batch_size=1000, **options):
+    """Replace the stored report; returns the number of books in it"""
+    forecasts = compute_forecasts(**options)
+    # One transaction, so the API never serves half a report
+    with transaction.atomic():
+        BookDemandForecast.objects.all().delete()
+        BookDemandForecast.objects.bulk_create(forecasts, batch_size=batch_size)
+    bump_generation(BookDemandForecast._meta.label)
+    return len(forecasts)
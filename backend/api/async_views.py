@@ -0,0 +1,256 @@
+"""
+Async implementations of the read-heavy endpoints, mounted under /api/async/
+
+Responses match their DRF counterparts, but a slow query waits on the event
+loop instead of holding a worker when the project runs under ASGI
+(``library_backend.asgi``). DRF 3 views are sync-only, so these are plain
+Django views that reuse the viewsets' authentication, filtering and
+serializers, and fetch rows with the async ORM.
+
+Independent aggregates are awaited together with ``asyncio.gather``. The
+async ORM runs every query of a request on the same thread, one after the
+other, so ``gather_queries`` gives each aggregate its own worker thread
+(and connection) to actually overlap them. The request's execute wrappers
+(metrics, slow-query log, profiling) are installed on those connections
+too, so the gathered queries count towards the request like any other.
+"""
+import asyncio
+from contextlib import ExitStack
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connections
+from django.db.models import Sum
+from django.http import JsonResponse
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from catalog.models import Book
+from library_backend.routers import primary_reads
+from transactions.models import Transaction, TransactionHistory
+from .authentication import CachedJWTAuthentication
+from .cache import response_cache_key
+from .permissions import is_staff_request
+from .serializers import BookListSerializer, TransactionSerializer, UserProfileSerializer, member_loan_totals
+from .throttling import check_throttle
+from .views import BookViewSet, TransactionViewSet
+
+
+def json_response(data, status=200):
+    """JsonResponse encoded the way DRF's JSONRenderer encodes (decimals as numbers, etc.)"""
+    return JsonResponse(data, status=status, encoder=JSONEncoder, safe=False)
+
+
+def _request_execute_wrappers():
+    """``{alias: execute wrappers}`` of the connections the request's middleware wrapped"""
+    return {connection.alias: list(connection.execute_wrappers) for connection in connections.all()}
+
+
+def _on_own_connection(func, wrappers):
+    def run():
+        close_old_connections()
+        try:
+            with ExitStack() as stack:
+                for alias, alias_wrappers in wrappers.items():
+                    for wrapper in alias_wrappers:
+                        stack.enter_context(connections[alias].execute_wrapper(wrapper))
+                return func()
+        finally:
+            close_old_connections()
+    return run
+
+
+async def gather_queries(*funcs):
+    """Run independent ORM callables concurrently and return their results in order"""
+    # Read on the request's sync thread, where the middleware installed them
+    wrappers = await sync_to_async(_request_execute_wrappers)()
+    return await asyncio.gather(*(
+        sync_to_async(_on_own_connection(func, wrappers), thread_sensitive=False)()
+        for func in funcs
+    ))
+
+
+def async_api_view(staff_only=False, throttle_scope=None):
+    """
+    Authenticate and throttle a GET request like the DRF views do and pass the
+    view a DRF ``Request``. API exceptions raised by the view become JSON
+    error responses.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return json_response({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+            
+            authenticator = CachedJWTAuthentication()
+            drf_request = Request(request, authenticators=[authenticator])
+            try:
+                # Accessing .user runs authentication, which may read the user row
+                user = await sync_to_async(lambda: drf_request.user)()
+                if not user.is_authenticated:
+                    raise exceptions.NotAuthenticated()
+                if staff_only and not is_staff_request(drf_request):
+                    raise exceptions.PermissionDenied()
+                wait = check_throttle(drf_request, throttle_scope)
+                if wait is not None:
+                    raise exceptions.Throttled(wait)
+                return await view(drf_request, *args, **kwargs)
+            except exceptions.APIException as exc:
+                data = exc.detail if isinstance(exc.detail, (dict, list)) else {'detail': exc.detail}
+                response = json_response(data, status=exc.status_code)
+                if getattr(exc, 'wait', None):
+                    response['Retry-After'] = '%d' % exc.wait
+                if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+                    response.status_code = 401
+                    response['WWW-Authenticate'] = authenticator.authenticate_header(drf_request)
+                return response
+        return wrapper
+    return decorator
+
+
+def viewset(viewset_class, basename, request, action):
+    """A viewset instance set up as the router would, for its queryset and filters"""
+    return viewset_class(
+        request=request, basename=basename, action=action,
+        format_kwarg=None, args=(), kwargs={},
+    )
+
+
+async def cached_data(view, request, dependencies, compute):
+    """
+    Serve ``await compute()`` through the response cache, under the same key
+    the sync endpoint uses (see ``api.cache.cache_response``).
+    """
+    key = await sync_to_async(response_cache_key)(view, request, {}, dependencies)
+    data = await cache.aget(key)
+    if data is None:
+        with primary_reads():
+            data = await compute()
+        await cache.aset(key, data, settings.RESPONSE_CACHE_TIMEOUT)
+    return data
+
+
+async def paginate(request, queryset, serializer_class):
+    """Same response shape as DRF's PageNumberPagination, queried with the async ORM"""
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    try:
+        page = int(request.query_params.get('page', 1))
+    except ValueError:
+        raise exceptions.NotFound("Invalid page.")
+    if page < 1:
+        raise exceptions.NotFound("Invalid page.")
+    
+    offset = (page - 1) * page_size
+    count = await queryset.acount()
+    rows = [row async for row in queryset[offset:offset + page_size]]
+    if not rows and page != 1:
+        raise exceptions.NotFound("Invalid page.")
+    
+    url = request.build_absolute_uri()
+    next_url = replace_query_param(url, 'page', page + 1) if offset + page_size < count else None
+    if page == 1:
+        previous_url = None
+    elif page == 2:
+        previous_url = remove_query_param(url, 'page')
+    else:
+        previous_url = replace_query_param(url, 'page', page - 1)
+    
+    serializer = serializer_class(rows, many=True, context={'request': request})
+    return {'count': count, 'next': next_url, 'previous': previous_url, 'results': serializer.data}
+
+
+@async_api_view()
+async def book_list(request):
+    """Book list with the same filters, search and ordering as /api/books/"""
+    view = viewset(BookViewSet, 'book', request, 'list')
+    
+    async def compute():
+        # Filter validation may look up a category, so it runs off the event loop
+        queryset = await sync_to_async(view.filter_queryset)(view.get_queryset())
+        return await paginate(request, queryset, BookListSerializer)
+    
+    return json_response(await cached_data(view, request, ('catalog.Book', 'catalog.Category'), compute))
+
+
+@async_api_view(throttle_scope='statistics')
+async def book_statistics(request):
+    """Book statistics with every aggregate running concurrently"""
+    view = viewset(BookViewSet, 'book', request, 'statistics')
+    
+    async def compute():
+        total_books, available_books, issued_books, copies = await gather_queries(
+            Book.objects.count,
+            Book.objects.filter(status='available', available_copies__gt=0).count,
+            Transaction.objects.filter(return_date__isnull=True).count,
+            lambda: Book.objects.aggregate(total=Sum('total_copies'), available=Sum('available_copies')),
+        )
+        return {
+            'total_books': total_books,
+            'available_books': available_books,
+            'issued_books': issued_books,
+            'total_copies': copies['total'] or 0,
+            'available_copies': copies['available'] or 0,
+        }
+    
+    data = await cached_data(view, request, ('catalog.Book', 'transactions.Transaction'), compute)
+    return json_response(data)
+
+
+@async_api_view()
+async def transactions_active(request):
+    """Open loans; members only see their own"""
+    view = viewset(TransactionViewSet, 'transaction', request, 'active')
+    queryset = view.get_queryset().filter(return_date__isnull=True)
+    return json_response(await paginate(request, queryset, TransactionSerializer))
+
+
+@async_api_view()
+async def transactions_overdue(request):
+    """Open loans past their due date; members only see their own"""
+    view = viewset(TransactionViewSet, 'transaction', request, 'overdue')
+    queryset = view.get_queryset().filter(return_date__isnull=True, due_date__lt=timezone.now().date())
+    return json_response(await paginate(request, queryset, TransactionSerializer))
+
+
+@async_api_view(staff_only=True, throttle_scope='statistics')
+async def transaction_statistics(request):
+    """Transaction statistics with every aggregate running concurrently"""
+    view = viewset(TransactionViewSet, 'transaction', request, 'statistics')
+    
+    async def compute():
+        live, archived, active, overdue, fines = await gather_queries(
+            Transaction.objects.count,
+            TransactionHistory.objects.count,
+            Transaction.objects.filter(return_date__isnull=True).count,
+            Transaction.objects.filter(return_date__isnull=True, due_date__lt=timezone.now().date()).count,
+            lambda: Transaction.objects.filter(fine_paid=False).aggregate(total=Sum('fine_amount')),
+        )
+        return {
+            'total_transactions': live + archived,
+            'active_transactions': active,
+            'overdue_transactions': overdue,
+            'total_unpaid_fines': float(fines['total'] or 0),
+        }
+    
+    data = await cached_data(view, request, ('transactions.Transaction', 'transactions.TransactionHistory'), compute)
+    return json_response(data)
+
+
+class PrecomputedUserProfileSerializer(UserProfileSerializer):
+    """UserProfileSerializer reading its statistics from ``context['stats']``"""
+    
+    def loan_totals(self, obj):
+        return self.context['stats']
+
+
+@async_api_view()
+async def me(request):
+    """Current user profile with its live and archived loan totals, off the event loop"""
+    user = request.user
+    stats, = await gather_queries(lambda: member_loan_totals(user))
+    return json_response(PrecomputedUserProfileSerializer(user, context={'stats': stats}).data)
@@ -0,0 +1,142 @@
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.utils.crypto import constant_time_compare
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+
+from library_backend.routers import primary_reads
+
+TOKEN_VERSION_CLAIM = 'ver'
+
+# request.auth of a scraper authenticated by MetricsTokenAuthentication
+METRICS_SCRAPER = 'metrics-scraper'
+
+# Claims copied onto every token so permission checks don't need the user row
+ROLE_CLAIMS = ('is_staff', 'user_type', 'status')
+
+
+def user_cache_key(user_id, version):
+    return f'auth:user:{user_id}:v{version}'
+
+
+def invalidate_cached_user(user):
+    """Drop cached copies of ``user`` for its current and previous token version"""
+    keys = [user_cache_key(user.pk, user.token_version)]
+    if user.token_version:
+        keys.append(user_cache_key(user.pk, user.token_version - 1))
+    cache.delete_many(keys)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves the user from a short-TTL cache
+    keyed by user id and token version instead of querying on every request.
+    """
+    
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+        
+        version = validated_token.get(TOKEN_VERSION_CLAIM, 0)
+        key = user_cache_key(user_id, version)
+        user = cache.get(key)
+        if user is None:
+            # Cached for every worker, so read it where revocations land first
+            with primary_reads():
+                user = super().get_user(validated_token)
+            if user.token_version != version:
+                raise AuthenticationFailed("Token has been revoked", code='token_revoked')
+            cache.set(key, user, settings.AUTH_USER_CACHE_TTL)
+        return user
+
+
+class LibraryTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Adds the token version and role claims to issued tokens"""
+    
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token[TOKEN_VERSION_CLAIM] = user.token_version
+        for claim in ROLE_CLAIMS:
+            token[claim] = getattr(user, claim)
+        return token
+
+
+class LibraryTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refuses to refresh tokens revoked by a token version bump"""
+    
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        refresh = self.token_class(attrs['refresh'])
+        current = (
+            get_user_model().objects
+            .filter(**{api_settings.USER_ID_FIELD: refresh.get(api_settings.USER_ID_CLAIM)})
+            .values_list('token_version', flat=True)
+            .first()
+        )
+        if current != refresh.get(TOKEN_VERSION_CLAIM, 0):
+            raise AuthenticationFailed("Token has been revoked", code='token_revoked')
+        return data
+
+
+class StreamTicketAuthentication(BaseAuthentication):
+    """
+    ``?ticket=`` from ``issue_stream_ticket``, for EventSource, which cannot
+    send headers. Unlike an access token in the URL, a ticket is only
+    accepted here and expires after ``EVENT_STREAM_TICKET_TTL`` seconds, so
+    a copy left in an access log is of little use.
+    """
+    
+    def authenticate(self, request):
+        ticket = request.query_params.get('ticket')
+        if not ticket:
+            return None
+        try:
+            value = stream_ticket_signer().unsign(ticket, max_age=settings.EVENT_STREAM_TICKET_TTL)
+            user_id, version = (int(part) for part in value.split(':'))
+        except (signing.BadSignature, ValueError):
+            raise AuthenticationFailed("Invalid or expired stream ticket", code='invalid_ticket')
+        user = get_user_model().objects.filter(pk=user_id, is_active=True).first()
+        if user is None or user.token_version != version:
+            raise AuthenticationFailed("Invalid or expired stream ticket", code='invalid_ticket')
+        return user, None
+    
+    def authenticate_header(self, request):
+        return 'Bearer realm="api"'
+
+
+def stream_ticket_signer():
+    return signing.TimestampSigner(salt='api.event-stream')
+
+
+def issue_stream_ticket(user):
+    """A signed ``user id:token version`` accepted by StreamTicketAuthentication"""
+    return stream_ticket_signer().sign(f'{user.pk}:{user.token_version}')
+
+
+class MetricsTokenAuthentication(BaseAuthentication):
+    """
+    ``Authorization: Bearer <METRICS_TOKEN>`` for Prometheus scrapers. A match
+    authenticates an anonymous user with ``request.auth == METRICS_SCRAPER``;
+    other bearer tokens are left to the JWT authentication that follows.
+    """
+    
+    def authenticate(self, request):
+        token = settings.METRICS_TOKEN
+        header = get_authorization_header(request).split()
+        if not token or len(header) != 2 or header[0].lower() != b'bearer':
+            return None
+        if not constant_time_compare(header[1], token.encode()):
+            return None
+        return AnonymousUser(), METRICS_SCRAPER
+    
+    def authenticate_header(self, request):
+        return 'Bearer realm="api"'
@@ -0,0 +1,57 @@
+"""
+Set-based updates of many books at once (POST /api/books/bulk_update/)
+
+Relocating a shelf, sending a batch to maintenance or recategorising a
+series used to take one PATCH per book, each with its own validation, save()
+and signal handlers. Here the patch is validated once by the view, then the
+matching books are walked in primary-key order, one chunk at a time: one
+SELECT of the chunk's keys and availability, one UPDATE ... WHERE id IN
+(...). Walking by key rather than re-running the filter means books the
+patch moves out of the filter (say, ``status=available`` patched to
+``maintenance``) are neither skipped nor visited twice.
+
+update() bypasses Book.save() and post_save. Book.save only normalizes ISBNs
+and clamps the copy counters, and neither is a patchable field. The
+post_save hooks run in batch instead, through the ``books_updated`` signal
+sent for each chunk (see api/signals.py).
+"""
+from django.utils import timezone
+
+from catalog.models import Book
+from catalog.signals import books_updated
+
+CHUNK_SIZE = 1000
+
+
+def bulk_update_books(queryset, changes, chunk_size=None):
+    """
+    Set ``changes`` (validated ``{field: value}``) on every book in
+    ``queryset``. Returns ``(books updated, books whose status changed)``.
+    """
+    chunk_size = chunk_size or CHUNK_SIZE
+    now = timezone.now()
+    fields = sorted(changes)
+    updated = status_changed = 0
+    last = 0
+    while True:
+        rows = list(
+            queryset.filter(pk__gt=last).order_by('pk')
+            .values_list('pk', *Book.AVAILABILITY_FIELDS)[:chunk_size]
+        )
+        if not rows:
+            break
+        book_ids = [row[0] for row in rows]
+        last = book_ids[-1]
+        updated += Book.objects.filter(pk__in=book_ids).update(**changes, updated_at=now)
+        
+        availability = {}
+        if 'status' in changes:
+            for book_id, *values in rows:
+                state = dict(zip(Book.AVAILABILITY_FIELDS, values))
+                if state['status'] != changes['status']:
+                    availability[book_id] = {**state, 'status': changes['status']}
+            status_changed += len(availability)
+        books_updated.send(sender=Book, book_ids=book_ids, fields=fields, availability=availability)
+        if len(rows) < chunk_size:
+            break
+    return updated, status_changed
@@ -0,0 +1,109 @@
+"""
+Response caching for read-mostly endpoints
+
+Cached responses are keyed on the view action, URL kwargs, the normalized
+query string, the caller's role and a generation counter for every model the
+response depends on. Saving or deleting one of those models bumps its
+generation (see ``api/signals.py``), so stale entries are never read again
+and simply age out of the cache. Misses are computed from the primary even on
+replica-routed requests, so a lagging replica can't store pre-write data
+under a post-write generation.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+from library_backend.routers import primary_reads
+from .permissions import is_staff_request, token_claim
+
+
+def generation_key(label):
+    return f'gen:{label}'
+
+
+def get_generations(labels):
+    """Current generation of each model label, initialising missing counters"""
+    keys = [generation_key(label) for label in labels]
+    found = cache.get_many(keys)
+    generations = []
+    for key in keys:
+        if key not in found:
+            # Seed from the clock so an evicted counter never repeats an old value
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+        generations.append(found[key])
+    return generations
+
+
+def bump_generation(label):
+    """Invalidate every cached response that depends on ``label``"""
+    key = generation_key(label)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def request_role(request):
+    if is_staff_request(request):
+        return 'staff'
+    user = request.user
+    if not (user and user.is_authenticated):
+        return 'anonymous'
+    return token_claim(request, 'user_type', user.user_type)
+
+
+def normalized_query(request):
+    """Query string with keys sorted and empty values dropped"""
+    items = sorted(
+        (key, value)
+        for key, values in request.query_params.lists()
+        for value in values if value != ''
+    )
+    return '&'.join(f'{key}={value}' for key, value in items)
+
+
+def response_cache_key(view, request, kwargs, dependencies):
+    parts = [
+        request.get_host(),
+        view.basename,
+        view.action,
+        repr(sorted(kwargs.items())),
+        request_role(request),
+        normalized_query(request),
+        ','.join(str(gen) for gen in get_generations(dependencies)),
+    ]
+    digest = hashlib.md5('|'.join(parts).encode()).hexdigest()
+    return f'resp:{view.basename}:{view.action}:{digest}'
+
+
+def cache_response(*dependencies, timeout=None):
+    """
+    Cache successful GET responses of a viewset method.
+    
+    ``dependencies`` are model labels (``'catalog.Book'``) whose changes
+    must invalidate the response.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            if request.method != 'GET':
+                return method(self, request, *args, **kwargs)
+            
+            key = response_cache_key(self, request, kwargs, dependencies)
+            data = cache.get(key)
+            if data is not None:
+                return Response(data)
+            
+            with primary_reads():
+                response = method(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                ttl = timeout if timeout is not None else settings.RESPONSE_CACHE_TIMEOUT
+                cache.set(key, response.data, ttl)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,33 @@
+"""
+System checks for settings the API depends on
+
+Token revocation (api/authentication.py), response-cache invalidation
+(api/cache.py) and replica stickiness (library_backend/routers.py) all keep
+their state in the default cache. With a per-process cache, a change made
+in one worker process is invisible to the others: a revoked token keeps
+working, a stale list keeps being served and a user who just wrote may
+read from a replica. ``CACHE_REQUIRE_SHARED`` (on unless DEBUG) turns a
+per-process cache into a ``check`` error.
+"""
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+PER_PROCESS_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES['default']['BACKEND']
+    if not settings.CACHE_REQUIRE_SHARED or backend not in PER_PROCESS_CACHE_BACKENDS:
+        return []
+    return [Error(
+        f"The default cache ({backend}) is not shared between worker processes, so token "
+        f"revocation, response-cache invalidation and replica stickiness only apply in the "
+        f"process that made the change.",
+        hint="Set CACHE_BACKEND to file (one host), redis or memcached, or set "
+             "CACHE_REQUIRE_SHARED=False if the API runs in a single process.",
+        id='api.E001',
+    )]
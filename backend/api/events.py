@@ -0,0 +1,135 @@
+"""
+In-process fan-out of circulation events to server-sent-event streams
+
+Model save paths publish events (see ``api/signals.py``) once their database
+transaction commits; every open ``/api/stream/`` connection in this process
+receives them through its own bounded buffer. A client that falls behind
+loses its oldest events and is told how many it missed, so it can refetch
+instead of holding memory for a stalled connection.
+
+Events only reach streams served by the same process. Deployments with
+several worker processes should pin stream connections to one of them.
+"""
+import asyncio
+import itertools
+import json
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+DEFAULT_BUFFER_SIZE = 100
+DEFAULT_HISTORY_SIZE = 500
+
+
+class Subscription:
+    """One stream's buffer; ``put`` may be called from any thread"""
+    
+    def __init__(self, buffer_size, loop=None):
+        self.buffer_size = buffer_size
+        self.events = deque()
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._loop = loop
+        self._ready = asyncio.Event() if loop is not None else threading.Event()
+    
+    def put(self, event):
+        with self._lock:
+            if len(self.events) >= self.buffer_size:
+                self.events.popleft()
+                self.dropped += 1
+            self.events.append(event)
+        if self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._ready.set)
+            except RuntimeError:
+                pass  # loop already closed; the stream is going away
+        else:
+            self._ready.set()
+    
+    def drain(self):
+        """Return ``(events, dropped)`` buffered since the last call"""
+        with self._lock:
+            events, dropped = list(self.events), self.dropped
+            self.events.clear()
+            self.dropped = 0
+            self._ready.clear()
+        return events, dropped
+    
+    def wait(self, timeout):
+        """Block until an event arrives or ``timeout`` seconds pass (sync streams)"""
+        return self._ready.wait(timeout)
+    
+    async def wait_async(self, timeout):
+        """Await an event or ``timeout`` seconds (async streams)"""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class EventBroker:
+    """Publishes events to every subscription and keeps a short replay history"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+        self._ids = itertools.count(1)
+        self._history = deque(maxlen=getattr(settings, 'EVENT_STREAM_HISTORY', DEFAULT_HISTORY_SIZE))
+    
+    def subscribe(self, last_event_id=None, loop=None):
+        """
+        Register a stream. With ``last_event_id`` (a reconnecting EventSource),
+        events published after it that are still in the history are replayed.
+        """
+        subscription = Subscription(
+            getattr(settings, 'EVENT_STREAM_BUFFER', DEFAULT_BUFFER_SIZE), loop=loop
+        )
+        with self._lock:
+            if last_event_id is not None:
+                for event in self._history:
+                    if event['id'] > last_event_id:
+                        subscription.put(event)
+            self._subscriptions.add(subscription)
+        return subscription
+    
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+    
+    def publish(self, event_type, data):
+        with self._lock:
+            event = {'id': next(self._ids), 'event': event_type, 'data': data}
+            self._history.append(event)
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            subscription.put(event)
+        return event
+    
+    @property
+    def subscriber_count(self):
+        return len(self._subscriptions)
+
+
+broker = EventBroker()
+
+
+def publish_on_commit(event_type, data):
+    """Publish once the surrounding transaction commits (immediately in autocommit)"""
+    transaction.on_commit(lambda: broker.publish(event_type, data))
+
+
+def format_event(event):
+    """Encode an event as a server-sent-events message"""
+    payload = json.dumps(event['data'], cls=DjangoJSONEncoder, separators=(',', ':'))
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {payload}\n\n"
+
+
+def format_dropped(count):
+    return f"event: stream.lagged\ndata: {json.dumps({'dropped': count})}\n\n"
+
+
+KEEPALIVE = ': keepalive\n\n'
@@ -1,6 +1,8 @@
 from django_filters import rest_framework as filters
-from catalog.models import Book, Category
-from transactions.models import Transaction, Reservation
+from django.db.models import Q
+from catalog.isbn import InvalidISBN, clean_isbn, normalize_isbn
+from catalog.models import Book, BookDemandForecast, Category
+from transactions.models import CirculationEvent, Transaction, Reservation
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -10,10 +12,12 @@ class BookFilter(filters.FilterSet):
     """Filter for Book model"""
     title = filters.CharFilter(lookup_expr='icontains')
     author = filters.CharFilter(lookup_expr='icontains')
-    isbn = filters.CharFilter(lookup_expr='exact')
+    isbn = filters.CharFilter(method='filter_isbn')
     category = filters.ModelChoiceFilter(queryset=Category.objects.all())
     status = filters.ChoiceFilter(choices=Book.STATUS_CHOICES)
     language = filters.CharFilter(lookup_expr='icontains')
+    # Shelf range: location=A1 matches A1, A1-03, A12, ...
+    location = filters.CharFilter(lookup_expr='istartswith')
     publication_year = filters.NumberFilter(field_name='publication_date__year')
     min_price = filters.NumberFilter(field_name='price', lookup_expr='gte')
     max_price = filters.NumberFilter(field_name='price', lookup_expr='lte')
@@ -27,6 +31,52 @@ class BookFilter(filters.FilterSet):
         if value:
             return queryset.filter(status='available', available_copies__gt=0)
         return queryset
+    
+    def filter_isbn(self, queryset, name, value):
+        return queryset.filter(isbn_lookup_q([value]))
+
+
+def isbn_lookup_q(codes):
+    """
+    Q object matching books by any ISBN form (hyphenated, ISBN-10 or ISBN-13).
+    Both sides are indexed columns, so this stays an index lookup.
+    """
+    isbn13s, isbn10s = set(), set()
+    for code in codes:
+        try:
+            isbn13, isbn10 = normalize_isbn(code)
+        except InvalidISBN:
+            # Fall back to an exact match for legacy values that fail the checksum
+            isbn13s.add(clean_isbn(code))
+            continue
+        isbn13s.add(isbn13)
+        if isbn10:
+            isbn10s.add(isbn10)
+    query = Q(isbn__in=isbn13s)
+    if isbn10s:
+        query |= Q(isbn_10__in=isbn10s)
+    return query
+
+
+class AcquisitionFilter(filters.FilterSet):
+    """Filter for the acquisition report"""
+    NEEDS_CHOICES = (
+        ('more', 'More copies'),
+        ('fewer', 'Fewer copies'),
+    )
+    
+    category = filters.ModelChoiceFilter(field_name='book__category', queryset=Category.objects.all())
+    needs = filters.ChoiceFilter(choices=NEEDS_CHOICES, method='filter_needs')
+    min_hold_pressure = filters.NumberFilter(field_name='hold_pressure', lookup_expr='gte')
+    
+    class Meta:
+        model = BookDemandForecast
+        fields = ['category']
+    
+    def filter_needs(self, queryset, name, value):
+        if value == 'more':
+            return queryset.filter(copy_delta__gt=0)
+        return queryset.filter(copy_delta__lt=0)
 
 
 class TransactionFilter(filters.FilterSet):
@@ -71,6 +121,25 @@ class ReservationFilter(filters.FilterSet):
         fields = ['user', 'book', 'status', 'notified']
 
 
+class CirculationEventFilter(filters.FilterSet):
+    """Filter for the circulation log; ``kind`` takes names and may repeat"""
+    KINDS = {name: kind for kind, name in CirculationEvent.KIND_CHOICES}
+    
+    kind = filters.MultipleChoiceFilter(choices=[(name, name) for name in KINDS], method='filter_kind')
+    # Plain ids: the log keeps events of deleted users and books
+    user = filters.NumberFilter(field_name='user_id')
+    book = filters.NumberFilter(field_name='book_id')
+    loan = filters.NumberFilter(field_name='loan_id')
+    hold = filters.NumberFilter(field_name='hold_id')
+    
+    class Meta:
+        model = CirculationEvent
+        fields = []
+    
+    def filter_kind(self, queryset, name, value):
+        return queryset.filter(kind__in=[self.KINDS[kind] for kind in value])
+
+
 class UserFilter(filters.FilterSet):
     """Filter for User model"""
     user_type = filters.ChoiceFilter(choices=User.USER_TYPE_CHOICES)
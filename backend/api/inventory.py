@@ -0,0 +1,197 @@
+"""
+Inventory reconciliation: bring Book.available_copies back in line with the loans
+
+``available_copies`` is kept up to date by read-modify-write in
+``Transaction.save`` and ``mark_as_returned``, and staff can edit it in the
+admin, so it drifts. The true values are:
+
+- books with copy records: the counts ``Book.refresh_inventory`` derives from
+  the copies' states
+- other books: ``total_copies`` minus the open loans (no return date),
+  floored at zero
+
+``status`` follows the count for books that are 'available' or 'issued'.
+Books under maintenance or lost keep their status.
+
+One grouped query counts the open loans per book, another counts the copies
+of tracked books, and the books are then streamed as plain tuples, never as
+model instances. ``scan_discrepancies`` does the same for one range of book
+ids at a time, so a request does bounded work on any catalogue size. Fixes are written with ``bulk_update`` in batches. The
+counters are re-read under a row lock first, so a loan made during the scan
+is not overwritten.
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Value, When
+from django.db.models.functions import Least
+from django.utils import timezone
+
+from catalog.models import Book, BookCopy
+from transactions.models import Transaction
+from .cache import bump_generation
+from .events import publish_on_commit
+
+# Only these statuses follow the copy count
+COUNTED_STATUSES = ('available', 'issued')
+
+
+def _books(queryset, book_ids=None, id_range=None):
+    """``queryset`` narrowed to ``book_ids``, or to book ids in ``(after, upto]``"""
+    if book_ids is not None:
+        queryset = queryset.filter(book_id__in=book_ids)
+    if id_range is not None:
+        queryset = queryset.filter(book_id__gt=id_range[0], book_id__lte=id_range[1])
+    return queryset
+
+
+def open_loan_counts(book_ids=None, id_range=None):
+    """``{book id: loans without a return date}``"""
+    loans = _books(Transaction.objects.filter(return_date__isnull=True), book_ids, id_range)
+    return dict(loans.values('book_id').annotate(count=Count('id')).values_list('book_id', 'count'))
+
+
+def copy_counts(book_ids=None, id_range=None):
+    """``{book id: (copies in stock, copies on the shelf)}`` for books with copy records"""
+    copies = _books(BookCopy.objects.all(), book_ids, id_range)
+    rows = copies.values('book_id').annotate(
+        total=Count('id', filter=~Q(state__in=BookCopy.OUT_OF_STOCK_STATES)),
+        available=Count('id', filter=Q(state='available')),
+    ).values_list('book_id', 'total', 'available')
+    return {book_id: (total, available) for book_id, total, available in rows}
+
+
+def expected_inventory(status, total_copies, open_loans, copies):
+    """``(status, total_copies, available_copies)`` the book should have"""
+    if copies is not None:
+        total_copies, available = copies
+    else:
+        available = max(total_copies - open_loans, 0)
+    if status in COUNTED_STATUSES:
+        status = 'available' if available > 0 else 'issued'
+    return status, total_copies, available
+
+
+BOOK_COLUMNS = ('pk', 'title', 'status', 'total_copies', 'available_copies')
+
+
+def _check(books, loans, copies):
+    """Yield a dict for every ``BOOK_COLUMNS`` row whose counters differ from the loans and copies"""
+    for book_id, title, status, total_copies, available_copies in books:
+        open_loans = loans.get(book_id, 0)
+        expected = expected_inventory(status, total_copies, open_loans, copies.get(book_id))
+        if expected != (status, total_copies, available_copies):
+            yield {
+                'book': book_id,
+                'title': title,
+                'open_loans': open_loans,
+                'status': status,
+                'expected_status': expected[0],
+                'total_copies': total_copies,
+                'expected_total_copies': expected[1],
+                'available_copies': available_copies,
+                'expected_available_copies': expected[2],
+            }
+
+
+def find_discrepancies(chunk_size=20000):
+    """Yield a dict for every book whose counters differ from the loans and copies"""
+    books = Book.objects.order_by('pk').values_list(*BOOK_COLUMNS)
+    yield from _check(books.iterator(chunk_size=chunk_size), open_loan_counts(), copy_counts())
+
+
+def scan_discrepancies(after=0, limit=1000):
+    """
+    Check the ``limit`` books following book id ``after``. Returns the
+    discrepancies among them and the id of the last book checked, to pass
+    as ``after`` next time (None once the end of the catalogue is reached).
+    """
+    books = list(Book.objects.filter(pk__gt=after).order_by('pk').values_list(*BOOK_COLUMNS)[:limit + 1])
+    more, books = len(books) > limit, books[:limit]
+    if not books:
+        return [], None
+    id_range = (after, books[-1][0])
+    found = list(_check(books, open_loan_counts(id_range=id_range), copy_counts(id_range=id_range)))
+    return found, id_range[1] if more else None
+
+
+def fix_discrepancies(book_ids):
+    """Reconcile the given books under a row lock; returns the number updated"""
+    now = timezone.now()
+    with transaction.atomic():
+        books = list(
+            Book.objects.select_for_update().filter(pk__in=book_ids)
+            .only('pk', 'status', 'total_copies', 'available_copies')
+        )
+        loans = open_loan_counts(book_ids)
+        copies = copy_counts(book_ids)
+        changed = []
+        for book in books:
+            expected = expected_inventory(book.status, book.total_copies, loans.get(book.pk, 0), copies.get(book.pk))
+            if expected != (book.status, book.total_copies, book.available_copies):
+                book.status, book.total_copies, book.available_copies = expected
+                book.updated_at = now
+                changed.append(book)
+        Book.objects.bulk_update(changed, ['status', 'total_copies', 'available_copies', 'updated_at'])
+    # bulk_update sends no post_save, so do what the signal handlers would
+    for book in changed:
+        publish_on_commit('book.availability_changed', {'book': book.pk, **book.availability_state()})
+    return len(changed)
+
+
+def restock_returned_loans(loans, now=None):
+    """
+    Put the books of just-returned ``loans`` (dicts with ``book_id`` and
+    ``copy_id``) back on the shelf, the set-based counterpart of
+    ``Transaction.mark_as_returned``. Only these books change: books lent by
+    copy are recounted from their copies; the others get one copy back per
+    loan, capped at ``total_copies``, with one UPDATE per distinct count.
+    Drift elsewhere is left to ``reconcile_inventory``. Returns the ids of
+    the books updated.
+    """
+    now = now or timezone.now()
+    by_count = defaultdict(list)
+    for book_id, count in Counter(loan['book_id'] for loan in loans if not loan['copy_id']).items():
+        by_count[count].append(book_id)
+    for count, book_ids in by_count.items():
+        Book.objects.filter(pk__in=book_ids).update(
+            available_copies=Least(F('available_copies') + count, F('total_copies')),
+            status=Case(When(status='issued', total_copies__gt=0, then=Value('available')), default=F('status')),
+            updated_at=now,
+        )
+    changed = {book_id for book_ids in by_count.values() for book_id in book_ids}
+    
+    tracked = sorted({loan['book_id'] for loan in loans if loan['copy_id']})
+    if tracked:
+        copies = copy_counts(tracked)
+        books = Book.objects.select_for_update().filter(pk__in=copies).only(
+            'pk', 'status', 'total_copies', 'available_copies'
+        )
+        recounted = []
+        for book in books:
+            expected = expected_inventory(book.status, book.total_copies, 0, copies[book.pk])
+            if expected != (book.status, book.total_copies, book.available_copies):
+                book.status, book.total_copies, book.available_copies = expected
+                book.updated_at = now
+                recounted.append(book)
+        Book.objects.bulk_update(recounted, ['status', 'total_copies', 'available_copies', 'updated_at'])
+        changed.update(book.pk for book in recounted)
+    
+    # Neither update() nor bulk_update() sends post_save
+    for book_id, *state in Book.objects.filter(pk__in=changed).values_list('pk', *Book.AVAILABILITY_FIELDS):
+        publish_on_commit('book.availability_changed', {'book': book_id, **dict(zip(Book.AVAILABILITY_FIELDS, state))})
+    return sorted(changed)
+
+
+def reconcile_inventory(fix=False, batch_size=1000, chunk_size=20000):
+    """
+    Scan every book and return the discrepancies found; with ``fix``, also
+    correct them. Returns ``(discrepancies, books updated)``.
+    """
+    discrepancies = list(find_discrepancies(chunk_size=chunk_size))
+    updated = 0
+    if fix and discrepancies:
+        for start in range(0, len(discrepancies), batch_size):
+            updated += fix_discrepancies([row['book'] for row in discrepancies[start:start + batch_size]])
+        bump_generation(Book._meta.label)
+    return discrepancies, updated
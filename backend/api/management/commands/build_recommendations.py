@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.recommendations import DEFAULT_MIN_SUPPORT, DEFAULT_NEIGHBORS, build_recommendations
+
+
+class Command(BaseCommand):
+    help = "Build the 'borrowed together' book recommendations from the loan history"
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help="Rebuild every book instead of only those affected by loans since the last build"
+        )
+        parser.add_argument(
+            '--neighbors', type=int, default=DEFAULT_NEIGHBORS,
+            help=f"Recommendations kept per book (default: {DEFAULT_NEIGHBORS})"
+        )
+        parser.add_argument(
+            '--min-support', type=int, default=DEFAULT_MIN_SUPPORT,
+            help=f"Patrons two books must share to be recommended together (default: {DEFAULT_MIN_SUPPORT})"
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+    
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        written, indexed = build_recommendations(
+            full=options['full'], k=options['neighbors'],
+            min_support=options['min_support'], batch_size=options['batch_size'],
+        )
+        if indexed is None:
+            self.stdout.write("No loans since the last build; nothing to do.")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt recommendations for {written} of {indexed} borrowed book(s) "
+            f"in {time.monotonic() - started:.1f}s."
+        ))
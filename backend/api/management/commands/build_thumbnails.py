@@ -0,0 +1,57 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from api.cache import bump_generation
+from api.thumbnails import build_derivatives
+from catalog.models import Book
+
+
+class Command(BaseCommand):
+    help = "Generate resized WebP/JPEG derivatives for book covers and profile pictures"
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help="Number of worker processes (default: CPU count)"
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help="Rebuild derivatives that already exist"
+        )
+    
+    def handle(self, *args, **options):
+        User = get_user_model()
+        names = set(
+            Book.objects.exclude(cover_image='').exclude(cover_image__isnull=True)
+            .values_list('cover_image', flat=True)
+        )
+        names.update(
+            User.objects.exclude(profile_picture='').exclude(profile_picture__isnull=True)
+            .values_list('profile_picture', flat=True)
+        )
+        if not names:
+            self.stdout.write("No images to process.")
+            return
+        
+        # Forked workers must not share the parent's database sockets
+        connections.close_all()
+        
+        worker = partial(build_derivatives, force=options['force'])
+        written = processed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            for count in pool.map(worker, sorted(names), chunksize=8):
+                processed += 1
+                written += count
+        if written:
+            # Cached lists were rendered without these derivatives' URLs
+            for model in (Book, User):
+                bump_generation(model._meta.label)
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {processed} image(s), wrote {written} derivative file(s)."
+        ))
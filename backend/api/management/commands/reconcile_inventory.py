@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.inventory import reconcile_inventory
+
+
+class Command(BaseCommand):
+    help = "Report books whose available_copies disagree with their open loans and copies, and optionally fix them"
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help="Correct the counters instead of only reporting")
+        parser.add_argument('--limit', type=int, default=50, help="Discrepancies to list (default: 50, 0 for all)")
+        parser.add_argument('--batch-size', type=int, default=1000)
+    
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        discrepancies, updated = reconcile_inventory(fix=options['fix'], batch_size=options['batch_size'])
+        if not discrepancies:
+            self.stdout.write(self.style.SUCCESS(
+                f"Every book's counters match its loans ({time.monotonic() - started:.1f}s)."
+            ))
+            return
+        
+        shown = discrepancies[:options['limit']] if options['limit'] else discrepancies
+        for row in shown:
+            self.stdout.write(
+                f"{row['book']:>8}  {row['title'][:40]:<40}  "
+                f"available {row['available_copies']} -> {row['expected_available_copies']}  "
+                f"total {row['total_copies']} -> {row['expected_total_copies']}  "
+                f"status {row['status']} -> {row['expected_status']}  ({row['open_loans']} open loan(s))"
+            )
+        if len(shown) < len(discrepancies):
+            self.stdout.write(f"... and {len(discrepancies) - len(shown)} more")
+        
+        if options['fix']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Fixed {updated} of {len(discrepancies)} book(s) in {time.monotonic() - started:.1f}s."
+            ))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f"{len(discrepancies)} book(s) out of line ({time.monotonic() - started:.1f}s); "
+                f"run with --fix to correct them."
+            ))
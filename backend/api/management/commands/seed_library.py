@@ -0,0 +1,407 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, time as dt_time, timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from api.cache import bump_generation
+from catalog.isbn import isbn13_check_digit, isbn13_to_isbn10
+from catalog.models import Book, BookCopy, Category
+from transactions.models import CirculationEvent, Reservation, Transaction
+
+PREFIX = 'seed_'
+
+CATEGORIES = (
+    'Fiction', 'Mystery', 'Science Fiction', 'Fantasy', 'Romance', 'Biography', 'History',
+    'Science', 'Mathematics', 'Computer Science', 'Engineering', 'Medicine', 'Philosophy',
+    'Psychology', 'Economics', 'Art', 'Music', 'Poetry', 'Travel', 'Children',
+)
+FIRST_NAMES = (
+    'Ada', 'Alan', 'Amara', 'Ana', 'Arjun', 'Chen', 'David', 'Elena', 'Fatima', 'Grace',
+    'Hiro', 'Ines', 'James', 'Kofi', 'Lena', 'Luca', 'Maria', 'Mei', 'Noah', 'Olga',
+    'Omar', 'Priya', 'Rosa', 'Sam', 'Sofia', 'Tomas', 'Wei', 'Yusuf', 'Zara', 'Zoe',
+)
+LAST_NAMES = (
+    'Abe', 'Brown', 'Costa', 'Dubois', 'Eriksen', 'Fischer', 'Garcia', 'Hassan', 'Ivanova',
+    'Jones', 'Kim', 'Kowalski', 'Lopez', 'Mensah', 'Nakamura', 'Novak', 'Okafor', 'Patel',
+    'Rossi', 'Schmidt', 'Silva', 'Smith', 'Tanaka', 'Nguyen', 'Wang', 'Weber', 'Zhang',
+)
+TITLE_WORDS = (
+    'Silent', 'Hidden', 'Broken', 'Golden', 'Last', 'Lost', 'Northern', 'Quiet', 'Red',
+    'Secret', 'Distant', 'Endless', 'Invisible', 'Modern', 'Practical', 'Complete',
+)
+TITLE_NOUNS = (
+    'River', 'Garden', 'Empire', 'Algorithm', 'Harbor', 'Machine', 'Mountain', 'Letters',
+    'Theory', 'City', 'Forest', 'Kingdom', 'Question', 'Mind', 'Ocean', 'Archive', 'Winter',
+)
+PUBLISHERS = (
+    'Penguin', 'HarperCollins', 'Macmillan', 'Hachette', 'Springer', 'Wiley', 'Elsevier',
+    'Oxford University Press', 'Cambridge University Press', 'MIT Press', "O'Reilly",
+)
+LANGUAGES = (('English', 85), ('Spanish', 5), ('French', 4), ('German', 3), ('Japanese', 3))
+FORMATS = (('Paperback', 60), ('Hardcover', 35), ('eBook', 5))
+
+# user_type -> (share of members, max_books_allowed)
+USER_TYPES = {'student': (70, 5), 'faculty': (10, 10), 'external': (17, 3), 'staff': (3, 10)}
+
+LOAN_DAYS = 14
+FINE_PER_DAY = Decimal('5.00')
+
+
+def weighted(pairs):
+    values, weights = zip(*pairs)
+    return values, list(accumulate(weights))
+
+
+def power_law(count, exponent):
+    """Cumulative Zipf weights over ``count`` ranks (rank 1 is the most popular)"""
+    return list(accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+def make_isbn(index):
+    first_twelve = f'9789{index:08d}'
+    return first_twelve + isbn13_check_digit(first_twelve)
+
+
+def loan_events(loans):
+    """The ISSUE and RETURN events ``Transaction.save`` would have logged for ``loans``"""
+    for loan in loans:
+        # loan.pk stays None on backends whose bulk_create returns no keys (MySQL)
+        ids = {'user_id': loan.user_id, 'book_id': loan.book_id, 'loan_id': loan.pk}
+        yield CirculationEvent(
+            kind=CirculationEvent.ISSUE, occurred_at=loan.issue_date,
+            actor_id=loan.issued_by_id, due_date=loan.due_date, **ids,
+        )
+        if loan.return_date is not None:
+            yield CirculationEvent(
+                kind=CirculationEvent.RETURN, occurred_at=loan.return_date, actor_id=loan.returned_to_id, **ids,
+            )
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep the dates set on auto_now/auto_now_add fields"""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = "Fill the database with a large synthetic library for load testing and profiling"
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help="Members to create (default: 1000)")
+        parser.add_argument('--books', type=int, default=5000, help="Titles to create (default: 5000)")
+        parser.add_argument(
+            '--loans', type=int, default=50000,
+            help="Returned loans spread over --years of history (default: 50000)"
+        )
+        parser.add_argument(
+            '--reservations', type=int, default=None,
+            help="Past (fulfilled/cancelled/expired) holds (default: a tenth of --loans)"
+        )
+        parser.add_argument('--years', type=int, default=3, help="Years of circulation history (default: 3)")
+        parser.add_argument(
+            '--popularity', type=float, default=1.1,
+            help="Zipf exponent for how borrowing concentrates on popular titles (default: 1.1)"
+        )
+        parser.add_argument('--seed', type=int, default=0, help="Random seed; the same seed and options give the same data")
+        parser.add_argument('--password', default='password', help="Password for every generated account")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows per INSERT (default: 5000)")
+    
+    def handle(self, *args, **options):
+        for name in ('users', 'books', 'years', 'batch_size'):
+            if options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be positive")
+        if options['loans'] < 0 or (options['reservations'] or 0) < 0:
+            raise CommandError("--loans and --reservations cannot be negative")
+        
+        User = get_user_model()
+        if User.objects.filter(username__startswith=PREFIX).exists():
+            raise CommandError(
+                f"Users named {PREFIX}* already exist; seed an empty database (see `manage.py flush`)"
+            )
+        
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        # Dates are relative to today, so open loans are current whenever the command runs
+        self.now = timezone.make_aware(datetime.combine(timezone.localdate(), dt_time(12)))
+        self.history_start = self.now - timedelta(days=365 * options['years'])
+        started = time.monotonic()
+        
+        # Rows are planned by index and inserted in that order; popularity
+        # ranks are shuffled so they don't follow creation order
+        types, type_weights = weighted((name, share) for name, (share, _) in USER_TYPES.items())
+        self.user_types = self.rng.choices(types, cum_weights=type_weights, k=options['users'])
+        self.book_ranks = list(range(options['books']))
+        self.rng.shuffle(self.book_ranks)
+        self.book_popularity = power_law(options['books'], options['popularity'])
+        # A minority of members does most of the borrowing
+        self.user_activity = power_law(options['users'], 0.8)
+        self.staff = [index for index, user_type in enumerate(self.user_types) if user_type == 'staff'] or [None]
+        copies, loans, holds = self.plan_circulation()
+        
+        with explicit_timestamps(User, Book, BookCopy, Transaction, Reservation):
+            categories = self.create_categories()
+            self.user_ids = self.create_users(User, options['password'])
+            self.book_ids = self.create_books(categories, copies)
+            copy_ids = self.create_copies(copies)
+            for loan in loans:
+                loan.copy_id = copy_ids[loan.copy_id]
+            # History first, so the circulation log roughly follows time
+            self.insert(Transaction, self.resolve(self.past_loans(options['loans'])))
+            self.insert(Transaction, self.resolve(loans))
+            self.insert(Reservation, self.resolve(holds))
+            reservations = options['reservations']
+            self.insert(Reservation, self.resolve(self.past_reservations(
+                options['loans'] // 10 if reservations is None else reservations
+            )))
+        
+        # bulk_create sends no signals, so cached responses are invalidated here
+        for model in (User, Category, Book, BookCopy, Transaction, Reservation):
+            bump_generation(model._meta.label)
+        
+        self.stdout.write(self.style.SUCCESS(f"Seeded the library in {time.monotonic() - started:.1f}s."))
+    
+    def insert(self, model, rows):
+        """bulk_create ``rows`` (any iterable) in batches, each in its own transaction"""
+        total = 0
+        batch = []
+        started = time.monotonic()
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                total += self.flush(model, batch)
+        total += self.flush(model, batch)
+        elapsed = time.monotonic() - started
+        self.stdout.write(f"  {model._meta.verbose_name_plural}: {total} ({total / elapsed if elapsed else 0:,.0f} rows/s)")
+        return total
+    
+    @staticmethod
+    def flush(model, batch):
+        count = len(batch)
+        if count:
+            with db_transaction.atomic():
+                model.objects.bulk_create(batch)
+                if model is Transaction:
+                    CirculationEvent.append(list(loan_events(batch)))
+            batch.clear()
+        return count
+    
+    def resolve(self, rows):
+        """Swap the planned user/book indexes on ``rows`` for primary keys"""
+        for row in rows:
+            row.user_id = self.user_ids[row.user_id]
+            row.book_id = self.book_ids[row.book_id]
+            if getattr(row, 'issued_by_id', None) is not None:
+                row.issued_by_id = self.user_ids[row.issued_by_id]
+            if getattr(row, 'returned_to_id', None) is not None:
+                row.returned_to_id = self.user_ids[row.returned_to_id]
+            yield row
+    
+    def random_moment(self, start, end):
+        return start + (end - start) * self.rng.random()
+    
+    def draws(self, count):
+        """``count`` (book, user) index pairs picked by popularity, drawn a batch at a time"""
+        users = range(len(self.user_types))
+        for start in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - start)
+            books = self.rng.choices(self.book_ranks, cum_weights=self.book_popularity, k=size)
+            readers = self.rng.choices(users, cum_weights=self.user_activity, k=size)
+            yield from zip(books, readers)
+    
+    def plan_circulation(self):
+        """
+        Give every title its copies, then lend them out: members borrow by
+        popularity, and when every copy of the title they want is out they
+        place a hold instead, so the popular titles end up with queues.
+        Returns per-book copy lists, open loans and active holds, all keyed
+        by user/book index.
+        """
+        rng = self.rng
+        book_count = len(self.book_ranks)
+        top = book_count // 50
+        copies = [None] * book_count
+        for rank, book in enumerate(self.book_ranks):
+            # Popular titles get extra copies; the rest mostly have one or two
+            count = min(12, int(rng.paretovariate(2.5)) + (rng.randint(2, 6) if rank < top else 0))
+            copies[book] = [
+                ['lost' if rng.random() < 0.01 else 'available', None] for _ in range(count)
+            ]
+        
+        loans, holds, held = [], [], set()
+        open_loans = [0] * len(self.user_types)
+        for book, user in self.draws(len(self.user_types) // 3):
+            if open_loans[user] >= USER_TYPES[self.user_types[user]][1]:
+                continue
+            shelf = next((copy for copy in copies[book] if copy[0] == 'available'), None)
+            if shelf is None:
+                if (user, book) not in held:
+                    held.add((user, book))
+                    placed = self.random_moment(self.now - timedelta(days=10), self.now)
+                    holds.append(Reservation(
+                        user_id=user, book_id=book, status='active',
+                        reservation_date=placed, expiry_date=placed + timedelta(days=7),
+                        created_at=placed, updated_at=placed,
+                    ))
+                continue
+            open_loans[user] += 1
+            issued = self.random_moment(self.now - timedelta(days=2 * LOAN_DAYS), self.now)
+            due = (issued + timedelta(days=LOAN_DAYS)).date()
+            days_late = (self.now.date() - due).days
+            loan = Transaction(
+                user_id=user, book_id=book, issue_date=issued, due_date=due,
+                status='overdue' if days_late > 0 else 'issued',
+                fine_amount=FINE_PER_DAY * max(days_late, 0), issued_by_id=rng.choice(self.staff),
+                created_at=issued, updated_at=issued,
+            )
+            shelf[0], shelf[1] = 'on_loan', loan
+            loans.append(loan)
+        return copies, loans, holds
+    
+    def create_categories(self):
+        Category.objects.bulk_create(
+            [Category(name=name, created_at=self.now, updated_at=self.now) for name in CATEGORIES],
+            ignore_conflicts=True,
+        )
+        return list(Category.objects.filter(name__in=CATEGORIES).order_by('name').values_list('pk', flat=True))
+    
+    def create_users(self, User, password):
+        rng = self.rng
+        password = make_password(password)
+        statuses, status_weights = weighted((('active', 92), ('inactive', 6), ('suspended', 2)))
+        
+        def rows():
+            for index, user_type in enumerate(self.user_types):
+                joined = self.random_moment(self.history_start - timedelta(days=365), self.now)
+                ends = None
+                if user_type == 'external':
+                    # Externals renew yearly; some have lapsed
+                    ends = (joined + timedelta(days=365 * rng.randint(1, 4))).date()
+                yield User(
+                    username=f'{PREFIX}{index:07d}', password=password,
+                    first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES),
+                    email=f'{PREFIX}{index:07d}@example.com',
+                    user_type=user_type, is_staff=user_type == 'staff',
+                    status=rng.choices(statuses, cum_weights=status_weights)[0],
+                    library_card_number=f'SEED{index:08d}',
+                    max_books_allowed=USER_TYPES[user_type][1],
+                    date_joined=joined, membership_start_date=joined.date(), membership_end_date=ends,
+                    created_at=joined, updated_at=joined,
+                )
+        
+        self.insert(User, rows())
+        # Re-read the keys (bulk_create doesn't set them on every backend), in index order
+        return list(User.objects.filter(username__startswith=PREFIX).order_by('username').values_list('pk', flat=True))
+    
+    def create_books(self, categories, copies):
+        rng = self.rng
+        languages, language_weights = weighted(LANGUAGES)
+        formats, format_weights = weighted(FORMATS)
+        
+        def rows():
+            for index, book_copies in enumerate(copies):
+                isbn = make_isbn(index)
+                published = self.random_moment(self.now - timedelta(days=365 * 60), self.now)
+                added = self.random_moment(max(self.history_start, published), self.now - timedelta(days=60))
+                # Counters as Book.refresh_inventory() would set them from the copies
+                total = sum(1 for state, _ in book_copies if state not in BookCopy.OUT_OF_STOCK_STATES)
+                available = sum(1 for state, _ in book_copies if state == 'available')
+                yield Book(
+                    title=f'The {rng.choice(TITLE_WORDS)} {rng.choice(TITLE_NOUNS)}',
+                    subtitle=f'Volume {index % 7 + 1}' if index % 5 == 0 else None,
+                    isbn=isbn, isbn_10=isbn13_to_isbn10(isbn),
+                    author=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                    publisher=rng.choice(PUBLISHERS), publication_date=published.date(),
+                    category_id=rng.choice(categories),
+                    language=rng.choices(languages, cum_weights=language_weights)[0],
+                    format=rng.choices(formats, cum_weights=format_weights)[0],
+                    pages=rng.randint(80, 900), price=Decimal(rng.randint(500, 9000)) / 100,
+                    location=f'{chr(65 + index % 26)}{index % 40 + 1}',
+                    call_number=f'SEED {index:08d}',
+                    status='available' if available else 'issued',
+                    total_copies=max(total, 1), available_copies=available,
+                    added_date=added.date(), created_at=added, updated_at=added,
+                )
+        
+        self.insert(Book, rows())
+        return list(
+            Book.objects.filter(call_number__startswith='SEED ').order_by('call_number').values_list('pk', flat=True)
+        )
+    
+    def create_copies(self, copies):
+        """Insert the planned copies; returns ``{barcode: pk}`` for the copies out on loan"""
+        
+        def rows():
+            for index, book_copies in enumerate(copies):
+                location = f'{chr(65 + index % 26)}{index % 40 + 1}'
+                for number, (state, loan) in enumerate(book_copies):
+                    barcode = f'SEED{index:08d}-{number:02d}'
+                    if loan is not None:
+                        loan.copy_id = barcode
+                    acquired = self.random_moment(self.history_start, self.now - timedelta(days=60))
+                    yield BookCopy(
+                        book_id=self.book_ids[index], barcode=barcode, location=location, state=state,
+                        acquired_date=acquired.date(), created_at=acquired, updated_at=acquired,
+                    )
+        
+        self.insert(BookCopy, rows())
+        barcodes = [loan.copy_id for book_copies in copies for _, loan in book_copies if loan is not None]
+        keys = {}
+        for start in range(0, len(barcodes), self.batch_size):
+            chunk = barcodes[start:start + self.batch_size]
+            keys.update(BookCopy.objects.filter(barcode__in=chunk).values_list('barcode', 'pk'))
+        return keys
+    
+    def past_loans(self, count):
+        """Returned loans spread over the history window"""
+        rng = self.rng
+        end = self.now - timedelta(days=2 * LOAN_DAYS)
+        for book, user in self.draws(count):
+            issued = self.random_moment(self.history_start, end)
+            due = (issued + timedelta(days=LOAN_DAYS)).date()
+            # Most come back on time; a long tail is late
+            returned = issued + timedelta(days=min(rng.expovariate(1 / 10), 120), hours=rng.random() * 8)
+            days_late = max((returned.date() - due).days, 0)
+            yield Transaction(
+                user_id=user, book_id=book, issue_date=issued, due_date=due, return_date=returned,
+                status='returned', fine_amount=FINE_PER_DAY * days_late,
+                fine_paid=days_late == 0 or rng.random() < 0.9,
+                issued_by_id=rng.choice(self.staff), returned_to_id=rng.choice(self.staff),
+                created_at=issued, updated_at=returned,
+            )
+    
+    def past_reservations(self, count):
+        """Fulfilled, cancelled and expired holds, one per (user, book, status) as the model requires"""
+        rng = self.rng
+        statuses, status_weights = weighted((('fulfilled', 60), ('cancelled', 25), ('expired', 15)))
+        end = self.now - timedelta(days=7)
+        seen = set()
+        for book, user in self.draws(count):
+            status = rng.choices(statuses, cum_weights=status_weights)[0]
+            if (user, book, status) in seen:
+                continue
+            seen.add((user, book, status))
+            placed = self.random_moment(self.history_start, end)
+            yield Reservation(
+                user_id=user, book_id=book, status=status, notified=status != 'cancelled',
+                reservation_date=placed, expiry_date=placed + timedelta(days=7),
+                created_at=placed, updated_at=placed + timedelta(days=rng.randint(0, 7)),
+            )
@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.slow_queries import read_entries, summarize
+
+SORT_KEYS = {
+    'total': lambda stats: stats['total_ms'],
+    'max': lambda stats: stats['max_ms'],
+    'count': lambda stats: stats['count'],
+}
+
+
+class Command(BaseCommand):
+    help = "Rank the statement fingerprints in the slow-query log by total, maximum or count"
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sort', choices=sorted(SORT_KEYS), default='total',
+            help="Rank by total time (default), slowest single run or number of runs"
+        )
+        parser.add_argument('--limit', type=int, default=10, help="Fingerprints to show (default: 10)")
+        parser.add_argument('--route', help="Only statements run by this URL name, e.g. book-list")
+        parser.add_argument(
+            '--log', action='append',
+            help=f"Log file(s) to read (default: {settings.SLOW_QUERY_LOG} and its rotated copy)"
+        )
+        parser.add_argument(
+            '--width', type=int, default=300,
+            help="Characters of each statement to print, 0 for all (default: 300)"
+        )
+    
+    def handle(self, *args, **options):
+        entries = read_entries(options['log'])
+        if options['route']:
+            entries = (entry for entry in entries if entry['route'] == options['route'])
+        summary = sorted(summarize(entries), key=SORT_KEYS[options['sort']], reverse=True)
+        if not summary:
+            self.stdout.write("The slow-query log is empty.")
+            return
+        
+        self.stdout.write(
+            f"{len(summary)} fingerprint(s), {sum(stats['count'] for stats in summary)} statement(s) logged\n"
+        )
+        for rank, stats in enumerate(summary[:options['limit']], 1):
+            statement = stats['statement']
+            if options['width'] and len(statement) > options['width']:
+                statement = statement[:options['width']] + '...'
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{rank}. {stats['fingerprint']}  count {stats['count']}  total {stats['total_ms']:.1f}ms  "
+                f"max {stats['max_ms']:.1f}ms  avg {stats['total_ms'] / stats['count']:.1f}ms"
+            ))
+            self.stdout.write(f"   {statement}")
+            sources = sorted(stats['sources'].items(), key=lambda item: item[1], reverse=True)
+            for (action, origin), count in sources[:5]:
+                self.stdout.write(f"   {count:>6} x {action} at {origin}")
+            self.stdout.write('')
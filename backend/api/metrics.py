@@ -0,0 +1,155 @@
+"""
+In-process request metrics, exposed in Prometheus text format at /api/metrics/
+
+``MetricsMiddleware`` (api/middleware.py) records every request under its
+URL name (``book-list``, ``transaction-statistics``, ...) and HTTP method,
+which together identify the viewset action. Values live in this process
+only; under several worker processes each one reports its own counters.
+"""
+import threading
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in (*zip(names, values), *extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+    
+    def value(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+    
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        for labelvalues, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_number(value)}')
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labelvalues -> [per-bucket counts (+Inf last), sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, *labelvalues, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labelvalues)
+            if state is None:
+                state = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+    
+    def count(self, *labelvalues):
+        state = self._values.get(labelvalues)
+        return state[2] if state else 0
+    
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((labels, ([*state[0]], state[1], state[2])) for labels, state in self._values.items())
+        for labelvalues, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, '+Inf'), bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, labelvalues, [('le', _format_number(bound))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f'{self.name}_sum{labels} {_format_number(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._metrics = []
+    
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+    
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+    
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+    
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+ROUTE_LABELS = ('route', 'method')
+
+http_requests = registry.counter(
+    'library_http_requests_total', 'HTTP requests by route, method and status code.',
+    ROUTE_LABELS + ('status',),
+)
+http_request_duration = registry.histogram(
+    'library_http_request_duration_seconds', 'Time spent handling a request.',
+    ROUTE_LABELS, LATENCY_BUCKETS,
+)
+http_response_size = registry.histogram(
+    'library_http_response_size_bytes', 'Response body size (streaming responses excluded).',
+    ROUTE_LABELS, SIZE_BUCKETS,
+)
+db_queries = registry.histogram(
+    'library_db_queries_per_request', 'Database queries run while handling a request.',
+    ROUTE_LABELS, QUERY_COUNT_BUCKETS,
+)
+db_query_duration = registry.counter(
+    'library_db_query_seconds_total', 'Time spent in database queries.',
+    ROUTE_LABELS,
+)
+query_budget_exceeded = registry.counter(
+    'library_query_budget_exceeded_total', 'Requests that ran more queries than their budget.',
+    ROUTE_LABELS,
+)
+db_slow_queries = registry.counter(
+    'library_db_slow_queries_total', 'Statements that reached SLOW_QUERY_THRESHOLD_MS (see api/slow_queries.py).',
+    ROUTE_LABELS,
+)
+throttled_requests = registry.counter(
+    'library_throttled_requests_total', 'Requests rejected by a throttle (see api/throttling.py).',
+    ('scope', 'role'),
+)
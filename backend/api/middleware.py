@@ -0,0 +1,284 @@
+import itertools
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+from types import SimpleNamespace
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import JsonResponse
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import SAFE_METHODS
+
+from library_backend.routers import allow_replica_reads, begin_request, end_request, pin_to_primary
+from . import metrics, profiling
+from .slow_queries import SlowQueryRecorder
+from .authentication import CachedJWTAuthentication
+from .permissions import is_staff_request
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def wrapped_connections(wrapper):
+    """Install the execute wrapper on every database connection of this thread"""
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(wrapper))
+        yield
+
+
+@asynccontextmanager
+async def async_wrapped_connections(wrapper):
+    """
+    ``wrapped_connections`` for async middleware. Connections belong to a
+    thread, so the wrapper goes on those of the request's sync thread, where
+    the async ORM runs its queries and gather_queries finds the wrappers.
+    """
+    stack = ExitStack()
+    await sync_to_async(stack.enter_context)(wrapped_connections(wrapper))
+    try:
+        yield
+    finally:
+        await sync_to_async(stack.close)()
+
+
+class AsyncCapableMiddleware:
+    """
+    Base for middleware running natively in both the WSGI and the ASGI chain,
+    so async views (api/async_views.py) aren't adapted through a thread.
+    Subclasses implement ``__call__`` for sync requests and ``acall`` for
+    async ones; Django picks the mode from the handler it is given.
+    """
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.acall(request)
+        return self.call(request)
+
+
+class ReplicaRoutingMiddleware(AsyncCapableMiddleware):
+    """
+    Lets safe-method requests on replica-friendly routes read from a replica,
+    and pins a user's reads to the primary for a short while after they write.
+    """
+    
+    def call(self, request):
+        token = begin_request(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            end_request(token)
+        self.pin_writer(request, response)
+        return response
+    
+    async def acall(self, request):
+        token = begin_request(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            end_request(token)
+        if request.method not in SAFE_METHODS:
+            await sync_to_async(self.pin_writer)(request, response)
+        return response
+    
+    def pin_writer(self, request, response):
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                pin_to_primary(user.pk)
+    
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.DATABASE_REPLICAS or request.method not in SAFE_METHODS:
+            return None
+        match = request.resolver_match
+        if match is not None and match.url_name in settings.REPLICA_READ_URL_NAMES:
+            allow_replica_reads(request)
+        return None
+
+
+class QueryTracker:
+    """
+    Database execute wrapper counting and timing the queries of one request.
+    Async views may run queries on several threads at once (gather_queries).
+    """
+    
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+        self.lock = threading.Lock()
+    
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            with self.lock:
+                self.duration += duration
+                self.count += 1
+                self.statements[sql] += 1
+
+
+class MetricsMiddleware(AsyncCapableMiddleware):
+    """
+    Records latency, query count, query time and response size per route and
+    method (see api/metrics.py), and logs requests that exceed their query
+    budget with the statement they repeated most, the usual N+1 signature.
+    """
+    
+    def call(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        
+        tracker = QueryTracker()
+        start = time.perf_counter()
+        with wrapped_connections(tracker):
+            response = self.get_response(request)
+        self.record(request, response, tracker, time.perf_counter() - start)
+        return response
+    
+    async def acall(self, request):
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+        
+        tracker = QueryTracker()
+        start = time.perf_counter()
+        async with async_wrapped_connections(tracker):
+            response = await self.get_response(request)
+        self.record(request, response, tracker, time.perf_counter() - start)
+        return response
+    
+    def record(self, request, response, tracker, duration):
+        match = getattr(request, 'resolver_match', None)
+        # Unresolved paths share one label so 404 probes can't blow up cardinality
+        labels = (match.view_name if match else 'unmatched', request.method)
+        metrics.http_requests.inc(*labels, str(response.status_code))
+        metrics.http_request_duration.observe(*labels, value=duration)
+        metrics.db_queries.observe(*labels, value=tracker.count)
+        metrics.db_query_duration.inc(*labels, amount=tracker.duration)
+        if not response.streaming:
+            metrics.http_response_size.observe(*labels, value=len(response.content))
+        
+        budget = settings.METRICS_QUERY_BUDGETS.get(labels[0], settings.METRICS_QUERY_BUDGET)
+        if tracker.count > budget:
+            metrics.query_budget_exceeded.inc(*labels)
+            statement, repeats = tracker.statements.most_common(1)[0]
+            logger.warning(
+                "Possible N+1: %s %s ran %d queries (budget %d); repeated %d times: %s",
+                request.method, labels[0], tracker.count, budget, repeats, statement[:300],
+            )
+
+
+class SlowQueryMiddleware(AsyncCapableMiddleware):
+    """
+    Logs the statements of a request that take SLOW_QUERY_THRESHOLD_MS or
+    longer, with their fingerprint and call site (see api/slow_queries.py)
+    """
+    
+    def call(self, request):
+        if not settings.SLOW_QUERY_LOG_ENABLED:
+            return self.get_response(request)
+        with wrapped_connections(SlowQueryRecorder(request, settings.SLOW_QUERY_THRESHOLD_MS)):
+            return self.get_response(request)
+    
+    async def acall(self, request):
+        if not settings.SLOW_QUERY_LOG_ENABLED:
+            return await self.get_response(request)
+        async with async_wrapped_connections(SlowQueryRecorder(request, settings.SLOW_QUERY_THRESHOLD_MS)):
+            return await self.get_response(request)
+
+
+class ProfilingMiddleware(AsyncCapableMiddleware):
+    """
+    Profiles staff requests that ask for it, and one in PROFILING_SAMPLE_RATE
+    requests, when PROFILING_ENABLED is on (see api/profiling.py). Under ASGI
+    cProfile sees the event loop thread, so work done in sync_to_async
+    threads shows up as time spent awaiting it.
+    """
+    
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.requests = itertools.count(1)
+    
+    def call(self, request):
+        if not settings.PROFILING_ENABLED:
+            return self.get_response(request)
+        trigger = self.trigger(request)
+        if trigger is None or not profiling.profiler_lock.acquire(blocking=False):
+            return self.get_response(request)
+        
+        try:
+            profile = profiling.RequestProfile()
+            with wrapped_connections(profile.sql), profile:
+                response = self.get_response(request)
+            report = profile.report(request, response, 'sample' if trigger == 'sample' else 'request')
+        finally:
+            profiling.profiler_lock.release()
+        return self.deliver(report, response, trigger)
+    
+    async def acall(self, request):
+        if not settings.PROFILING_ENABLED:
+            return await self.get_response(request)
+        # Only a profiling request needs its JWT checked, which may query
+        trigger = await sync_to_async(self.trigger)(request) if self.requested(request) else self.trigger(request)
+        if trigger is None or not profiling.profiler_lock.acquire(blocking=False):
+            return await self.get_response(request)
+        
+        try:
+            profile = profiling.RequestProfile()
+            async with async_wrapped_connections(profile.sql):
+                with profile:
+                    response = await self.get_response(request)
+            report = profile.report(request, response, 'sample' if trigger == 'sample' else 'request')
+        finally:
+            profiling.profiler_lock.release()
+        return await sync_to_async(self.deliver)(report, response, trigger)
+    
+    def deliver(self, report, response, trigger):
+        """Store the report; return it instead of the response for an inline profile"""
+        try:
+            profiling.store_report(report)
+        except OSError:
+            logger.exception("Could not store profile %s", report['id'])
+        if trigger == 'inline':
+            return JsonResponse(report)
+        response['X-Profile-Id'] = report['id']
+        return response
+    
+    @staticmethod
+    def requested(request):
+        return request.headers.get('X-Profile') or request.GET.get('_profile')
+    
+    def trigger(self, request):
+        """'inline' or 'request' for a staff profiling request, 'sample' when sampled, else None"""
+        requested = self.requested(request)
+        if requested and self.is_staff(request):
+            return 'inline' if requested == 'inline' else 'request'
+        rate = settings.PROFILING_SAMPLE_RATE
+        if rate and next(self.requests) % rate == 0:
+            return 'sample'
+        return None
+    
+    @staticmethod
+    def is_staff(request):
+        # Runs before DRF has authenticated the request, so check the JWT here
+        try:
+            result = CachedJWTAuthentication().authenticate(request)
+        except APIException:
+            return False
+        if result is None:
+            return False
+        request.profiled_user, token = result
+        return is_staff_request(SimpleNamespace(user=request.profiled_user, auth=token))
@@ -0,0 +1,55 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+def non_negative_int(request, name, default):
+    """Query parameter ``name`` as an int >= 0; a 400 ValidationError otherwise"""
+    value = request.query_params.get(name, default)
+    try:
+        value = int(value)
+        if value < 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        raise ValidationError({name: "Expected a non-negative integer."})
+    return value
+
+
+class SinceCursorPagination(BasePagination):
+    """
+    Keyset pagination over an ever-growing, append-only table.
+    
+    ``?since=<id>`` returns up to ``?limit=`` rows with a larger id, oldest
+    first, plus the ``next_since`` to pass on the following call. Unlike page
+    numbers, rows appended in between are never skipped or repeated, and every
+    page is an index range scan however far along the reader is.
+    
+    The ids must become visible in increasing order, as CirculationEvent ids
+    do: with a plain auto-increment id, a transaction that commits late can
+    make a smaller id appear after a reader has passed it. Reads must also
+    go to the primary, since a lagging replica shows the same gap.
+    """
+    default_limit = 500
+    max_limit = 5000
+    
+    def paginate_queryset(self, queryset, request, view=None):
+        self.since = non_negative_int(request, 'since', 0)
+        limit = min(non_negative_int(request, 'limit', self.default_limit) or self.default_limit, self.max_limit)
+        rows = list(queryset.filter(pk__gt=self.since).order_by('pk')[:limit + 1])
+        self.has_more = len(rows) > limit
+        rows = rows[:limit]
+        self.next_since = rows[-1].pk if rows else self.since
+        return rows
+    
+    def get_paginated_response(self, data):
+        return Response({'next_since': self.next_since, 'has_more': self.has_more, 'results': data})
+    
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next_since': {'type': 'integer'},
+                'has_more': {'type': 'boolean'},
+                'results': schema,
+            },
+        }
@@ -1,5 +1,29 @@
+from django.conf import settings
 from rest_framework import permissions
 
+from .authentication import METRICS_SCRAPER
+
+
+def token_claim(request, claim, default=None):
+    """
+    Read a role claim from the request's JWT, falling back to ``default``
+    for tokens issued before the claim was added.
+    """
+    token = getattr(request, 'auth', None)
+    if token is not None and hasattr(token, 'get'):
+        value = token.get(claim)
+        if value is not None:
+            return value
+    return default
+
+
+def is_staff_request(request):
+    """Whether the authenticated caller is staff, answered from the token when possible"""
+    user = request.user
+    if not (user and user.is_authenticated):
+        return False
+    return bool(token_claim(request, 'is_staff', user.is_staff))
+
 
 class IsStaffOrReadOnly(permissions.BasePermission):
     """
@@ -11,7 +35,7 @@ class IsStaffOrReadOnly(permissions.BasePermission):
             return request.user and request.user.is_authenticated
         
         # Write permissions are only allowed to staff members
-        return request.user and request.user.is_staff
+        return is_staff_request(request)
 
 
 class IsOwnerOrStaff(permissions.BasePermission):
@@ -20,7 +44,7 @@ class IsOwnerOrStaff(permissions.BasePermission):
     """
     def has_object_permission(self, request, view, obj):
         # Staff members have full access
-        if request.user.is_staff:
+        if is_staff_request(request):
             return True
         
         # Check if the object has a 'user' attribute
@@ -36,4 +60,18 @@ class IsStaffUser(permissions.BasePermission):
     Custom permission to only allow staff members.
     """
     def has_permission(self, request, view):
-        return request.user and request.user.is_staff
\ No newline at end of file
+        return is_staff_request(request)
+
+
+class IsStaffOrLocalRequest(permissions.BasePermission):
+    """
+    Allow staff, scrapers presenting ``settings.METRICS_TOKEN``, and clients
+    connecting from ``settings.METRICS_ALLOWED_IPS``. The address list is
+    empty by default: behind a proxy every request shares its address.
+    """
+    def has_permission(self, request, view):
+        return (
+            is_staff_request(request)
+            or request.auth == METRICS_SCRAPER
+            or request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+        )
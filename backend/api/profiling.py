@@ -0,0 +1,235 @@
+"""
+Request profiling for staff, on demand or by sampling
+
+With ``PROFILING_ENABLED`` on, a staff request carrying ``X-Profile: 1`` or
+``?_profile=1`` runs under cProfile with every SQL statement recorded
+(``ProfilingMiddleware`` in api/middleware.py). The report is stored and
+its id returned in the ``X-Profile-Id`` header; ``inline`` instead of ``1``
+returns the report as the response body. ``PROFILING_SAMPLE_RATE = N``
+profiles one in N requests from anyone.
+
+Reports live as JSON files in ``PROFILING_DIR``, which keeps the newest
+``PROFILING_MAX_REPORTS``; staff read them at /api/profiles/.
+"""
+import cProfile
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+TOP_FUNCTIONS = 40
+
+# phase -> functions (file suffix, name) whose time counts towards it
+PHASES = {
+    'authentication': (('rest_framework/request.py', '_authenticate'),),
+    'permissions': (
+        ('rest_framework/views.py', 'check_permissions'),
+        ('rest_framework/views.py', 'check_object_permissions'),
+    ),
+    'throttling': (('rest_framework/views.py', 'check_throttles'),),
+    'serialization': (
+        ('rest_framework/serializers.py', 'data'),
+        ('rest_framework/serializers.py', 'is_valid'),
+    ),
+    'rendering': (('rest_framework/response.py', 'rendered_content'),),
+}
+PHASE_BY_FUNCTION = {
+    (suffix, name): phase for phase, functions in PHASES.items() for suffix, name in functions
+}
+
+REPORT_ID = re.compile(r'^[0-9a-f]{12}$')
+
+# Query parameters whose values are credentials, blanked in stored reports
+REDACTED_PARAMS = {'token', 'ticket', 'access', 'refresh', 'password'}
+
+# cProfile cannot run two profilers at once on Python 3.12+, so requests
+# arriving while one is being profiled run normally
+profiler_lock = threading.Lock()
+
+
+def _code_key(filename, name):
+    filename = filename.replace(os.sep, '/')
+    for suffix, function in PHASE_BY_FUNCTION:
+        if function == name and filename.endswith(suffix):
+            return suffix, function
+    return None
+
+
+def _is_project_file(filename):
+    return (
+        filename.startswith(str(settings.BASE_DIR))
+        and 'site-packages' not in filename
+        and not filename.endswith(('api/profiling.py', 'api/middleware.py'))
+    )
+
+
+class SQLRecorder:
+    """Execute wrapper recording each statement's time, phase and origin"""
+    
+    def __init__(self):
+        self.statements = []
+    
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            phase, origin = self.locate(sys._getframe(1))
+            self.statements.append({
+                'sql': sql, 'duration_ms': round(duration * 1000, 3), 'phase': phase, 'origin': origin,
+            })
+    
+    @staticmethod
+    def locate(frame):
+        """The innermost known phase and project line on the stack"""
+        phase = origin = None
+        while frame is not None and not (phase and origin):
+            code = frame.f_code
+            if phase is None:
+                key = _code_key(code.co_filename, code.co_name)
+                if key is not None:
+                    phase = PHASE_BY_FUNCTION[key]
+            if origin is None and _is_project_file(code.co_filename):
+                path = os.path.relpath(code.co_filename, settings.BASE_DIR)
+                origin = f'{path}:{frame.f_lineno} in {code.co_name}'
+            frame = frame.f_back
+        return phase or 'view', origin
+
+
+class RequestProfile:
+    """cProfile plus SQL recording around one request"""
+    
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+        self.sql = SQLRecorder()
+        self.duration = 0.0
+    
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self.profiler.enable()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.profiler.disable()
+        self.duration = time.perf_counter() - self.started
+    
+    def report(self, request, response, trigger):
+        stats = pstats.Stats(self.profiler)
+        phases = dict.fromkeys(PHASES, 0.0)
+        # Phase functions can nest (ListSerializer.data -> Serializer.data),
+        # so each phase takes its largest cumulative time per function name
+        largest = {}
+        for (filename, _, name), (_, _, _, cumtime, _) in stats.stats.items():
+            key = _code_key(filename, name)
+            if key is not None:
+                largest[key] = max(largest.get(key, 0.0), cumtime)
+        for key, cumtime in largest.items():
+            phases[PHASE_BY_FUNCTION[key]] += cumtime
+        total_ms = self.duration * 1000
+        phases = {phase: round(seconds * 1000, 3) for phase, seconds in phases.items()}
+        phases['view'] = round(max(total_ms - sum(phases.values()), 0.0), 3)
+        
+        queries_by_phase = {}
+        for statement in self.sql.statements:
+            queries_by_phase[statement['phase']] = round(
+                queries_by_phase.get(statement['phase'], 0.0) + statement['duration_ms'], 3
+            )
+        
+        functions = []
+        stats.sort_stats('cumulative')
+        for (filename, line, name) in stats.fcn_list[:TOP_FUNCTIONS]:
+            calls, primitive, tottime, cumtime, _ = stats.stats[(filename, line, name)]
+            functions.append({
+                'function': f'{filename}:{line}({name})', 'calls': calls, 'primitive_calls': primitive,
+                'tottime_ms': round(tottime * 1000, 3), 'cumtime_ms': round(cumtime * 1000, 3),
+            })
+        
+        match = getattr(request, 'resolver_match', None)
+        user = getattr(request, 'profiled_user', None)
+        return {
+            'id': uuid.uuid4().hex[:12],
+            'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'trigger': trigger,
+            'method': request.method,
+            'path': request.path,
+            'query': redact_query(request.META.get('QUERY_STRING', '')),
+            'route': match.view_name if match else None,
+            'user': user.username if user is not None else None,
+            'status': response.status_code,
+            'duration_ms': round(total_ms, 3),
+            # Query time is also part of whichever phase ran the query
+            'phases': phases,
+            'queries': {
+                'count': len(self.sql.statements),
+                'duration_ms': round(sum(s['duration_ms'] for s in self.sql.statements), 3),
+                'by_phase': queries_by_phase,
+            },
+            'sql': self.sql.statements,
+            'functions': functions,
+        }
+
+
+def redact_query(query_string):
+    """``query_string`` with the values of REDACTED_PARAMS replaced"""
+    params = parse_qsl(query_string, keep_blank_values=True)
+    if not any(name.lower() in REDACTED_PARAMS for name, _ in params):
+        return query_string
+    return urlencode([
+        (name, 'REDACTED' if name.lower() in REDACTED_PARAMS else value) for name, value in params
+    ])
+
+
+def report_dir():
+    return Path(settings.PROFILING_DIR)
+
+
+def store_report(report):
+    """Write ``report`` and drop the oldest ones beyond PROFILING_MAX_REPORTS"""
+    directory = report_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    # Names sort by creation time, which is what rotation and listing go by
+    name = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}-{report['id']}.json"
+    temporary = directory / f'{name}.tmp'
+    temporary.write_text(json.dumps(report, cls=DjangoJSONEncoder))
+    temporary.replace(directory / name)
+    
+    stored = sorted(directory.glob('*.json'))
+    for stale in stored[:max(len(stored) - settings.PROFILING_MAX_REPORTS, 0)]:
+        stale.unlink(missing_ok=True)
+
+
+def list_reports():
+    """Summaries of the stored reports, newest first"""
+    summaries = []
+    for path in sorted(report_dir().glob('*.json'), reverse=True):
+        try:
+            report = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue  # rotated away or half-written
+        summaries.append({
+            key: report.get(key)
+            for key in ('id', 'created', 'trigger', 'method', 'path', 'route', 'user', 'status', 'duration_ms')
+        } | {'queries': report.get('queries', {}).get('count')})
+    return summaries
+
+
+def load_report(report_id):
+    if not REPORT_ID.match(report_id):
+        return None
+    for path in report_dir().glob(f'*-{report_id}.json'):
+        try:
+            return json.loads(path.read_text())
+        except (OSError, ValueError):
+            return None
+    return None
@@ -0,0 +1,176 @@
+"""
+"Patrons who borrowed this also borrowed" recommendations
+
+Two books are similar when many of their borrowers overlap, scored by the
+cosine similarity of their borrower sets::
+
+    score(a, b) = shared borrowers / sqrt(borrowers(a) * borrowers(b))
+
+Raw co-borrow counts would put the bestsellers at the top of every list;
+the cosine score does not. Loans in Transaction and TransactionHistory
+both count, and a patron who borrowed a book twice counts once.
+
+The book-by-book matrix is never stored in full. ``CoBorrowIndex`` maps books
+and patrons to dense indices and keeps each patron's basket and each book's
+borrowers as ``array('i')``. Row ``a`` of the matrix is a Counter over the
+baskets of a's borrowers, which Counter.update fills at C speed. Only the
+top ``k`` neighbours with at least ``min_support`` shared borrowers are kept,
+as one ``BookRecommendation`` row per book. /api/books/{id}/similar/ then
+reads that row and its k books.
+
+An incremental build recomputes only the rows whose scores can have changed
+since the last build: books lent since then, plus every book that shares a
+borrower with one of them. Loan ids are the watermark; an archived loan
+keeps its id as ``TransactionHistory.original_id``, so loans made and
+archived between two builds are still seen.
+"""
+import heapq
+from array import array
+from collections import Counter
+from itertools import chain, islice
+from math import sqrt
+
+from django.db import transaction
+from django.db.models import Max
+
+from catalog.models import BookRecommendation
+from transactions.models import Transaction, TransactionHistory
+from .cache import bump_generation
+
+DEFAULT_NEIGHBORS = 20
+DEFAULT_MIN_SUPPORT = 2
+
+
+class CoBorrowIndex:
+    """Patron baskets and book borrower lists over dense integer indices"""
+    
+    def __init__(self, pairs):
+        """``pairs``: iterable of ``(user id, book id)``; duplicates are ignored"""
+        self.book_ids = array('q')
+        self.book_index = {}
+        user_index = {}
+        baskets = []
+        for user_id, book_id in pairs:
+            book = self.book_index.get(book_id)
+            if book is None:
+                book = self.book_index[book_id] = len(self.book_ids)
+                self.book_ids.append(book_id)
+            user = user_index.get(user_id)
+            if user is None:
+                user = user_index[user_id] = len(baskets)
+                baskets.append(set())
+            baskets[user].add(book)
+        
+        self.baskets = [array('i', sorted(basket)) for basket in baskets]
+        borrowers = [array('i') for _ in self.book_ids]
+        for user, basket in enumerate(self.baskets):
+            for book in basket:
+                borrowers[book].append(user)
+        self.borrowers = borrowers
+    
+    @classmethod
+    def from_database(cls, chunk_size=20000):
+        """Index every (patron, book) pair in live and archived loans"""
+        return cls(chain(
+            Transaction.objects.values_list('user_id', 'book_id').distinct().iterator(chunk_size=chunk_size),
+            TransactionHistory.objects.values_list('user_id', 'book_id').distinct().iterator(chunk_size=chunk_size),
+        ))
+    
+    def __len__(self):
+        return len(self.book_ids)
+    
+    def neighbors(self, book, k=DEFAULT_NEIGHBORS, min_support=DEFAULT_MIN_SUPPORT):
+        """Top ``k`` ``(book index, score)`` pairs for the book at index ``book``"""
+        shared = Counter()
+        for user in self.borrowers[book]:
+            shared.update(self.baskets[user])
+        del shared[book]
+        
+        size = len(self.borrowers[book])
+        borrowers = self.borrowers
+        scored = (
+            (other, count / sqrt(size * len(borrowers[other])))
+            for other, count in shared.items() if count >= min_support
+        )
+        # Ties go to the lower index, so rebuilding gives identical lists
+        return heapq.nlargest(k, scored, key=lambda item: (item[1], -item[0]))
+    
+    def affected_by(self, book_ids):
+        """Indices of the given books and of every book sharing a borrower with them"""
+        affected = set()
+        for book_id in book_ids:
+            book = self.book_index.get(book_id)
+            if book is None:
+                continue
+            affected.add(book)
+            for user in self.borrowers[book]:
+                affected.update(self.baskets[user])
+        return affected
+    
+    def rows(self, books, k=DEFAULT_NEIGHBORS, min_support=DEFAULT_MIN_SUPPORT):
+        """``(book id, [[book id, score], ...])`` for each book index in ``books``"""
+        book_ids = self.book_ids
+        for book in books:
+            yield book_ids[book], [
+                [book_ids[other], round(score, 4)] for other, score in self.neighbors(book, k, min_support)
+            ]
+
+
+def last_build_watermark():
+    """Newest loan id counted by the previous build, 0 if there was none"""
+    return BookRecommendation.objects.aggregate(last=Max('last_transaction_id'))['last'] or 0
+
+
+def newest_loan_id():
+    """Newest loan id, live or archived"""
+    return max(
+        Transaction.objects.aggregate(last=Max('id'))['last'] or 0,
+        TransactionHistory.objects.aggregate(last=Max('original_id'))['last'] or 0,
+    )
+
+
+def books_lent_between(after, upto):
+    """Ids of the books lent by loans with ids in ``(after, upto]``, live or archived"""
+    live = Transaction.objects.filter(id__gt=after, id__lte=upto).values_list('book_id', flat=True)
+    archived = TransactionHistory.objects.filter(
+        original_id__gt=after, original_id__lte=upto
+    ).values_list('book_id', flat=True)
+    return set(live.distinct()) | set(archived.distinct())
+
+
+def build_recommendations(full=False, k=DEFAULT_NEIGHBORS, min_support=DEFAULT_MIN_SUPPORT, batch_size=1000):
+    """
+    Rebuild the stored neighbour lists, completely or (by default) only those
+    affected by loans made since the previous build. Returns
+    ``(rows written, books indexed)``.
+    """
+    watermark = 0 if full else last_build_watermark()
+    newest = newest_loan_id()
+    if watermark and newest <= watermark:
+        return 0, None
+    
+    index = CoBorrowIndex.from_database()
+    if watermark:
+        books = sorted(index.affected_by(books_lent_between(watermark, newest)))
+    else:
+        books = range(len(index))
+    
+    written = 0
+    rows = index.rows(books, k, min_support)
+    while True:
+        batch = [
+            BookRecommendation(book_id=book_id, neighbors=neighbors, last_transaction_id=newest)
+            for book_id, neighbors in islice(rows, batch_size)
+        ]
+        if not batch:
+            break
+        # Short transactions, so the API keeps serving the other rows meanwhile
+        with transaction.atomic():
+            BookRecommendation.objects.filter(book_id__in=[row.book_id for row in batch]).delete()
+            BookRecommendation.objects.bulk_create(batch)
+        written += len(batch)
+    if not watermark:
+        # Rows a full build did not rewrite belong to books no longer borrowed by anyone
+        BookRecommendation.objects.exclude(last_transaction_id=newest).delete()
+    bump_generation(BookRecommendation._meta.label)
+    return written, len(index)
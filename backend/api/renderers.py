@@ -0,0 +1,21 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets ``text/event-stream`` requests through content negotiation. The
+    stream itself is a StreamingHttpResponse; only error responses (401/403)
+    are rendered here, as a single ``error`` event.
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        payload = json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':'))
+        return f"event: error\ndata: {payload}\n\n".encode()
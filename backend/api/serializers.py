@@ -1,26 +1,40 @@
 from rest_framework import serializers
+from rest_framework.fields import get_error_detail
+from rest_framework.validators import UniqueValidator
 from django.contrib.auth import get_user_model
-from catalog.models import Category, Book
-from transactions.models import Transaction, Reservation
+from django.core.exceptions import ValidationError as DjangoValidationError
+from catalog.isbn import InvalidISBN, normalize_isbn
+from catalog.models import Category, Book, BookCopy, BookDemandForecast
+from transactions.models import CirculationEvent, Transaction, TransactionHistory, Reservation
 from django.utils import timezone
 from datetime import timedelta
-from django.db.models import Sum
+from django.db.models import Count, Q, Sum
+from .thumbnails import ready_derivative_url, derivative_urls
 
 User = get_user_model()
 
 
+def absolute_media_url(serializer, url):
+    """Make a media URL absolute like DRF does for ImageField values"""
+    request = serializer.context.get('request')
+    if url and request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
 class UserSerializer(serializers.ModelSerializer):
     """Serializer for User model"""
     books_issued_count = serializers.ReadOnlyField()
     can_issue_books = serializers.ReadOnlyField()
     is_membership_active = serializers.ReadOnlyField()
+    profile_thumb_url = serializers.SerializerMethodField()
     
     class Meta:
         model = User
         fields = [
             'id', 'username', 'email', 'first_name', 'last_name',
             'user_type', 'status', 'phone_number', 'address', 'date_of_birth',
-            'profile_picture', 'library_card_number', 'max_books_allowed',
+            'profile_picture', 'profile_thumb_url', 'library_card_number', 'max_books_allowed',
             'membership_start_date', 'membership_end_date', 'books_issued_count',
             'can_issue_books', 'is_membership_active', 'date_joined'
         ]
@@ -28,6 +42,9 @@ class UserSerializer(serializers.ModelSerializer):
         extra_kwargs = {
             'password': {'write_only': True}
         }
+    
+    def get_profile_thumb_url(self, obj):
+        return absolute_media_url(self, ready_derivative_url(obj.profile_picture, 'icon'))
 
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
@@ -56,6 +73,29 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         return user
 
 
+class ISBNField(serializers.CharField):
+    """Accepts any ISBN form and stores the canonical ISBN-13 or ISBN-10"""
+    
+    def __init__(self, length=13, **kwargs):
+        self.length = length
+        kwargs.setdefault('max_length', length)
+        super().__init__(**kwargs)
+    
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data)
+        if not value:
+            return value
+        try:
+            isbn13, isbn10 = normalize_isbn(value)
+        except InvalidISBN as exc:
+            raise serializers.ValidationError(str(exc))
+        if self.length == 13:
+            return isbn13
+        if isbn10 is None:
+            raise serializers.ValidationError("979-prefixed ISBNs have no ISBN-10 form")
+        return isbn10
+
+
 class CategorySerializer(serializers.ModelSerializer):
     """Serializer for Category model"""
     books_count = serializers.ReadOnlyField()
@@ -68,9 +108,12 @@ class CategorySerializer(serializers.ModelSerializer):
 
 class BookSerializer(serializers.ModelSerializer):
     """Serializer for Book model"""
+    isbn = ISBNField(validators=[UniqueValidator(queryset=Book.objects.all())])
+    isbn_10 = ISBNField(length=10, required=False, allow_blank=True, allow_null=True)
     category_name = serializers.CharField(source='category.name', read_only=True)
     is_available = serializers.ReadOnlyField()
     issued_copies = serializers.ReadOnlyField()
+    cover_thumbnails = serializers.SerializerMethodField()
     
     class Meta:
         model = Book
@@ -79,22 +122,123 @@ class BookSerializer(serializers.ModelSerializer):
             'publisher', 'publication_date', 'edition', 'category', 'category_name',
             'language', 'pages', 'format', 'status', 'condition', 'location',
             'call_number', 'total_copies', 'available_copies', 'issued_copies',
-            'price', 'description', 'cover_image', 'keywords', 'added_date',
-            'is_available', 'created_at', 'updated_at'
+            'price', 'description', 'cover_image', 'cover_thumbnails', 'keywords',
+            'added_date', 'is_available', 'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'added_date', 'created_at', 'updated_at']
+    
+    def get_cover_thumbnails(self, obj):
+        urls = derivative_urls(obj.cover_image)
+        if urls is None:
+            return None
+        return {
+            size: {fmt: absolute_media_url(self, url) for fmt, url in formats.items()}
+            for size, formats in urls.items()
+        }
+    
+    def validate(self, attrs):
+        isbn = attrs.get('isbn', getattr(self.instance, 'isbn', None))
+        isbn_10 = attrs.get('isbn_10')
+        if isbn and isbn_10 and normalize_isbn(isbn_10)[0] != isbn:
+            raise serializers.ValidationError({'isbn_10': "ISBN-10 does not match the ISBN-13"})
+        if 'isbn' in attrs and 'isbn_10' not in attrs:
+            # Let Book.save derive the ISBN-10 of the new ISBN-13
+            attrs['isbn_10'] = None
+        return attrs
+
+
+class BookPatchSerializer(serializers.ModelSerializer):
+    """Fields a bulk update may set; all optional, none of them unique or derived"""
+    
+    class Meta:
+        model = Book
+        fields = ['category', 'status', 'condition', 'location', 'language', 'format']
+        extra_kwargs = {field: {'required': False} for field in fields}
+    
+    def to_internal_value(self, data):
+        unknown = sorted(set(data) - set(self.fields)) if isinstance(data, dict) else []
+        if unknown:
+            raise serializers.ValidationError(f"Fields that cannot be bulk updated: {', '.join(unknown)}")
+        return super().to_internal_value(data)
+
+
+class BookBulkUpdateSerializer(serializers.Serializer):
+    """Which books to change, by ``ids`` or by ``filter`` (BookFilter parameters), and the ``patch``"""
+    MAX_IDS = 10000
+    
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), required=False, allow_empty=False, max_length=MAX_IDS
+    )
+    filter = serializers.DictField(required=False, allow_empty=False)
+    patch = BookPatchSerializer()
+    
+    def validate_filter(self, value):
+        # django-filter skips empty values, so {"location": ""} would select every book
+        blank = sorted(
+            name for name, item in value.items()
+            if item in (None, [], {}) or (isinstance(item, str) and not item.strip())
+        )
+        if blank:
+            raise serializers.ValidationError(f"Filters without a value: {', '.join(blank)}")
+        return value
+    
+    def validate(self, attrs):
+        if ('ids' in attrs) == ('filter' in attrs):
+            raise serializers.ValidationError("Give either ids or filter")
+        if not attrs['patch']:
+            raise serializers.ValidationError({'patch': "Nothing to update"})
+        return attrs
 
 
 class BookListSerializer(serializers.ModelSerializer):
-    """Lightweight serializer for book list"""
+    """Lightweight serializer for book list (points at cover thumbnails once they are built)"""
     category_name = serializers.CharField(source='category.name', read_only=True)
     is_available = serializers.ReadOnlyField()
+    cover_thumb_url = serializers.SerializerMethodField()
+    cover_medium_url = serializers.SerializerMethodField()
     
     class Meta:
         model = Book
         fields = [
             'id', 'title', 'author', 'isbn', 'category_name', 'status',
-            'available_copies', 'total_copies', 'is_available', 'cover_image'
+            'available_copies', 'total_copies', 'is_available',
+            'cover_thumb_url', 'cover_medium_url'
+        ]
+    
+    def get_cover_thumb_url(self, obj):
+        return absolute_media_url(self, ready_derivative_url(obj.cover_image, 'thumb'))
+    
+    def get_cover_medium_url(self, obj):
+        return absolute_media_url(self, ready_derivative_url(obj.cover_image, 'medium'))
+
+
+class BookCopySerializer(serializers.ModelSerializer):
+    """Serializer for BookCopy model"""
+    book_title = serializers.CharField(source='book.title', read_only=True)
+    
+    class Meta:
+        model = BookCopy
+        fields = [
+            'id', 'book', 'book_title', 'barcode', 'condition', 'location',
+            'state', 'acquired_date', 'created_at', 'updated_at'
+        ]
+        read_only_fields = ['id', 'created_at', 'updated_at']
+
+
+class BookDemandForecastSerializer(serializers.ModelSerializer):
+    """One row of the acquisition report (see api/acquisition.py)"""
+    title = serializers.CharField(source='book.title', read_only=True)
+    author = serializers.CharField(source='book.author', read_only=True)
+    isbn = serializers.CharField(source='book.isbn', read_only=True)
+    category_name = serializers.CharField(source='book.category.name', read_only=True, default=None)
+    
+    class Meta:
+        model = BookDemandForecast
+        fields = [
+            'book', 'title', 'author', 'isbn', 'category_name',
+            'total_copies', 'suggested_copies', 'copy_delta',
+            'loans', 'utilization', 'active_holds', 'hold_pressure',
+            'average_loan_days', 'forecast_loans', 'window_days', 'horizon_days', 'computed_at',
         ]
 
 
@@ -103,6 +247,7 @@ class TransactionSerializer(serializers.ModelSerializer):
     user_name = serializers.CharField(source='user.get_full_name', read_only=True)
     book_title = serializers.CharField(source='book.title', read_only=True)
     book_isbn = serializers.CharField(source='book.isbn', read_only=True)
+    copy_barcode = serializers.CharField(source='copy.barcode', read_only=True, default=None)
     issued_by_name = serializers.CharField(source='issued_by.get_full_name', read_only=True)
     returned_to_name = serializers.CharField(source='returned_to.get_full_name', read_only=True)
     is_overdue = serializers.ReadOnlyField()
@@ -112,24 +257,51 @@ class TransactionSerializer(serializers.ModelSerializer):
         model = Transaction
         fields = [
             'id', 'user', 'user_name', 'book', 'book_title', 'book_isbn',
-            'issue_date', 'due_date', 'return_date', 'status', 'fine_amount',
-            'fine_paid', 'issued_by', 'issued_by_name', 'returned_to',
-            'returned_to_name', 'remarks', 'is_overdue', 'days_overdue',
+            'copy', 'copy_barcode', 'issue_date', 'due_date', 'return_date',
+            'status', 'fine_amount', 'fine_paid', 'issued_by', 'issued_by_name',
+            'returned_to', 'returned_to_name', 'remarks', 'is_overdue', 'days_overdue',
             'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'issue_date', 'created_at', 'updated_at']
 
 
+class TransactionHistorySerializer(TransactionSerializer):
+    """Archived transaction in the same shape as a live one, under its original id"""
+    id = serializers.IntegerField(source='original_id', read_only=True)
+    
+    class Meta(TransactionSerializer.Meta):
+        model = TransactionHistory
+        fields = TransactionSerializer.Meta.fields + ['archived_at']
+        read_only_fields = fields
+
+
 class TransactionCreateSerializer(serializers.ModelSerializer):
     """Serializer for creating transactions (issuing books)"""
     
     class Meta:
         model = Transaction
-        fields = ['user', 'book', 'due_date', 'issued_by', 'remarks']
+        fields = ['user', 'book', 'copy', 'due_date', 'issued_by', 'remarks']
+        extra_kwargs = {
+            'book': {'required': False}
+        }
     
     def validate(self, attrs):
         user = attrs.get('user')
-        book = attrs.get('book')
+        copy = attrs.get('copy')
+        book = attrs.get('book') or (copy.book if copy else None)
+        
+        if book is None:
+            raise serializers.ValidationError({'book': "Either a book or a copy is required"})
+        
+        # A scanned copy must belong to the book and be on the shelf
+        if copy is not None:
+            if copy.book_id != book.pk:
+                raise serializers.ValidationError({'copy': "Copy belongs to a different book"})
+            if copy.state != 'available':
+                raise serializers.ValidationError(
+                    {'copy': f"Copy is not available ({copy.get_state_display()})"}
+                )
+        attrs['book'] = book
         
         # Check if user can issue books
         if not user.can_issue_books:
@@ -150,6 +322,13 @@ class TransactionCreateSerializer(serializers.ModelSerializer):
             attrs['due_date'] = (timezone.now() + timedelta(days=14)).date()
         
         return attrs
+    
+    def create(self, validated_data):
+        # Transaction.save claims the copy; a copy taken since validate() is a validation error too
+        try:
+            return super().create(validated_data)
+        except DjangoValidationError as exc:
+            raise serializers.ValidationError(get_error_detail(exc))
 
 
 class TransactionReturnSerializer(serializers.Serializer):
@@ -195,6 +374,37 @@ class ReservationSerializer(serializers.ModelSerializer):
         return attrs
 
 
+class CirculationEventSerializer(serializers.ModelSerializer):
+    """One entry of the circulation log (/api/events/)"""
+    kind = serializers.CharField(source='get_kind_display', read_only=True)
+    
+    class Meta:
+        model = CirculationEvent
+        fields = ['id', 'kind', 'occurred_at', 'user', 'book', 'loan_id', 'hold_id', 'actor', 'amount', 'due_date']
+        read_only_fields = fields
+
+
+def member_loan_totals(user):
+    """
+    Loans ``user`` borrowed and returned, live and archived, and the unpaid
+    fines. Only settled loans are archived, so fines come from the live table.
+    """
+    live = Transaction.objects.filter(user=user).aggregate(
+        issued=Count('id'),
+        returned=Count('id', filter=Q(status='returned')),
+        unpaid=Sum('fine_amount', filter=Q(fine_paid=False), default=0),
+    )
+    archived = TransactionHistory.objects.filter(user=user).aggregate(
+        issued=Count('id'),
+        returned=Count('id', filter=Q(status='returned')),
+    )
+    return {
+        'total_books_issued': live['issued'] + archived['issued'],
+        'total_books_returned': live['returned'] + archived['returned'],
+        'current_fine': live['unpaid'],
+    }
+
+
 class UserProfileSerializer(serializers.ModelSerializer):
     """Serializer for user profile with statistics"""
 
@@ -212,17 +422,18 @@ class UserProfileSerializer(serializers.ModelSerializer):
             'total_books_issued', 'total_books_returned', 'current_fine'
         ]
     
+    def loan_totals(self, obj):
+        # One pair of aggregates serves all three fields
+        cached = self.__dict__.setdefault('_loan_totals', {})
+        if obj.pk not in cached:
+            cached[obj.pk] = member_loan_totals(obj)
+        return cached[obj.pk]
+    
     def get_total_books_issued(self, obj):
-        # Query the Transaction model directly to avoid relationship naming issues
-        return Transaction.objects.filter(user=obj).count() 
+        return self.loan_totals(obj)['total_books_issued']
     
     def get_total_books_returned(self, obj):
-        # Filter by user and 'returned' status
-        return Transaction.objects.filter(user=obj, status='returned').count()
+        return self.loan_totals(obj)['total_books_returned']
     
     def get_current_fine(self, obj):
-        # Aggregate fine_amount for this specific user
-        unpaid_fines = Transaction.objects.filter(user=obj, fine_paid=False).aggregate(
-            total=Sum('fine_amount')
-        )
-        return unpaid_fines['total'] or 0.00
+        return self.loan_totals(obj)['current_fine']
@@ -0,0 +1,133 @@
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from catalog.models import Book, Category
+from catalog.signals import books_updated
+from transactions.models import Transaction, Reservation
+from .authentication import invalidate_cached_user
+from .cache import bump_generation
+from .events import publish_on_commit
+from .thumbnails import build_derivatives
+
+
+def _new_image(instance, field_name, created, update_fields):
+    """
+    Name of the image in ``field_name`` if this save stored a different one
+    than was loaded from the database, else None. Most saves leave the image
+    alone (a loan updating its book's counters) and build nothing.
+    """
+    if update_fields is not None and field_name not in update_fields:
+        return None
+    if field_name not in instance.__dict__:
+        return None  # deferred and never assigned
+    name = getattr(instance, field_name).name or None
+    loaded = getattr(instance, '_loaded_images', {})
+    changed = created or field_name not in loaded or loaded[field_name] != name
+    instance._loaded_images = {**loaded, field_name: name}
+    return name if changed else None
+
+
+def _build_derivatives(name, label):
+    # Cached lists were rendered without the derivatives' URLs
+    if build_derivatives(name):
+        bump_generation(label)
+
+
+def _build_derivatives_on_commit(name, sender):
+    # After commit, so a rolled-back upload builds nothing and the request's
+    # transaction is not held open while images are resized
+    if name:
+        transaction.on_commit(partial(_build_derivatives, name, sender._meta.label))
+
+
+@receiver(post_save, sender=Book)
+def build_cover_derivatives(sender, instance, created, update_fields=None, **kwargs):
+    """Generate cover thumbnails when a book is saved with a new image"""
+    _build_derivatives_on_commit(_new_image(instance, 'cover_image', created, update_fields), sender)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def build_profile_picture_derivatives(sender, instance, created, update_fields=None, **kwargs):
+    """Generate profile picture thumbnails when a user is saved with a new image"""
+    _build_derivatives_on_commit(_new_image(instance, 'profile_picture', created, update_fields), sender)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_authenticated_user(sender, instance, **kwargs):
+    """Drop the cached authentication copy of a user when it changes"""
+    invalidate_cached_user(instance)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(books_updated, sender=Book)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+@receiver(post_save, sender=Reservation)
+@receiver(post_delete, sender=Reservation)
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_cached_responses(sender, **kwargs):
+    """Bump the model's cache generation so dependent responses are recomputed"""
+    bump_generation(sender._meta.label)
+
+
+@receiver(post_save, sender=Book)
+def publish_book_availability(sender, instance, created, **kwargs):
+    current = instance.availability_state()
+    loaded = getattr(instance, '_loaded_availability', None)
+    if created or loaded is None or any(current.get(name, value) != value for name, value in loaded.items()):
+        publish_on_commit('book.availability_changed', {'book': instance.pk, **current})
+    instance._loaded_availability = current
+
+
+@receiver(books_updated, sender=Book)
+def publish_bulk_availability(sender, availability, **kwargs):
+    for book_id, state in availability.items():
+        publish_on_commit('book.availability_changed', {'book': book_id, **state})
+
+
+def _transaction_payload(instance):
+    return {
+        'id': instance.pk,
+        'user': instance.user_id,
+        'book': instance.book_id,
+        'copy': instance.copy_id,
+        'status': instance.status,
+        'due_date': instance.due_date,
+        'return_date': instance.return_date,
+    }
+
+
+@receiver(post_save, sender=Transaction)
+def publish_transaction_event(sender, instance, created, **kwargs):
+    if created:
+        publish_on_commit('transaction.issued', _transaction_payload(instance))
+    elif instance.return_date and getattr(instance, '_loaded_return_date', None) is None:
+        publish_on_commit('transaction.returned', _transaction_payload(instance))
+    instance._loaded_return_date = instance.return_date
+
+
+def _reservation_payload(instance):
+    return {'id': instance.pk, 'user': instance.user_id, 'book': instance.book_id, 'status': instance.status}
+
+
+@receiver(post_save, sender=Reservation)
+def publish_reservation_event(sender, instance, created, **kwargs):
+    if created:
+        publish_on_commit('reservation.created', _reservation_payload(instance))
+    elif instance.status != getattr(instance, '_loaded_status', None):
+        publish_on_commit(f'reservation.{instance.status}', _reservation_payload(instance))
+    instance._loaded_status = instance.status
+
+
+@receiver(post_delete, sender=Reservation)
+def publish_reservation_deleted(sender, instance, **kwargs):
+    publish_on_commit('reservation.deleted', _reservation_payload(instance))
@@ -0,0 +1,153 @@
+"""
+Slow-query log grouped by statement fingerprint
+
+``SlowQueryMiddleware`` (api/middleware.py) times every statement a request
+runs. Statements taking at least ``SLOW_QUERY_THRESHOLD_MS`` are appended to
+``SLOW_QUERY_LOG`` as JSON lines, each carrying:
+
+- its fingerprint, the SQL with literals and placeholders replaced by ``?``
+  and value lists collapsed, so one ORM call site maps to one fingerprint
+- the route and method that ran it, which identify the viewset action
+- the project source line behind the ORM call
+
+``python manage.py slow_queries`` groups the log by fingerprint and prints
+the count, total and maximum time of the worst offenders. A threshold of 0
+logs every statement, which turns the log into a full per-fingerprint
+profile. The log is rotated to ``<name>.1`` at ``SLOW_QUERY_LOG_MAX_BYTES``.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+from . import metrics
+from .profiling import SQLRecorder
+
+logger = logging.getLogger(__name__)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_PLACEHOLDER = re.compile(r'%\(\w+\)s|%s|\?')
+_NUMBER = re.compile(r'(?<![\w".])-?\b\d+(?:\.\d+)?\b')
+_VALUE_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_REPEATED_ROWS = re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+')
+_SPACE = re.compile(r'\s+')
+
+_write_lock = threading.Lock()
+
+
+def normalize(sql):
+    """``sql`` with literals replaced by ``?`` and value lists collapsed to ``(...)``"""
+    sql = _STRING.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _VALUE_LIST.sub('(...)', sql)
+    sql = _REPEATED_ROWS.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def fingerprint(statement):
+    """Short stable id of a normalized statement"""
+    return hashlib.sha1(statement.encode()).hexdigest()[:12]
+
+
+def log_paths():
+    """The current log and its rotated predecessor, oldest first"""
+    path = Path(settings.SLOW_QUERY_LOG)
+    return [path.with_name(path.name + '.1'), path]
+
+
+def write_entry(entry):
+    path = Path(settings.SLOW_QUERY_LOG)
+    line = json.dumps(entry) + '\n'
+    with _write_lock:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            if path.stat().st_size + len(line) > settings.SLOW_QUERY_LOG_MAX_BYTES:
+                os.replace(path, log_paths()[0])
+        except FileNotFoundError:
+            pass
+        with path.open('a') as log:
+            log.write(line)
+
+
+class SlowQueryRecorder:
+    """Execute wrapper logging the statements of one request that reach the threshold"""
+    
+    def __init__(self, request, threshold_ms):
+        self.request = request
+        self.threshold_ms = threshold_ms
+    
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            if duration_ms >= self.threshold_ms:
+                self.record(sql, many, duration_ms, sys._getframe(1))
+    
+    def record(self, sql, many, duration_ms, frame):
+        phase, origin = SQLRecorder.locate(frame)
+        statement = normalize(sql)
+        match = getattr(self.request, 'resolver_match', None)
+        route = match.view_name if match else 'unmatched'
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'fingerprint': fingerprint(statement),
+            'statement': statement,
+            'duration_ms': round(duration_ms, 3),
+            'many': many,
+            'route': route,
+            'method': self.request.method,
+            'phase': phase,
+            'origin': origin,
+        }
+        metrics.db_slow_queries.inc(route, self.request.method)
+        try:
+            write_entry(entry)
+        except OSError:
+            logger.exception("Could not write to the slow-query log")
+        logger.warning(
+            "Slow query (%.1fms) in %s %s from %s: %s",
+            duration_ms, self.request.method, route, origin, statement[:300],
+        )
+
+
+def read_entries(paths=None):
+    """Entries of the slow-query log, oldest first; unreadable lines are skipped"""
+    for path in paths or log_paths():
+        try:
+            log = open(path)
+        except FileNotFoundError:
+            continue
+        with log:
+            for line in log:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by rotation or a crash
+
+
+def summarize(entries):
+    """Per-fingerprint count, total and max time, with the call sites behind each"""
+    summary = {}
+    for entry in entries:
+        stats = summary.get(entry['fingerprint'])
+        if stats is None:
+            stats = summary[entry['fingerprint']] = {
+                'fingerprint': entry['fingerprint'], 'statement': entry['statement'],
+                'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'sources': {},
+            }
+        stats['count'] += 1
+        stats['total_ms'] += entry['duration_ms']
+        stats['max_ms'] = max(stats['max_ms'], entry['duration_ms'])
+        source = (f"{entry['method']} {entry['route']}", entry.get('origin') or 'unknown')
+        stats['sources'][source] = stats['sources'].get(source, 0) + 1
+    return list(summary.values())
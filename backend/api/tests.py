@@ -1,3 +1,1595 @@
-from django.test import TestCase
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.base import BaseHandler
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils.module_loading import import_string
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from catalog.isbn import isbn13_check_digit, isbn13_to_isbn10
+from catalog.models import Book, BookCopy, BookDemandForecast, BookRecommendation, Category
+from library_backend.routers import ReplicaRouter
+from transactions.models import (
+    CirculationEvent, CirculationEventCounter, Reservation, Transaction, TransactionHistory,
+)
+from .middleware import ReplicaRoutingMiddleware
+from .slow_queries import fingerprint, normalize, read_entries, write_entry
+from .urls import router
+
+User = get_user_model()
+
+APP_TABLE_PREFIXES = ('catalog_', 'transactions_', 'users_')
+
+
+def seed_library():
+    """Small but complete dataset: every filter below matches at least one row"""
+    today = timezone.now().date()
+    staff = User.objects.create_user('librarian', password='x', is_staff=True, user_type='staff')
+    member = User.objects.create_user('member', password='x', user_type='student')
+    fiction = Category.objects.create(name='Fiction')
+    science = Category.objects.create(name='Science')
+    books = [
+        Book.objects.create(
+            title=f'Book {i}', author='Author', publisher='Publisher',
+            isbn=isbn, location='A1', call_number=f'CN-{i}', category=category,
+            publication_date=today.replace(year=2020), price=Decimal('20.00'),
+            total_copies=3, available_copies=3,
+        )
+        for i, (isbn, category) in enumerate([
+            ('9780306406157', fiction), ('9780262033848', science), ('9780131103627', fiction),
+        ])
+    ]
+    BookCopy.objects.create(book=books[2], barcode='BC-0001')
+    BookCopy.objects.create(book=books[2], barcode='BC-0002')
+    
+    Transaction.objects.create(user=member, book=books[0], due_date=today + timedelta(days=7), issued_by=staff)
+    overdue = Transaction.objects.create(user=member, book=books[1], due_date=today + timedelta(days=1), issued_by=staff)
+    Transaction.objects.filter(pk=overdue.pk).update(due_date=today - timedelta(days=3))
+    returned = Transaction.objects.create(user=member, book=books[2], due_date=today, issued_by=staff)
+    returned.mark_as_returned(returned_to=staff)
+    Transaction.objects.filter(pk=returned.pk).update(fine_amount=Decimal('5.00'))
+    
+    Reservation.objects.create(user=member, book=books[1], expiry_date=timezone.now() + timedelta(days=7))
+    return staff, member, books, fiction
+
+
+def explain(sql):
+    """
+    Return ``(full_scans, plan)`` for a SELECT statement, where ``full_scans``
+    lists the application tables the database would read without an index.
+    """
+    vendor = connection.vendor
+    with connection.cursor() as cursor:
+        if vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            details = [row[-1] for row in cursor.fetchall()]
+            scans = [
+                match.group(1) for match in
+                (re.match(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$', detail) for detail in details)
+                if match
+            ]
+            return [table for table in scans if table.startswith(APP_TABLE_PREFIXES)], details
+        if vendor == 'mysql':
+            cursor.execute('EXPLAIN ' + sql)
+            columns = [col[0] for col in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            # type=ALL with no usable key means no index could serve the predicate
+            scans = [
+                row['table'] for row in rows
+                if row['type'] == 'ALL' and not row['possible_keys']
+            ]
+            return [table for table in scans if table and table.startswith(APP_TABLE_PREFIXES)], rows
+        cursor.execute('EXPLAIN ' + sql)
+        plan = [row[0] for row in cursor.fetchall()]
+        scans = re.findall(r'Seq Scan on (\w+)', '\n'.join(plan))
+        return [table for table in scans if table.startswith(APP_TABLE_PREFIXES)], plan
+
+
+class QueryPlanTests(TestCase):
+    """
+    Every list, filter and statistics query in api/views.py must be served
+    by an index. Substring filters (``search=``, ``title``/``author``/
+    ``language``/``username``/``email`` icontains) are left out on purpose:
+    LIKE '%term%' cannot use a B-tree index on any backend.
+    """
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff, cls.member, cls.books, cls.category = seed_library()
+    
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+    
+    def endpoints(self):
+        today = timezone.now().date()
+        book, member = self.books[0], self.member
+        return [
+            '/api/books/',
+            f'/api/books/?category={self.category.pk}',
+            '/api/books/?status=available',
+            f'/api/books/?isbn={book.isbn}',
+            '/api/books/?isbn=0-306-40615-2',
+            f'/api/books/?publication_year={book.publication_date.year}',
+            '/api/books/?min_price=5&max_price=50',
+            '/api/books/?available=true',
+            '/api/books/available/',
+            '/api/books/statistics/',
+            f'/api/books/{book.pk}/',
+            f'/api/books/{book.pk}/transactions/',
+            f'/api/books/by-isbn/{book.isbn}/',
+            '/api/categories/',
+            f'/api/categories/{self.category.pk}/books/',
+            '/api/copies/',
+            f'/api/copies/?book={self.books[2].pk}',
+            '/api/copies/?state=available',
+            '/api/copies/scan/BC-0001/',
+            '/api/transactions/',
+            f'/api/transactions/?user={member.pk}',
+            f'/api/transactions/?book={book.pk}',
+            '/api/transactions/?status=issued',
+            '/api/transactions/?fine_paid=false',
+            f'/api/transactions/?issue_date_after={today - timedelta(days=30)}',
+            f'/api/transactions/?due_date_before={today}',
+            f'/api/transactions/?return_date_after={today - timedelta(days=30)}',
+            '/api/transactions/?overdue=true',
+            '/api/transactions/?unpaid_fine=true',
+            '/api/transactions/active/',
+            '/api/transactions/overdue/',
+            '/api/transactions/statistics/',
+            '/api/reservations/',
+            f'/api/reservations/?user={member.pk}',
+            f'/api/reservations/?book={self.books[1].pk}',
+            '/api/reservations/?status=active',
+            f'/api/reservations/?reservation_date_after={today - timedelta(days=30)}',
+            '/api/reservations/active/',
+            '/api/users/',
+            '/api/users/?user_type=student',
+            '/api/users/?status=active',
+            f'/api/users/{member.pk}/',
+            f'/api/users/{member.pk}/transactions/',
+            f'/api/users/{member.pk}/reservations/',
+        ]
+    
+    def collect_full_scans(self, user, urls):
+        self.client.force_authenticate(user)
+        failures = []
+        for url in urls:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, f"GET {url} -> {response.status_code}")
+            for query in ctx.captured_queries:
+                sql = query['sql']
+                if not sql.lstrip().upper().startswith('SELECT'):
+                    continue
+                scans, plan = explain(sql)
+                if scans:
+                    failures.append(f"GET {url}\n  full scan of {', '.join(scans)}\n  {sql}\n  plan: {plan}")
+        return failures
+    
+    def test_staff_queries_use_indexes(self):
+        failures = self.collect_full_scans(self.staff, self.endpoints())
+        self.assertFalse(failures, '\n\n'.join(failures))
+    
+    def test_member_queries_use_indexes(self):
+        urls = [
+            '/api/users/me/',
+            '/api/transactions/',
+            '/api/transactions/active/',
+            '/api/transactions/overdue/',
+            '/api/reservations/',
+            '/api/reservations/active/',
+        ]
+        failures = self.collect_full_scans(self.member, urls)
+        self.assertFalse(failures, '\n\n'.join(failures))
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'], REPLICA_STICKY_SECONDS=10)
+@mock.patch('library_backend.routers.is_primary_alias', return_value=False)
+class ReplicaRoutingTests(TestCase):
+    """Routing decisions of ReplicaRouter as driven by ReplicaRoutingMiddleware"""
+    
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.router = ReplicaRouter()
+        self.user = User.objects.create_user('reader', password='x')
+    
+    def route_read(self, method, path, user=None, status=200):
+        """Run a request through the middleware and return the database a read would use"""
+        request = getattr(self.factory, method)(path)
+        request.user = user or self.user
+        request.resolver_match = resolve(path)
+        seen = {}
+        
+        def view(request):
+            seen['db'] = self.router.db_for_read(Book)
+            return HttpResponse(status=status)
+        
+        middleware = ReplicaRoutingMiddleware(view)
+        
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            return view(request)
+        
+        middleware.get_response = get_response
+        middleware(request)
+        return seen['db']
+    
+    def test_safe_request_on_listed_route_uses_replica(self, _):
+        self.assertEqual(self.route_read('get', '/api/books/'), 'replica_0')
+        self.assertEqual(self.route_read('get', '/api/books/statistics/'), 'replica_0')
+    
+    def test_unlisted_route_uses_primary(self, _):
+        self.assertEqual(self.route_read('get', '/api/users/me/'), 'default')
+        # A lagging replica would let the feed skip events
+        self.assertEqual(self.route_read('get', '/api/events/'), 'default')
+    
+    def test_write_request_uses_primary(self, _):
+        self.assertEqual(self.route_read('post', '/api/transactions/issue_book/', status=201), 'default')
+    
+    def test_reads_stick_to_primary_after_own_write(self, _):
+        self.route_read('post', '/api/transactions/issue_book/', status=201)
+        self.assertEqual(self.route_read('get', '/api/books/'), 'default')
+        other = User.objects.create_user('other', password='x')
+        self.assertEqual(self.route_read('get', '/api/books/', user=other), 'replica_0')
+    
+    def test_write_through_the_api_pins_the_writer_until_replicas_catch_up(self, _):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.patch('/api/users/update_profile/', {'first_name': 'Ada'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        # The pin lives in the shared cache, so every worker process honours it
+        self.assertEqual(self.route_read('get', '/api/books/'), 'default')
+        later = time.time() + 11
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            self.assertEqual(self.route_read('get', '/api/books/'), 'replica_0')
+    
+    def test_failed_write_does_not_pin(self, _):
+        self.route_read('post', '/api/transactions/issue_book/', status=400)
+        self.assertEqual(self.route_read('get', '/api/books/'), 'replica_0')
+    
+    def test_outside_requests_use_primary(self, _):
+        self.assertEqual(self.router.db_for_read(Book), 'default')
+        self.assertEqual(self.router.db_for_write(Book), 'default')
+
+
+@skipUnless(connection.vendor == 'sqlite', "snapshots the primary with sqlite's backup API")
+class LaggingReplicaCacheTests(TransactionTestCase):
+    """Response cache misses on replica-routed requests are filled from the primary"""
+    
+    def setUp(self):
+        cache.clear()
+        self.staff, _, self.books, _ = seed_library()
+        self.assistant = User.objects.create_user('assistant', password='x', is_staff=True, user_type='staff')
+        # A replica that stopped replicating here
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'lagging.sqlite3')
+        connection.ensure_connection()
+        target = sqlite3.connect(path)
+        connection.connection.backup(target)
+        target.close()
+        # Registered on this thread only, where the sync views below query
+        primary = connections['default']
+        connections['lagging'] = type(primary)(dict(primary.settings_dict, NAME=path), alias='lagging')
+        self.addCleanup(self.drop_alias)
+        settings = override_settings(DATABASE_REPLICAS=['lagging'])
+        settings.enable()
+        self.addCleanup(settings.disable)
+    
+    def drop_alias(self):
+        connections['lagging'].close()
+        del connections['lagging']
+    
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+    
+    def test_writer_reads_own_write_after_another_user_misses_the_cache(self):
+        book = self.books[0]
+        url = f'/api/books/{book.pk}/'
+        writer, reader = self.client_for(self.staff), self.client_for(self.assistant)
+        self.assertEqual(reader.get(url).json()['title'], book.title)
+        
+        response = writer.patch(url, {'title': 'Second Edition'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Book.objects.using('lagging').get(pk=book.pk).title, book.title)
+        # The reader isn't pinned, but the new generation's entry comes from the primary
+        self.assertEqual(reader.get(url).json()['title'], 'Second Edition')
+        self.assertEqual(writer.get(url).json()['title'], 'Second Edition')
+        for client in (reader, writer):
+            titles = {row['id']: row['title'] for row in client.get('/api/books/').json()['results']}
+            self.assertEqual(titles[book.pk], 'Second Edition')
+
+
+def make_isbn13(number):
+    first_twelve = f'978{number:09d}'
+    return first_twelve + isbn13_check_digit(first_twelve)
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Runs every router action with one row and with a hundred rows behind it.
+    The query count must not grow with the data (no N+1) and must stay within
+    the budget declared below. Set QUERY_BUDGET_REPORT=1 to print the
+    per-action table.
+    """
+    SIZES = (1, 100)
+    
+    # (url name, method, role) -> maximum number of queries
+    BUDGETS = {
+        ('user-list', 'get', 'staff'): 2,
+        ('user-list', 'post', 'staff'): 3,
+        ('user-detail', 'get', 'staff'): 1,
+        ('user-detail', 'patch', 'staff'): 2,
+        ('user-detail', 'delete', 'staff'): 14,
+        ('user-me', 'get', 'member'): 2,
+        ('user-update-profile', 'patch', 'member'): 3,
+        ('user-transactions', 'get', 'staff'): 3,
+        ('user-reservations', 'get', 'staff'): 2,
+        ('category-list', 'get', 'staff'): 2,
+        ('category-list', 'post', 'staff'): 3,
+        ('category-detail', 'get', 'staff'): 1,
+        ('category-detail', 'patch', 'staff'): 2,
+        ('category-detail', 'delete', 'staff'): 3,
+        ('category-books', 'get', 'staff'): 2,
+        ('book-list', 'get', 'staff'): 2,
+        ('book-list', 'get', 'member'): 2,
+        ('book-list', 'post', 'staff'): 4,
+        ('book-detail', 'get', 'staff'): 1,
+        ('book-detail', 'patch', 'staff'): 2,
+        ('book-detail', 'delete', 'staff'): 13,
+        ('book-available', 'get', 'staff'): 2,
+        ('book-statistics', 'get', 'staff'): 5,
+        ('book-by-isbn', 'get', 'staff'): 1,
+        ('book-by-isbn-batch', 'post', 'staff'): 1,
+        ('book-transactions', 'get', 'staff'): 3,
+        ('book-similar', 'get', 'member'): 3,
+        ('book-bulk-update', 'post', 'staff'): 3,
+        ('copy-list', 'get', 'staff'): 2,
+        ('copy-list', 'post', 'staff'): 5,
+        ('copy-detail', 'get', 'staff'): 1,
+        ('copy-detail', 'patch', 'staff'): 4,
+        ('copy-detail', 'delete', 'staff'): 6,
+        ('copy-scan', 'get', 'staff'): 1,
+        ('transaction-list', 'get', 'staff'): 2,
+        ('transaction-list', 'get', 'member'): 2,
+        ('transaction-list', 'post', 'staff'): 11,
+        ('transaction-detail', 'get', 'staff'): 1,
+        ('transaction-detail', 'patch', 'staff'): 5,
+        ('transaction-detail', 'delete', 'staff'): 2,
+        ('transaction-issue-book', 'post', 'staff'): 11,
+        ('transaction-return-book', 'post', 'staff'): 10,
+        ('transaction-active', 'get', 'staff'): 2,
+        ('transaction-overdue', 'get', 'staff'): 2,
+        ('transaction-statistics', 'get', 'staff'): 5,
+        ('reservation-list', 'get', 'staff'): 2,
+        ('reservation-list', 'get', 'member'): 2,
+        ('reservation-list', 'post', 'borrower'): 7,
+        ('reservation-detail', 'get', 'staff'): 1,
+        ('reservation-detail', 'patch', 'staff'): 2,
+        ('reservation-detail', 'delete', 'staff'): 2,
+        ('reservation-cancel', 'post', 'member'): 5,
+        ('reservation-active', 'get', 'staff'): 2,
+        ('dashboard-summary', 'get', 'staff'): 9,
+        ('dashboard-summary', 'get', 'member'): 5,
+        ('analytics-acquisition', 'get', 'staff'): 2,
+        ('analytics-inventory', 'get', 'staff'): 3,
+        ('analytics-inventory', 'post', 'staff'): 9,
+        ('circulation-event-list', 'get', 'staff'): 1,
+    }
+    
+    # PUT goes through the same update() path as PATCH. HEAD is GET; DRF
+    # adds it to a route's actions the first time any test requests the route
+    SKIPPED_METHODS = {'put', 'head'}
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('librarian', password='x', is_staff=True, user_type='staff')
+        cls.member = User.objects.create_user('member', password='x')
+        cls.borrower = User.objects.create_user('borrower', password='x')
+        cls.category = Category.objects.create(name='Fiction')
+    
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.seeded = 0
+    
+    def seed(self, count):
+        """
+        Add ``count`` rows to every table. Loans, archived loans, copies and
+        reservations all hang off the same member and book, so detail actions
+        see the row count grow as well as list actions.
+        """
+        now = timezone.now()
+        indexes = range(self.seeded, self.seeded + count)
+        self.seeded += count
+        
+        User.objects.bulk_create([User(username=f'reader{i}', email=f'reader{i}@example.com') for i in indexes])
+        Category.objects.bulk_create([Category(name=f'Shelf {i}') for i in indexes])
+        Book.objects.bulk_create([
+            Book(
+                title=f'Title {i}', author='Author', publisher='Publisher',
+                isbn=make_isbn13(i), isbn_10=isbn13_to_isbn10(make_isbn13(i)),
+                location='A1', call_number=f'CN-{i}', category=self.category,
+                total_copies=2, available_copies=1, price=Decimal('10.00'),
+            )
+            for i in indexes
+        ])
+        # Re-read instead of relying on bulk_create setting primary keys (MySQL doesn't)
+        books = list(Book.objects.filter(call_number__in=[f'CN-{i}' for i in indexes]))
+        hub = Book.objects.order_by('pk').first()
+        
+        # At least two copies, so deleting one still runs the inventory
+        # refresh (which skips books without copies)
+        existing = BookCopy.objects.filter(book=hub).count()
+        BookCopy.objects.bulk_create([
+            BookCopy(book=hub, barcode=f'BC-{i:05d}') for i in range(existing, max(self.seeded, 2))
+        ])
+        Transaction.objects.bulk_create([
+            Transaction(user=self.member, book=hub, due_date=now.date() - timedelta(days=1), issued_by=self.staff)
+            for i in indexes
+        ])
+        TransactionHistory.objects.bulk_create([
+            TransactionHistory(
+                original_id=1_000_000 + i, user=self.member, book=hub,
+                issue_date=now - timedelta(days=400), due_date=(now - timedelta(days=386)).date(),
+                return_date=now - timedelta(days=390), status='returned', issued_by=self.staff,
+                returned_to=self.staff, created_at=now, updated_at=now,
+            )
+            for i in indexes
+        ])
+        Reservation.objects.bulk_create([
+            Reservation(user=self.member, book=book, expiry_date=now + timedelta(days=7)) for book in books
+        ])
+        BookRecommendation.objects.update_or_create(book=hub, defaults={
+            'neighbors': [[pk, 0.5] for pk in Book.objects.values_list('pk', flat=True)],
+        })
+        CirculationEvent.append([
+            CirculationEvent(
+                kind=CirculationEvent.ISSUE, user=self.member, book=hub,
+                occurred_at=now - timedelta(days=1), due_date=now.date(),
+            )
+            for i in indexes
+        ])
+        BookDemandForecast.objects.bulk_create([
+            BookDemandForecast(
+                book=book, total_copies=2, loans=3, utilization=0.5, active_holds=1, hold_pressure=0.5,
+                average_loan_days=14, forecast_loans=4, suggested_copies=3, copy_delta=1,
+                window_days=90, horizon_days=30, computed_at=now,
+            )
+            for book in books
+        ])
+    
+    def cases(self):
+        """(url name, method, role, path, data) for every action under test"""
+        hub = Book.objects.order_by('pk').first()
+        copy = BookCopy.objects.order_by('pk').first()
+        loan = Transaction.objects.filter(user=self.member).order_by('pk').first()
+        reservation = Reservation.objects.order_by('pk').first()
+        member, staff = self.member, 'staff'
+        new_book = {
+            'title': 'New', 'author': 'Author', 'publisher': 'Publisher', 'isbn': '9780306406157',
+            'location': 'B2', 'call_number': 'CN-NEW', 'category': self.category.pk,
+            'total_copies': 1, 'available_copies': 1,
+        }
+        new_user = {
+            'username': 'newreader', 'email': 'new@example.com',
+            'password': 'S3cure-pass!', 'password2': 'S3cure-pass!',
+        }
+        due = str(timezone.now().date() + timedelta(days=14))
+        return [
+            ('user-list', 'get', staff, '/api/users/', None),
+            ('user-list', 'post', staff, '/api/users/', new_user),
+            ('user-detail', 'get', staff, f'/api/users/{member.pk}/', None),
+            ('user-detail', 'patch', staff, f'/api/users/{member.pk}/', {'address': 'Main St'}),
+            ('user-detail', 'delete', staff, f'/api/users/{member.pk}/', None),
+            ('user-me', 'get', 'member', '/api/users/me/', None),
+            ('user-update-profile', 'patch', 'member', '/api/users/update_profile/', {'address': 'Main St'}),
+            ('user-transactions', 'get', staff, f'/api/users/{member.pk}/transactions/', None),
+            ('user-reservations', 'get', staff, f'/api/users/{member.pk}/reservations/', None),
+            ('category-list', 'get', staff, '/api/categories/', None),
+            ('category-list', 'post', staff, '/api/categories/', {'name': 'Poetry'}),
+            ('category-detail', 'get', staff, f'/api/categories/{self.category.pk}/', None),
+            ('category-detail', 'patch', staff, f'/api/categories/{self.category.pk}/', {'description': 'Novels'}),
+            ('category-detail', 'delete', staff, f'/api/categories/{self.category.pk}/', None),
+            ('category-books', 'get', staff, f'/api/categories/{self.category.pk}/books/', None),
+            ('book-list', 'get', staff, '/api/books/', None),
+            ('book-list', 'get', 'member', '/api/books/?search=Title', None),
+            ('book-list', 'post', staff, '/api/books/', new_book),
+            ('book-detail', 'get', staff, f'/api/books/{hub.pk}/', None),
+            ('book-detail', 'patch', staff, f'/api/books/{hub.pk}/', {'location': 'C3'}),
+            ('book-detail', 'delete', staff, f'/api/books/{hub.pk}/', None),
+            ('book-available', 'get', staff, '/api/books/available/', None),
+            ('book-statistics', 'get', staff, '/api/books/statistics/', None),
+            ('book-by-isbn', 'get', staff, f'/api/books/by-isbn/{hub.isbn}/', None),
+            ('book-by-isbn-batch', 'post', staff, '/api/books/by-isbn/',
+             {'codes': list(Book.objects.values_list('isbn', flat=True))}),
+            ('book-transactions', 'get', staff, f'/api/books/{hub.pk}/transactions/', None),
+            ('book-similar', 'get', 'member', f'/api/books/{hub.pk}/similar/', None),
+            ('book-bulk-update', 'post', staff, '/api/books/bulk_update/',
+             {'filter': {'category': self.category.pk}, 'patch': {'location': 'D4', 'status': 'maintenance'}}),
+            ('copy-list', 'get', staff, '/api/copies/', None),
+            ('copy-list', 'post', staff, '/api/copies/', {'book': hub.pk, 'barcode': 'BC-NEW'}),
+            ('copy-detail', 'get', staff, f'/api/copies/{copy.pk}/', None),
+            ('copy-detail', 'patch', staff, f'/api/copies/{copy.pk}/', {'condition': 'fair'}),
+            ('copy-detail', 'delete', staff, f'/api/copies/{copy.pk}/', None),
+            ('copy-scan', 'get', staff, f'/api/copies/scan/{copy.barcode}/', None),
+            ('transaction-list', 'get', staff, '/api/transactions/', None),
+            ('transaction-list', 'get', 'member', '/api/transactions/', None),
+            ('transaction-list', 'post', staff, '/api/transactions/',
+             {'user': self.borrower.pk, 'book': hub.pk, 'due_date': due}),
+            ('transaction-detail', 'get', staff, f'/api/transactions/{loan.pk}/', None),
+            ('transaction-detail', 'patch', staff, f'/api/transactions/{loan.pk}/', {'remarks': 'Checked'}),
+            ('transaction-detail', 'delete', staff, f'/api/transactions/{loan.pk}/', None),
+            ('transaction-issue-book', 'post', staff, '/api/transactions/issue_book/',
+             {'user': self.borrower.pk, 'book': hub.pk, 'due_date': due}),
+            ('transaction-return-book', 'post', staff, '/api/transactions/return_book/', {'transaction_id': loan.pk}),
+            ('transaction-active', 'get', staff, '/api/transactions/active/', None),
+            ('transaction-overdue', 'get', staff, '/api/transactions/overdue/', None),
+            ('transaction-statistics', 'get', staff, '/api/transactions/statistics/', None),
+            ('reservation-list', 'get', staff, '/api/reservations/', None),
+            ('reservation-list', 'get', 'member', '/api/reservations/', None),
+            ('reservation-list', 'post', 'borrower', '/api/reservations/', {'user': self.borrower.pk, 'book': hub.pk, 'expiry_date': f'{due}T00:00:00Z'}),
+            ('reservation-detail', 'get', staff, f'/api/reservations/{reservation.pk}/', None),
+            ('reservation-detail', 'patch', staff, f'/api/reservations/{reservation.pk}/', {'remarks': 'Call'}),
+            ('reservation-detail', 'delete', staff, f'/api/reservations/{reservation.pk}/', None),
+            ('reservation-cancel', 'post', 'member', f'/api/reservations/{reservation.pk}/cancel/', None),
+            ('reservation-active', 'get', staff, '/api/reservations/active/', None),
+            ('dashboard-summary', 'get', staff, '/api/dashboard/summary/', None),
+            ('dashboard-summary', 'get', 'member', '/api/dashboard/summary/', None),
+            ('analytics-acquisition', 'get', staff, '/api/analytics/acquisition/', None),
+            ('analytics-inventory', 'get', staff, '/api/analytics/inventory/', None),
+            ('analytics-inventory', 'post', staff, '/api/analytics/inventory/', None),
+            ('circulation-event-list', 'get', staff, '/api/events/?since=0', None),
+        ]
+    
+    def count_queries(self, method, role, path, data):
+        """Run one request inside a rolled-back transaction and return (status, queries, body)"""
+        cache.clear()
+        self.client.force_authenticate({'staff': self.staff, 'member': self.member, 'borrower': self.borrower}[role])
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as ctx:
+                response = getattr(self.client, method)(path, data, format='json')
+            transaction.set_rollback(True)
+        return response.status_code, len(ctx.captured_queries), response.content[:300]
+    
+    def test_every_router_action_is_covered(self):
+        self.seed(1)
+        covered = {(name, method) for name, method, *_ in self.cases()}
+        missing = sorted(
+            (pattern.name, method)
+            for pattern in router.urls if pattern.name != 'api-root'
+            for method in pattern.callback.actions if method not in self.SKIPPED_METHODS
+            if (pattern.name, method) not in covered
+        )
+        self.assertFalse(missing, f"Add these actions to QueryBudgetTests.cases(): {missing}")
+    
+    def test_query_counts_are_constant_and_within_budget(self):
+        counts = {}
+        for size in self.SIZES:
+            self.seed(size - self.seeded)
+            for name, method, role, path, data in self.cases():
+                code, queries, body = self.count_queries(method, role, path, data)
+                self.assertLess(code, 400, f"{method.upper()} {path} as {role} -> {code}: {body}")
+                counts.setdefault((name, method, role), []).append(queries)
+        
+        header = f"{'action':<44}" + ''.join(f"{f'{size} row(s)':>12}" for size in self.SIZES) + f"{'budget':>8}"
+        rows, failures = [header], []
+        for key, observed in counts.items():
+            budget = self.BUDGETS.get(key)
+            label = f"{key[1].upper()} {key[0]} ({key[2]})"
+            flags = []
+            if len(set(observed)) > 1:
+                flags.append('grows with rows')
+            if budget is None or max(observed) > budget:
+                flags.append('over budget')
+            rows.append(
+                f"{label:<44}" + ''.join(f"{count:>12}" for count in observed)
+                + f"{budget if budget is not None else '-':>8}" + (f"  <- {', '.join(flags)}" if flags else '')
+            )
+            if flags:
+                failures.append(label)
+        report = '\n'.join(rows)
+        if os.environ.get('QUERY_BUDGET_REPORT'):
+            print('\n' + report)
+        self.assertFalse(failures, f"Query budget violations:\n{report}")
+
+
+class BookBulkUpdateTests(TestCase):
+    """POST /api/books/bulk_update/ (api/bulk.py)"""
+    
+    def setUp(self):
+        cache.clear()
+        self.staff, self.member, self.books, self.fiction = seed_library()
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+    
+    def bulk_update(self, body):
+        return self.client.post('/api/books/bulk_update/', body, format='json')
+    
+    def locations(self):
+        return list(Book.objects.order_by('pk').values_list('location', flat=True))
+    
+    def test_filter_updates_only_matching_books(self):
+        response = self.bulk_update({'filter': {'category': self.fiction.pk}, 'patch': {'location': 'B2'}})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'updated': 2, 'status_changed': 0})
+        self.assertEqual(self.locations(), ['B2', 'A1', 'B2'])
+    
+    def test_filters_that_select_every_book_are_refused(self):
+        for book_filter in ({'location': ''}, {'location': '  '}, {'category': None}, {'available': False}):
+            with self.subTest(book_filter):
+                response = self.bulk_update({'filter': book_filter, 'patch': {'status': 'maintenance'}})
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(Book.objects.filter(status='maintenance').exists())
+    
+    def test_ids_update_listed_books_and_count_missing_ones(self):
+        ids = [self.books[0].pk, self.books[1].pk, 999999]
+        response = self.bulk_update({'ids': ids, 'patch': {'status': 'maintenance'}})
+        self.assertEqual(response.json(), {'updated': 2, 'status_changed': 2, 'not_found': 1})
+        self.assertEqual(
+            list(Book.objects.order_by('pk').values_list('status', flat=True)),
+            ['maintenance', 'maintenance', 'available'],
+        )
+    
+    def test_chunks_walk_every_book_once(self):
+        from catalog.signals import books_updated
+        chunks = []
+        
+        def record(sender, book_ids, availability, **kwargs):
+            chunks.append((book_ids, sorted(availability)))
+        
+        books_updated.connect(record)
+        self.addCleanup(books_updated.disconnect, record)
+        # The patch moves books out of the filter as it goes
+        with mock.patch('api.bulk.CHUNK_SIZE', 2):
+            response = self.bulk_update({'filter': {'status': 'available'}, 'patch': {'status': 'maintenance'}})
+        self.assertEqual(response.json(), {'updated': 3, 'status_changed': 3})
+        ids = [book.pk for book in self.books]
+        self.assertEqual(chunks, [(ids[:2], ids[:2]), (ids[2:], ids[2:])])
+    
+    def test_members_cannot_bulk_update(self):
+        self.client.force_authenticate(self.member)
+        response = self.bulk_update({'ids': [self.books[0].pk], 'patch': {'location': 'Z9'}})
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(THROTTLE_ENABLED=True, THROTTLE_STORE='local')
+class ThrottleTests(TestCase):
+    """Token buckets of api/throttling.py"""
+    
+    def setUp(self):
+        from .throttling import local_store
+        local_store.clear()
+        self.addCleanup(local_store.clear)
+        self.staff, self.member, self.books, _ = seed_library()
+        self.client = APIClient()
+    
+    def search(self, user):
+        self.client.force_authenticate(user)
+        return self.client.get('/api/books/', {'search': 'Book'})
+    
+    def login(self, username, address):
+        return APIClient(REMOTE_ADDR=address).post(
+            '/api/auth/login/', {'username': username, 'password': 'wrong'}, format='json',
+        )
+    
+    def test_bucket_refills_at_its_rate(self):
+        from .throttling import LocalBucketStore
+        store = LocalBucketStore()
+        # 2 tokens refilling at one per 30 seconds
+        self.assertEqual([store.take('k', 2, 60, 100.0) for _ in range(2)], [0, 0])
+        self.assertAlmostEqual(store.take('k', 2, 60, 100.0), 30)
+        self.assertAlmostEqual(store.take('k', 2, 60, 115.0), 15)
+        self.assertEqual(store.take('k', 2, 60, 130.0), 0)
+        # A long pause refills the bucket to its capacity, not beyond
+        self.assertEqual([store.take('k', 2, 60, 1000.0) for _ in range(2)], [0, 0])
+        self.assertTrue(store.take('k', 2, 60, 1000.0))
+    
+    def test_prune_drops_full_buckets_and_backs_off(self):
+        from .throttling import LocalBucketStore
+        store = LocalBucketStore()
+        with mock.patch('api.throttling.LOCAL_STORE_MAX_BUCKETS', 4):
+            store.prune_above = 4
+            for key in range(5):
+                store.take(key, 10, 60, 0.0)
+            # Nothing has refilled yet: the next scan waits for the store to double
+            self.assertEqual(len(store.buckets), 5)
+            self.assertEqual(store.prune_above, 10)
+            store.take('late', 10, 60, 60.0)
+            for key in range(6):
+                store.take(f'more-{key}', 10, 60, 60.0)
+            self.assertEqual(sorted(store.buckets), sorted(['late'] + [f'more-{key}' for key in range(6)]))
+    
+    @override_settings(THROTTLE_RATES={'search': {'default': '2/min'}})
+    def test_over_the_limit_answers_429_with_retry_after(self):
+        self.assertEqual([self.search(self.member).status_code for _ in range(2)], [200, 200])
+        response = self.search(self.member)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn(response['Retry-After'], ('29', '30'))
+        # Other users have buckets of their own
+        self.assertEqual(self.search(self.staff).status_code, 200)
+    
+    @override_settings(THROTTLE_RATES={'search': {'default': '1/min', 'staff': '3/min'}})
+    def test_rates_follow_the_callers_role(self):
+        self.assertEqual([self.search(self.member).status_code for _ in range(2)], [200, 429])
+        self.assertEqual([self.search(self.staff).status_code for _ in range(4)], [200, 200, 200, 429])
+    
+    @override_settings(THROTTLE_RATES={'login': {'default': '100/min'}, 'login-username': {'default': '2/hour'}})
+    def test_logins_are_counted_per_username_across_addresses(self):
+        statuses = [self.login('Member', f'10.0.0.{i}').status_code for i in range(3)]
+        self.assertEqual(statuses, [401, 401, 429])
+        self.assertEqual(self.login('librarian', '10.0.0.9').status_code, 401)
+    
+    @override_settings(THROTTLE_RATES={'login': {'default': '2/min'}})
+    def test_forwarded_for_is_ignored_without_trusted_proxies(self):
+        client = APIClient(REMOTE_ADDR='10.0.0.1')
+        statuses = [
+            client.post(
+                '/api/auth/login/', {'username': f'user{i}', 'password': 'x'}, format='json',
+                HTTP_X_FORWARDED_FOR=f'192.0.2.{i}',
+            ).status_code
+            for i in range(3)
+        ]
+        self.assertEqual(statuses, [401, 401, 429])
+
+
+class MetricsAccessTests(TestCase):
+    """Who may read /api/metrics/ (IsStaffOrLocalRequest)"""
+    
+    def setUp(self):
+        self.staff = User.objects.create_user('librarian', password='x', is_staff=True, user_type='staff')
+        self.member = User.objects.create_user('member', password='x')
+    
+    def get(self, user=None, **extra):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        return client.get('/api/metrics/', **extra).status_code
+    
+    def test_local_address_alone_is_not_enough_by_default(self):
+        self.assertEqual(self.get(REMOTE_ADDR='127.0.0.1'), 401)
+        self.assertEqual(self.get(self.member), 403)
+        self.assertEqual(self.get(self.staff), 200)
+    
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_scrapers_present_the_metrics_token(self):
+        self.assertEqual(self.get(HTTP_AUTHORIZATION='Bearer scrape-secret'), 200)
+        self.assertEqual(self.get(HTTP_AUTHORIZATION='Bearer wrong'), 401)
+    
+    @override_settings(METRICS_ALLOWED_IPS=['10.1.2.3'])
+    def test_listed_addresses_need_no_token(self):
+        self.assertEqual(self.get(REMOTE_ADDR='10.1.2.3'), 200)
+        self.assertEqual(self.get(REMOTE_ADDR='10.1.2.4'), 401)
+
+
+class EventStreamTests(TestCase):
+    """In-process broker (api/events.py) and stream tickets"""
+    
+    def setUp(self):
+        self.staff = User.objects.create_user('librarian', password='x', is_staff=True, user_type='staff')
+        self.member = User.objects.create_user('member', password='x')
+    
+    @override_settings(EVENT_STREAM_BUFFER=2)
+    def test_overflowing_buffer_drops_oldest_and_reports_count(self):
+        from .events import EventBroker, format_dropped
+        broker = EventBroker()
+        subscription = broker.subscribe()
+        for i in range(5):
+            broker.publish('book.availability_changed', {'book': i})
+        events, dropped = subscription.drain()
+        self.assertEqual([event['data']['book'] for event in events], [3, 4])
+        self.assertEqual(dropped, 3)
+        self.assertEqual(format_dropped(dropped), 'event: stream.lagged\ndata: {"dropped": 3}\n\n')
+        # The count is reported once
+        self.assertEqual(subscription.drain(), ([], 0))
+    
+    @override_settings(EVENT_STREAM_HISTORY=3)
+    def test_reconnect_replays_history_after_last_event_id(self):
+        from .events import EventBroker
+        broker = EventBroker()
+        published = [broker.publish('transaction.issued', {'id': i}) for i in range(5)]
+        subscription = broker.subscribe(last_event_id=published[2]['id'])
+        events, dropped = subscription.drain()
+        self.assertEqual(events, published[3:])
+        self.assertEqual(dropped, 0)
+        # Events older than the history are gone; a fresh stream replays nothing
+        self.assertEqual(broker.subscribe(last_event_id=0).drain()[0], published[2:])
+        self.assertEqual(broker.subscribe().drain()[0], [])
+    
+    def test_stream_accepts_a_fresh_ticket_only(self):
+        client = APIClient()
+        client.force_authenticate(self.staff)
+        ticket = client.post('/api/stream/ticket/').json()['ticket']
+        client.force_authenticate(None)
+        
+        response = client.get('/api/stream/', {'ticket': ticket})
+        self.assertEqual(response.status_code, 200)
+        response.close()
+        self.assertEqual(client.get('/api/stream/', {'ticket': ticket + 'x'}).status_code, 401)
+        with mock.patch('django.core.signing.time.time', return_value=timezone.now().timestamp() + 61):
+            self.assertEqual(client.get('/api/stream/', {'ticket': ticket}).status_code, 401)
+        # Revoking the user's tokens revokes their tickets too
+        User.objects.filter(pk=self.staff.pk).update(token_version=F('token_version') + 1)
+        self.assertEqual(client.get('/api/stream/', {'ticket': ticket}).status_code, 401)
+    
+    def test_access_tokens_are_not_accepted_in_the_url(self):
+        from rest_framework_simplejwt.tokens import AccessToken
+        token = str(AccessToken.for_user(self.staff))
+        self.assertEqual(APIClient().get('/api/stream/', {'token': token}).status_code, 401)
+    
+    def test_members_get_no_ticket(self):
+        client = APIClient()
+        client.force_authenticate(self.member)
+        self.assertEqual(client.post('/api/stream/ticket/').status_code, 403)
+    
+    def test_profiles_do_not_store_credentials_from_the_query(self):
+        from .profiling import redact_query
+        self.assertEqual(redact_query('since=4&ticket=abc&Token=xyz'), 'since=4&ticket=REDACTED&Token=REDACTED')
+        self.assertEqual(redact_query('search=a%20b&page=2'), 'search=a%20b&page=2')
+
+
+class ThumbnailTests(TestCase):
+    """Cover derivatives built by api/signals.py and their URLs in lists"""
+    
+    def setUp(self):
+        import shutil
+        import tempfile
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings_override = override_settings(MEDIA_ROOT=media, IMAGE_DERIVATIVE_SIZES={'thumb': 30, 'medium': 60})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+        self.staff, self.member, self.books, _ = seed_library()
+        self.book = self.books[0]
+    
+    def cover(self, name='cover.png'):
+        import io
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new('RGB', (120, 160), 'navy').save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+    
+    def test_new_cover_is_built_after_commit(self):
+        from .thumbnails import has_derivatives
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.book.cover_image = self.cover()
+            self.book.save()
+        name = self.book.cover_image.name
+        self.assertFalse(has_derivatives(name))
+        for callback in callbacks:
+            callback()
+        self.assertTrue(has_derivatives(name))
+    
+    def test_saves_that_keep_the_cover_build_nothing(self):
+        self.book.cover_image = self.cover()
+        self.book.save()
+        with mock.patch('api.signals.build_derivatives') as build, self.captureOnCommitCallbacks(execute=True):
+            # A loan saves the book to change its counters
+            Transaction.objects.create(
+                user=self.member, book=Book.objects.get(pk=self.book.pk),
+                due_date=timezone.now().date() + timedelta(days=7), issued_by=self.staff,
+            )
+            self.book.title = 'Renamed'
+            self.book.save()
+        build.assert_not_called()
+        with mock.patch('api.signals.build_derivatives') as build, self.captureOnCommitCallbacks(execute=True):
+            book = Book.objects.get(pk=self.book.pk)
+            book.cover_image = self.cover('other.png')
+            book.save()
+        build.assert_called_once_with(book.cover_image.name)
+    
+    def test_list_has_no_thumbnail_until_derivatives_exist(self):
+        from .thumbnails import derivative_url
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.book.cover_image = self.cover()
+            self.book.save()
+        client = APIClient()
+        client.force_authenticate(self.member)
+        
+        def listed():
+            row = next(row for row in client.get('/api/books/').json()['results'] if row['id'] == self.book.pk)
+            return row['cover_thumb_url'], row['cover_medium_url']
+        
+        # Never the full-size original
+        self.assertEqual(listed(), (None, None))
+        for callback in callbacks:
+            callback()
+        # The build bumped the book generation, so the cached list is not served
+        thumb, medium = listed()
+        self.assertTrue(thumb.endswith(derivative_url(self.book.cover_image, 'thumb')))
+        self.assertTrue(medium.endswith(derivative_url(self.book.cover_image, 'medium')))
+    
+    def test_missing_derivatives_are_remembered_briefly(self):
+        from django.core.files.storage import default_storage
+        from .thumbnails import PENDING_TIMEOUT, build_derivatives, ready_derivative_url
+        self.book.cover_image = self.cover()
+        self.book.save()
+        cover = self.book.cover_image
+        with mock.patch.object(default_storage, 'exists', wraps=default_storage.exists) as exists:
+            self.assertIsNone(ready_derivative_url(cover))
+            self.assertIsNone(ready_derivative_url(cover))
+        self.assertEqual(exists.call_count, 1)
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=time.time() + PENDING_TIMEOUT + 1):
+            with mock.patch.object(default_storage, 'exists', return_value=False) as exists:
+                ready_derivative_url(cover)
+        exists.assert_called_once()
+        # Building overwrites the cached "missing" at once
+        build_derivatives(cover.name)
+        self.assertIsNotNone(ready_derivative_url(cover))
+
+
+class AsyncViewTests(TransactionTestCase):
+    """Queries run by gather_queries on their own connections (api/async_views.py)"""
+    
+    def setUp(self):
+        cache.clear()
+        self.staff = User.objects.create_user('librarian', password='x', is_staff=True, user_type='staff')
+    
+    def test_gathered_queries_reach_the_request_execute_wrappers(self):
+        from .middleware import QueryTracker
+        tracker = QueryTracker()
+        client = APIClient()
+        client.force_authenticate(self.staff)
+        with connection.execute_wrapper(tracker):
+            response = client.get('/api/async/books/statistics/')
+        self.assertEqual(response.status_code, 200)
+        # The four aggregates run on worker threads, each on a connection of its own
+        self.assertEqual(sum(1 for sql in tracker.statements.elements() if 'catalog_book' in sql), 3)
+        self.assertEqual(sum(1 for sql in tracker.statements.elements() if 'transactions_transaction' in sql), 1)
+        self.assertEqual(connection.execute_wrappers, [])
+
+
+class AsyncMiddlewareTests(TransactionTestCase):
+    """The project's middleware runs natively in the ASGI chain (AsyncCapableMiddleware)"""
+    
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user('librarian', password='x', is_staff=True, user_type='staff')
+        self.access = APIClient().post(
+            '/api/auth/login/', {'username': 'librarian', 'password': 'x'}, format='json',
+        ).json()['access']
+    
+    @override_settings(DEBUG=True)
+    def test_async_chain_is_not_adapted(self):
+        # Django logs every handler it has to wrap in sync_to_async/async_to_sync
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            BaseHandler().load_middleware(is_async=True)
+        
+        async def async_view(request):
+            return HttpResponse()
+        
+        for path in settings.MIDDLEWARE:
+            if path.startswith('api.'):
+                self.assertTrue(iscoroutinefunction(import_string(path)(async_view)), path)
+                self.assertFalse(iscoroutinefunction(import_string(path)(lambda request: HttpResponse())), path)
+    
+    @override_settings(METRICS_QUERY_BUDGET=0, METRICS_QUERY_BUDGETS={})
+    async def test_async_request_queries_reach_the_middleware(self):
+        with self.assertLogs('api.middleware', 'WARNING') as logs:
+            response = await AsyncClient().get(
+                '/api/async/books/statistics/', headers={'Authorization': f'Bearer {self.access}'},
+            )
+        self.assertEqual(response.status_code, 200)
+        # The wrappers sit on the request's sync thread, where gather_queries copies them from
+        queries = int(re.search(r'ran (\d+) queries', logs.output[0]).group(1))
+        self.assertGreaterEqual(queries, 4)
+
+
+class MemberTotalsTests(TransactionTestCase):
+    """Own-loan totals count archived loans as well as live ones"""
+    
+    def setUp(self):
+        cache.clear()
+    
+    def test_me_and_dashboard_include_archived_loans(self):
+        staff, member, books, _ = seed_library()
+        now = timezone.now()
+        TransactionHistory.objects.bulk_create([
+            TransactionHistory(
+                original_id=1_000_000 + i, user=member, book=books[0],
+                issue_date=now - timedelta(days=400), due_date=(now - timedelta(days=386)).date(),
+                return_date=now - timedelta(days=390), status='returned', issued_by=staff,
+                returned_to=staff, created_at=now, updated_at=now,
+            )
+            for i in range(4)
+        ])
+        client = APIClient()
+        client.force_authenticate(member)
+        # seed_library lends three books and returns one
+        expected = {'total_books_issued': 7, 'total_books_returned': 5, 'current_fine': 5.0}
+        me = client.get('/api/users/me/').json()
+        self.assertEqual({key: me[key] for key in expected}, expected)
+        own = client.get('/api/dashboard/summary/').json()['me']
+        self.assertEqual({key: own[key] for key in expected}, expected)
+        # The async endpoint queries on worker connections, hence TransactionTestCase
+        me = client.get('/api/async/users/me/').json()
+        self.assertEqual({key: me[key] for key in expected}, expected)
+
+
+class TokenRevocationTests(TestCase):
+    """Cached JWT users (api/authentication.py) and the shared-cache check"""
+    
+    def setUp(self):
+        cache.clear()
+        self.member = User.objects.create_user('member', password='old-password')
+        tokens = APIClient().post(
+            '/api/auth/login/', {'username': 'member', 'password': 'old-password'}, format='json',
+        ).json()
+        self.access, self.refresh = tokens['access'], tokens['refresh']
+    
+    def me(self):
+        return APIClient(HTTP_AUTHORIZATION=f'Bearer {self.access}').get('/api/users/me/').status_code
+    
+    def test_revoked_token_is_refused_although_its_user_was_cached(self):
+        self.assertEqual(self.me(), 200)
+        self.assertEqual(self.me(), 200)
+        self.member.set_password('new-password')
+        self.member.save()
+        self.assertEqual(self.me(), 401)
+        response = APIClient().post('/api/auth/refresh/', {'refresh': self.refresh}, format='json')
+        self.assertEqual(response.status_code, 401)
+    
+    def test_per_process_cache_fails_the_check_when_a_shared_one_is_required(self):
+        from .checks import check_shared_cache
+        with override_settings(CACHE_REQUIRE_SHARED=True):
+            self.assertEqual([error.id for error in check_shared_cache(None)], ['api.E001'])
+            with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp/library-cache',
+            }}):
+                self.assertEqual(check_shared_cache(None), [])
+        with override_settings(CACHE_REQUIRE_SHARED=False):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class ResponseCacheTests(TestCase):
+    """Cached list responses (api/cache.py) and their invalidation by writes"""
+    
+    def setUp(self):
+        cache.clear()
+        self.staff, self.member, self.books, _ = seed_library()
+        self.client = APIClient()
+    
+    def titles(self, user=None):
+        self.client.force_authenticate(user or self.member)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/books/', {'ordering': 'title'})
+        return [row['title'] for row in response.json()['results']], len(ctx.captured_queries)
+    
+    def test_write_invalidates_the_cached_list(self):
+        titles, _ = self.titles()
+        self.assertEqual(titles, ['Book 0', 'Book 1', 'Book 2'])
+        self.assertEqual(self.titles(), (titles, 0))
+        
+        self.client.force_authenticate(self.staff)
+        self.client.patch(f'/api/books/{self.books[1].pk}/', {'title': 'Atlas'}, format='json')
+        titles, queries = self.titles()
+        self.assertEqual(titles, ['Atlas', 'Book 0', 'Book 2'])
+        self.assertGreater(queries, 0)
+    
+    def test_set_based_updates_invalidate_the_cached_list(self):
+        from .bulk import bulk_update_books
+        self.titles()
+        # QuerySet.update() sends no post_save; books_updated bumps the generation instead
+        bulk_update_books(Book.objects.filter(pk=self.books[0].pk), {'status': 'maintenance'})
+        self.client.force_authenticate(self.member)
+        statuses = {row['id']: row['status'] for row in self.client.get('/api/books/').json()['results']}
+        self.assertEqual(statuses[self.books[0].pk], 'maintenance')
+    
+    def test_roles_do_not_share_entries(self):
+        self.titles(self.member)
+        _, queries = self.titles(self.staff)
+        self.assertGreater(queries, 0)
+
+
+class RecommendationBuildTests(TestCase):
+    """python manage.py build_recommendations (api/recommendations.py)"""
+    
+    def setUp(self):
+        self.staff, self.member, books, fiction = seed_library()
+        self.books = books + [
+            Book.objects.create(
+                title=f'Extra {i}', author='Author', publisher='Publisher', isbn=isbn,
+                location='B1', call_number=f'CN-X{i}', category=fiction,
+                price=Decimal('20.00'), total_copies=10, available_copies=10,
+            )
+            for i, isbn in enumerate(['9780596007126', '9781491946008'])
+        ]
+        self.patrons = [User.objects.create_user(f'patron{i}', password='x', user_type='student') for i in range(4)]
+    
+    def lend(self, user, *books):
+        return [
+            Transaction.objects.create(user=user, book=book, due_date=timezone.now().date(), issued_by=self.staff).pk
+            for book in books
+        ]
+    
+    def archive(self, loan_ids):
+        from io import StringIO
+        from django.core.management import call_command
+        long_ago = timezone.now() - timedelta(days=3 * 365)
+        Transaction.objects.filter(pk__in=loan_ids).update(return_date=long_ago, status='returned', fine_amount=0)
+        call_command('archive_transactions', stdout=StringIO())
+    
+    def stored(self):
+        return dict(BookRecommendation.objects.values_list('book_id', 'neighbors'))
+    
+    def test_incremental_build_matches_a_full_rebuild(self):
+        from .recommendations import build_recommendations
+        b0, b1, b2, b3, b4 = self.books
+        p0, p1, p2, p3 = self.patrons
+        self.lend(p0, b0, b1, b2)
+        self.lend(p1, b0, b1)
+        self.lend(p2, b1, b2)
+        build_recommendations(full=True, min_support=1)
+        before = self.stored()
+        
+        # Loans made and archived before the next build runs: none of them is left in Transaction
+        self.archive(self.lend(p3, b0, b3) + self.lend(p2, b3, b4))
+        self.assertEqual(TransactionHistory.objects.count(), 4)
+        
+        written, _ = build_recommendations(min_support=1)
+        incremental = self.stored()
+        self.assertGreater(written, 0)
+        self.assertNotEqual(incremental, before)
+        self.assertIn(b4.pk, incremental)
+        
+        build_recommendations(full=True, min_support=1)
+        self.assertEqual(incremental, self.stored())
+        # Nothing lent since: the next incremental run is a no-op
+        self.assertEqual(build_recommendations(min_support=1), (0, None))
+
+
+class AcquisitionReportTests(TestCase):
+    """compute_forecasts (api/acquisition.py)"""
+    
+    def setUp(self):
+        self.staff, self.member, _, fiction = seed_library()
+        self.book = Book.objects.create(
+            title='Atlas', author='Author', publisher='Publisher', isbn='9780596007126',
+            location='B1', call_number='CN-A', category=fiction,
+            price=Decimal('20.00'), total_copies=2, available_copies=2,
+        )
+        self.now = timezone.now()
+    
+    def lend(self, days_ago, returned_days_ago=None):
+        loan = Transaction.objects.create(
+            user=self.member, book=self.book, due_date=self.now.date(), issued_by=self.staff
+        )
+        returned = None if returned_days_ago is None else self.now - timedelta(days=returned_days_ago)
+        Transaction.objects.filter(pk=loan.pk).update(
+            issue_date=self.now - timedelta(days=days_ago), return_date=returned,
+            status='issued' if returned is None else 'returned',
+        )
+    
+    def forecast(self, **options):
+        from .acquisition import compute_forecasts
+        forecasts = compute_forecasts(now=self.now, **options)
+        return next(forecast for forecast in forecasts if forecast.book_id == self.book.pk)
+    
+    def test_utilization_is_loan_days_over_copy_days(self):
+        self.lend(10, returned_days_ago=4)
+        self.lend(3)
+        # Only the 5 days inside the window count for this one
+        self.lend(35, returned_days_ago=25)
+        forecast = self.forecast(window_days=30)
+        self.assertEqual(forecast.loans, 2)
+        self.assertAlmostEqual(forecast.utilization, (6 + 3 + 5) / (2 * 30), places=4)
+        self.assertAlmostEqual(forecast.average_loan_days, (6 + 10) / 2, places=2)
+    
+    def test_newest_week_ends_now_and_the_short_oldest_week_is_scaled(self):
+        # A 10-day window: the 7 days up to now, then 3 older days
+        self.lend(5)
+        self.assertAlmostEqual(self.forecast(window_days=10, horizon_days=7).forecast_loans, 0.3, places=2)
+        Transaction.objects.all().delete()
+        
+        self.lend(9)
+        # One loan in 3 days is 7/3 a week, carried into the newest week with weight 0.7
+        self.assertAlmostEqual(self.forecast(window_days=10, horizon_days=7).forecast_loans, 0.7 * 7 / 3, places=2)
+    
+    def test_smoothing_favours_recent_weeks(self):
+        for days_ago in (1, 2, 3):
+            self.lend(days_ago)
+        recent = self.forecast(window_days=28, horizon_days=7).forecast_loans
+        Transaction.objects.all().delete()
+        for days_ago in (22, 23, 24):
+            self.lend(days_ago)
+        old = self.forecast(window_days=28, horizon_days=7).forecast_loans
+        # Weights 0.3 for the newest week, 0.7 ** 3 for the oldest of four
+        self.assertAlmostEqual(recent, 3 * 0.3, places=2)
+        self.assertAlmostEqual(old, 3 * 0.7 ** 3, places=2)
+    
+    def test_suggested_copies_carry_the_forecast_at_target_utilization(self):
+        patrons = [User.objects.create_user(f'patron{i}', password='x', user_type='student') for i in range(5)]
+        for patron in patrons:
+            Reservation.objects.create(user=patron, book=self.book, expiry_date=self.now + timedelta(days=7))
+        forecast = self.forecast(horizon_days=30, target_utilization=0.8)
+        # 5 queued loans of the default 14 days, over 30 days at 80%: 70 / 24 -> 3 copies
+        self.assertEqual(forecast.hold_pressure, 2.5)
+        self.assertEqual(forecast.forecast_loans, 5)
+        self.assertEqual(forecast.suggested_copies, 3)
+        self.assertEqual(forecast.copy_delta, 1)
+
+
+class SeedLibraryTests(TestCase):
+    """python manage.py seed_library"""
+    
+    def test_loans_are_logged_as_circulation_events(self):
+        from io import StringIO
+        from django.core.management import call_command
+        call_command('seed_library', users=30, books=40, loans=200, batch_size=64, stdout=StringIO())
+        
+        loans = Transaction.objects.all()
+        returned = loans.filter(return_date__isnull=False)
+        issues = CirculationEvent.objects.filter(kind=CirculationEvent.ISSUE)
+        returns = CirculationEvent.objects.filter(kind=CirculationEvent.RETURN)
+        self.assertEqual(
+            set(issues.values_list('loan_id', 'user_id', 'book_id', 'occurred_at', 'actor_id', 'due_date')),
+            set(loans.values_list('pk', 'user_id', 'book_id', 'issue_date', 'issued_by_id', 'due_date')),
+        )
+        self.assertEqual(
+            set(returns.values_list('loan_id', 'occurred_at', 'actor_id')),
+            set(returned.values_list('pk', 'return_date', 'returned_to_id')),
+        )
+        self.assertEqual(CirculationEvent.objects.count(), loans.count() + returned.count())
+        # Ids came from the counter, so live writes continue after them
+        self.assertEqual(CirculationEventCounter.objects.get().value, CirculationEvent.objects.order_by('-id')[0].id)
+
+
+class ISBNLookupTests(TestCase):
+    """Finding books by any written form of their ISBN"""
+    
+    def setUp(self):
+        self.staff, self.member, self.books, _ = seed_library()
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+    
+    def test_list_filter_matches_hyphenated_isbn_10_and_13(self):
+        for code in ('978-0-306-40615-7', '0-306-40615-2', '0 306 40615 2'):
+            ids = [row['id'] for row in self.client.get('/api/books/', {'isbn': code}).json()['results']]
+            self.assertEqual(ids, [self.books[0].pk], code)
+    
+    def test_lookup_by_isbn_accepts_any_form(self):
+        for code in ('978-0-306-40615-7', '0-306-40615-2', '0306406152'):
+            response = self.client.get(f'/api/books/by-isbn/{code}/')
+            self.assertEqual(response.status_code, 200, code)
+            self.assertEqual(response.json()['id'], self.books[0].pk)
+        self.assertEqual(self.client.get('/api/books/by-isbn/978-0-306-40615-8/').status_code, 404)
+    
+    def test_batch_lookup_answers_each_code_as_sent(self):
+        codes = ['0-262-03384-4', '978-0-13-110362-7', '9791090636071']
+        results = self.client.post('/api/books/by-isbn/', {'codes': codes}, format='json').json()['results']
+        self.assertEqual(results['0-262-03384-4']['id'], self.books[1].pk)
+        self.assertEqual(results['978-0-13-110362-7']['id'], self.books[2].pk)
+        self.assertIsNone(results['9791090636071'])
+
+
+class ConnectionPoolTests(TestCase):
+    """library_backend/db/pool.py, mixed into the SQLite backend"""
+    
+    def setUp(self):
+        import tempfile
+        from django.db.backends.sqlite3 import base
+        from library_backend.db import pool
+        
+        class DatabaseWrapper(pool.PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+            pass
+        
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.settings_dict = {
+            **connection.settings_dict, 'NAME': os.path.join(directory.name, 'pool.sqlite3'),
+            'POOL_SIZE': 2, 'POOL_MAX_AGE': 60,
+        }
+        self.wrapper_class = DatabaseWrapper
+        self.addCleanup(self.drop_pool)
+    
+    @staticmethod
+    def drop_pool():
+        from library_backend.db import pool
+        idle = pool._pools.pop('pool_test', None)
+        if idle is not None:
+            idle.clear()
+    
+    def wrapper(self):
+        wrapper = self.wrapper_class(self.settings_dict, alias='pool_test')
+        self.addCleanup(wrapper.close)
+        return wrapper
+    
+    def test_closed_connection_is_reused_by_the_next_connect(self):
+        first = self.wrapper()
+        first.ensure_connection()
+        raw = first.connection
+        first.close()
+        self.assertEqual(first.pool.idle_count, 1)
+        # Another wrapper (another thread, in production) picks it up
+        second = self.wrapper()
+        second.ensure_connection()
+        self.assertIs(second.connection, raw)
+        self.assertEqual(second.pool.idle_count, 0)
+        with second.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            self.assertEqual(cursor.fetchone(), (1,))
+    
+    def test_broken_and_expired_connections_are_not_reused(self):
+        wrapper = self.wrapper()
+        wrapper.ensure_connection()
+        raw = wrapper.connection
+        wrapper.errors_occurred = True
+        wrapper.close()
+        self.assertEqual(wrapper.pool.idle_count, 0)
+        
+        wrapper.ensure_connection()
+        self.assertIsNot(wrapper.connection, raw)
+        raw = wrapper.connection
+        wrapper.close()
+        self.assertEqual(wrapper.pool.idle_count, 1)
+        later = time.monotonic() + 61
+        with mock.patch('library_backend.db.pool.time.monotonic', return_value=later):
+            wrapper.ensure_connection()
+        self.assertIsNot(wrapper.connection, raw)
+        self.assertEqual(wrapper.pool.idle_count, 0)
+    
+    def test_pool_keeps_at_most_size_idle_connections_and_pings_them(self):
+        from library_backend.db.pool import ConnectionPool
+        pool = ConnectionPool(size=2, max_age=None)
+        connections = [mock.Mock(name=f'connection {i}') for i in range(3)]
+        for raw in connections:
+            pool.release(raw, time.monotonic())
+        self.assertEqual(pool.idle_count, 2)
+        connections[2].close.assert_called_once_with()
+        # Most recently released first; unusable ones are closed and skipped
+        usable = mock.Mock(side_effect=lambda raw: raw is connections[0])
+        self.assertIs(pool.acquire(usable)[0], connections[0])
+        connections[1].close.assert_called_once_with()
+        self.assertEqual(pool.acquire(usable), (None, None))
+
+
+class ProfilingTests(TestCase):
+    """ProfilingMiddleware and the stored reports (api/profiling.py)"""
+    
+    def setUp(self):
+        import shutil
+        import tempfile
+        from rest_framework_simplejwt.tokens import AccessToken
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings = override_settings(
+            PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=0, PROFILING_DIR=directory, PROFILING_MAX_REPORTS=3,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.directory = directory
+        self.staff, self.member, _, _ = seed_library()
+        self.tokens = {user: str(AccessToken.for_user(user)) for user in (self.staff, self.member)}
+    
+    def get(self, path, user=None, **headers):
+        if user is not None:
+            headers['HTTP_AUTHORIZATION'] = f'Bearer {self.tokens[user]}'
+        return APIClient().get(path, **headers)
+    
+    def stored(self):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith('.json'))
+    
+    def test_staff_request_is_profiled_and_readable(self):
+        from .profiling import PHASES
+        response = self.get('/api/books/', self.staff, HTTP_X_PROFILE='1')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('results', response.json())
+        report_id = response['X-Profile-Id']
+        
+        report = self.get(f'/api/profiles/{report_id}/', self.staff).json()
+        self.assertEqual((report['route'], report['user'], report['trigger']), ('book-list', 'librarian', 'request'))
+        self.assertGreater(report['queries']['count'], 0)
+        self.assertEqual(report['queries']['count'], len(report['sql']))
+        self.assertEqual(set(report['phases']), {*PHASES, 'view'})
+        self.assertEqual(self.get('/api/profiles/', self.member).status_code, 403)
+    
+    def test_inline_returns_the_report_instead_of_the_response(self):
+        report = self.get('/api/books/?_profile=inline', self.staff).json()
+        self.assertEqual(report['path'], '/api/books/')
+        self.assertEqual(len(self.stored()), 1)
+    
+    def test_members_and_anonymous_requests_are_not_profiled(self):
+        for user in (self.member, None):
+            response = self.get('/api/books/?_profile=1', user, HTTP_X_PROFILE='inline')
+            self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(self.stored(), [])
+    
+    def test_sampling_profiles_one_in_n_requests_from_anyone(self):
+        client = APIClient(HTTP_AUTHORIZATION=f'Bearer {self.tokens[self.member]}')
+        with override_settings(PROFILING_SAMPLE_RATE=2):
+            sampled = ['X-Profile-Id' in client.get('/api/books/') for _ in range(4)]
+        self.assertEqual(sampled, [False, True, False, True])
+    
+    def test_only_the_newest_reports_are_kept(self):
+        ids = [self.get('/api/books/', self.staff, HTTP_X_PROFILE='1')['X-Profile-Id'] for _ in range(5)]
+        self.assertEqual(len(self.stored()), 3)
+        listed = [row['id'] for row in self.get('/api/profiles/', self.staff).json()]
+        self.assertEqual(listed, ids[:1:-1])
+        self.assertEqual(self.get(f'/api/profiles/{ids[0]}/', self.staff).status_code, 404)
+
+
+class SlowQueryLogTests(TestCase):
+    """api/slow_queries.py and python manage.py slow_queries"""
+    
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.log = os.path.join(directory, 'slow.jsonl')
+        settings = override_settings(SLOW_QUERY_LOG=self.log, SLOW_QUERY_LOG_ENABLED=True)
+        settings.enable()
+        self.addCleanup(settings.disable)
+    
+    def test_normalize_ignores_literals_and_list_lengths(self):
+        same = [
+            "SELECT \"id\" FROM \"catalog_book\" WHERE (\"isbn\" = '978-0' AND \"id\" IN (1, 2))",
+            "SELECT  \"id\" FROM \"catalog_book\"\nWHERE (\"isbn\" = 'it''s' AND \"id\" IN (%s, %s, %s))",
+        ]
+        self.assertEqual(normalize(same[0]), 'SELECT "id" FROM "catalog_book" WHERE ("isbn" = ? AND "id" IN (...))')
+        self.assertEqual({fingerprint(normalize(sql)) for sql in same}, {fingerprint(normalize(same[0]))})
+        self.assertEqual(
+            normalize('INSERT INTO "t" ("a", "b") VALUES (%s, %s), (%s, %s), (%s, %s)'),
+            'INSERT INTO "t" ("a", "b") VALUES (...)',
+        )
+        # Identifiers containing digits are not literals
+        self.assertEqual(normalize('SELECT "t1"."col2" FROM "t1" LIMIT 21'), 'SELECT "t1"."col2" FROM "t1" LIMIT ?')
+        self.assertNotEqual(
+            fingerprint(normalize('SELECT "id" FROM "t" WHERE "a" = 1')),
+            fingerprint(normalize('SELECT "id" FROM "t" WHERE "b" = 1')),
+        )
+    
+    def test_one_orm_call_site_maps_to_one_fingerprint(self):
+        with CaptureQueriesContext(connection) as ctx:
+            for ids in ([1], [1, 2, 3], [7, 8]):
+                list(Book.objects.filter(pk__in=ids, title__startswith=f'T{ids[0]}'))
+        self.assertEqual(len({fingerprint(normalize(query['sql'])) for query in ctx.captured_queries}), 1)
+    
+    def test_log_rotates_to_one_older_file(self):
+        with override_settings(SLOW_QUERY_LOG_MAX_BYTES=200):
+            for n in range(10):
+                write_entry({'n': n, 'padding': 'x' * 40})
+        self.assertLessEqual(os.path.getsize(self.log), 200)
+        self.assertTrue(os.path.exists(self.log + '.1'))
+        numbers = [entry['n'] for entry in read_entries()]
+        # Oldest first; what was rotated out twice is gone
+        self.assertEqual(numbers, sorted(numbers))
+        self.assertEqual(numbers[-1], 9)
+        self.assertLess(len(numbers), 10)
+    
+    def test_requests_log_their_statements_by_route_and_call_site(self):
+        staff, *_ = seed_library()
+        client = APIClient()
+        client.force_authenticate(staff)
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=0), self.assertLogs('api.slow_queries', 'WARNING') as logs:
+            client.get('/api/books/', {'search': 'Book 1'})
+            client.get('/api/books/', {'search': 'Book 2'})
+        entries = [entry for entry in read_entries() if entry['route'] == 'book-list']
+        self.assertTrue(entries)
+        self.assertTrue(all(entry['method'] == 'GET' and entry['origin'] for entry in entries))
+        # Both searches ran the same statements
+        by_fingerprint = {}
+        for entry in entries:
+            by_fingerprint[entry['fingerprint']] = by_fingerprint.get(entry['fingerprint'], 0) + 1
+        self.assertEqual(set(by_fingerprint.values()), {2})
+        self.assertTrue(all(line.startswith('WARNING:api.slow_queries:Slow query') for line in logs.output))
+        
+        out = StringIO()
+        call_command('slow_queries', route='book-list', sort='count', stdout=out)
+        self.assertIn(f'{len(by_fingerprint)} fingerprint(s), {len(entries)} statement(s) logged', out.getvalue())
+        self.assertIn('x GET book-list at api/', out.getvalue())
+
+
+class ReconcileInventoryTests(TestCase):
+    """api/inventory.py and python manage.py reconcile_inventory"""
+    
+    def setUp(self):
+        # Book 0 has one open loan, book 1 one (overdue), book 2 two copies and none out
+        self.staff, self.member, self.books, _ = seed_library()
+    
+    def drift(self, book, **counters):
+        Book.objects.filter(pk=book.pk).update(**counters)
+    
+    def counters(self, book):
+        return Book.objects.filter(pk=book.pk).values_list('status', 'total_copies', 'available_copies').get()
+    
+    def run_command(self, *args):
+        from io import StringIO
+        from django.core.management import call_command
+        out = StringIO()
+        call_command('reconcile_inventory', *args, stdout=out)
+        return out.getvalue()
+    
+    def test_consistent_library_has_no_discrepancies(self):
+        from .inventory import reconcile_inventory
+        self.assertEqual(reconcile_inventory(fix=True), ([], 0))
+        self.assertIn("Every book's counters match its loans", self.run_command())
+    
+    def test_drift_is_reported_and_fixed(self):
+        from .inventory import reconcile_inventory
+        self.drift(self.books[0], available_copies=3)
+        self.drift(self.books[1], available_copies=0, status='issued')
+        self.drift(self.books[2], total_copies=5, available_copies=1)
+        expected = {
+            self.books[0].pk: ('available', 3, 2),
+            self.books[1].pk: ('available', 3, 2),
+            self.books[2].pk: ('available', 2, 2),
+        }
+        
+        discrepancies, updated = reconcile_inventory()
+        self.assertEqual(updated, 0)
+        self.assertEqual(
+            {row['book']: (row['expected_status'], row['expected_total_copies'], row['expected_available_copies'])
+             for row in discrepancies},
+            expected,
+        )
+        self.assertEqual(self.counters(self.books[0]), ('available', 3, 3))
+        
+        with mock.patch('api.events.broker.publish') as publish, self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(reconcile_inventory(fix=True, batch_size=2)[1], 3)
+        for book in self.books:
+            self.assertEqual(self.counters(book), expected[book.pk])
+        published = [call.args[1]['book'] for call in publish.call_args_list if call.args[0] == 'book.availability_changed']
+        self.assertEqual(sorted(published), sorted(expected))
+        self.assertEqual(reconcile_inventory(), ([], 0))
+    
+    def test_fully_lent_book_becomes_issued_and_staff_statuses_are_kept(self):
+        for _ in range(2):
+            Transaction.objects.create(user=self.member, book=self.books[0], due_date=timezone.now().date())
+        self.drift(self.books[0], available_copies=2, status='available')
+        self.drift(self.books[1], available_copies=3, status='maintenance')
+        
+        output = self.run_command('--fix')
+        self.assertIn('Fixed 2 of 2 book(s)', output)
+        self.assertEqual(self.counters(self.books[0]), ('issued', 3, 0))
+        self.assertEqual(self.counters(self.books[1]), ('maintenance', 3, 2))
+    
+    def test_report_lists_each_book_and_leaves_it_alone(self):
+        self.drift(self.books[0], available_copies=3)
+        output = self.run_command()
+        self.assertIn('available 3 -> 2', output)
+        self.assertIn('1 book(s) out of line', output)
+        self.assertEqual(self.counters(self.books[0]), ('available', 3, 3))
+    
+    def test_endpoint_pages_by_book_id_and_post_returns_counts(self):
+        self.drift(self.books[0], available_copies=3)
+        self.drift(self.books[2], total_copies=5)
+        client = APIClient()
+        client.force_authenticate(self.staff)
+        url = '/api/analytics/inventory/'
+        
+        first = client.get(url, {'limit': 2}).json()
+        self.assertEqual([row['book'] for row in first['results']], [self.books[0].pk])
+        self.assertEqual((first['next_after'], first['has_more']), (self.books[1].pk, True))
+        rest = client.get(url, {'limit': 2, 'after': first['next_after']}).json()
+        self.assertEqual([row['book'] for row in rest['results']], [self.books[2].pk])
+        self.assertEqual((rest['next_after'], rest['has_more']), (None, False))
+        self.assertEqual(client.get(url, {'after': 'x'}).status_code, 400)
+        
+        with mock.patch('api.events.broker.publish'), self.captureOnCommitCallbacks(execute=True):
+            response = client.post(url)
+        self.assertEqual(response.json(), {'discrepancies': 2, 'updated': 2})
+        self.assertEqual(client.get(url).json(), {'next_after': None, 'has_more': False, 'results': []})
@@ -0,0 +1,193 @@
+"""
+Token-bucket request throttling per scope and caller role
+
+Every request is assigned at most one scope:
+- the view's ``throttle_scope`` when it sets one. This covers ``login``,
+  ``statistics`` and ``export``, the unpaginated bulk reads.
+- otherwise ``search`` for a GET with a ``?search=`` term
+- otherwise ``writes`` for a non-safe method
+
+Requests outside these scopes are not throttled. ``THROTTLE_RATES`` gives
+each scope a rate per role: ``staff``, a ``user_type`` or ``anonymous``,
+with ``default`` for the rest. A rate of ``N/period`` is a bucket holding N
+tokens that refills at N per period, so a burst of N is allowed after a
+quiet spell.
+
+Buckets are counted per user, or per client address when anonymous. The
+address is ``REMOTE_ADDR`` unless ``NUM_PROXIES`` in ``REST_FRAMEWORK`` says
+how many trusted proxies append to ``X-Forwarded-For``; with the default of
+0 the header is ignored, since a client can send any value in it. Logins
+are also counted per submitted username (scope ``login-username``), so
+guessing one account's password from many addresses is throttled too. By
+default they live in this process (``THROTTLE_STORE=local``), which costs
+a dict lookup under a lock. With several worker processes the effective
+limit is then multiplied by the number of workers; ``THROTTLE_STORE=cache``
+shares the buckets through the default cache instead.
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+
+from . import metrics
+from .cache import request_role
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Buckets kept by the local store before full ones are dropped
+LOCAL_STORE_MAX_BUCKETS = 10000
+
+
+def parse_rate(rate):
+    """``'60/min'`` -> ``(60, 60)``: capacity and refill period in seconds"""
+    count, period = rate.split('/')
+    return int(count), PERIODS[period[0]]
+
+
+class LocalBucketStore:
+    """Buckets in a dict of this process: ``key -> (tokens, updated, full_at)``"""
+    
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.prune_above = LOCAL_STORE_MAX_BUCKETS
+    
+    def take(self, key, capacity, period, now):
+        """Take one token; returns the seconds to wait, or 0 when one was taken"""
+        rate = capacity / period
+        with self.lock:
+            tokens, updated, _ = self.buckets.get(key) or (capacity, now, now)
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / rate
+            if not wait:
+                tokens -= 1
+            self.buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+            if len(self.buckets) > self.prune_above:
+                self.prune(now)
+            return wait
+    
+    def prune(self, now):
+        # A bucket that has refilled completely is the same as a missing one
+        for key, (_, _, full_at) in list(self.buckets.items()):
+            if full_at <= now:
+                del self.buckets[key]
+        # When most buckets are still filling, scan again only once the store
+        # has doubled, so the scans cost O(1) per request on average
+        self.prune_above = max(LOCAL_STORE_MAX_BUCKETS, 2 * len(self.buckets))
+    
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+            self.prune_above = LOCAL_STORE_MAX_BUCKETS
+
+
+class CacheBucketStore:
+    """
+    Buckets in the default cache, shared between processes. Read-modify-write
+    without a lock: concurrent requests may both take the last token, which
+    is an acceptable overshoot for a throttle.
+    """
+    
+    def take(self, key, capacity, period, now):
+        rate = capacity / period
+        cache_key = f'throttle:{key}'
+        tokens, updated = cache.get(cache_key) or (capacity, now)
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        wait = 0 if tokens >= 1 else (1 - tokens) / rate
+        if not wait:
+            tokens -= 1
+        cache.set(cache_key, (tokens, now), period)
+        return wait
+
+
+local_store = LocalBucketStore()
+cache_store = CacheBucketStore()
+
+
+def bucket_store():
+    return cache_store if settings.THROTTLE_STORE == 'cache' else local_store
+
+
+def request_scope(request, view_scope=None):
+    if view_scope:
+        return view_scope
+    if request.method == 'GET' and request.query_params.get('search'):
+        return 'search'
+    if request.method not in SAFE_METHODS:
+        return 'writes'
+    return None
+
+
+def scope_rate(scope, role):
+    rates = settings.THROTTLE_RATES.get(scope, {})
+    return rates.get(role, rates.get('default'))
+
+
+def take_token(scope, role, ident):
+    """Take a token from ``ident``'s bucket in ``scope``; returns the seconds to wait or None"""
+    rate = scope_rate(scope, role)
+    if rate is None:
+        return None
+    capacity, period = parse_rate(rate)
+    wait = bucket_store().take(f'{scope}:{ident}', capacity, period, time.time())
+    if not wait:
+        return None
+    metrics.throttled_requests.inc(scope, role)
+    return wait
+
+
+def check_throttle(request, view_scope=None):
+    """
+    Take a token from the caller's bucket for the request's scope and return
+    the seconds to wait before retrying, or None when the request may proceed
+    """
+    if not settings.THROTTLE_ENABLED:
+        return None
+    scope = request_scope(request, view_scope)
+    if scope is None:
+        return None
+    user = request.user
+    if user and user.is_authenticated:
+        ident = f'user:{user.pk}'
+    else:
+        # BaseThrottle.get_ident honours NUM_PROXIES for X-Forwarded-For
+        ident = f'ip:{BaseThrottle().get_ident(request)}'
+    return take_token(scope, request_role(request), ident)
+
+
+class ScopedTokenBucketThrottle(BaseThrottle):
+    """DRF throttle applying ``check_throttle`` with the view's ``throttle_scope``"""
+    
+    def allow_request(self, request, view):
+        self.wait_seconds = check_throttle(request, getattr(view, 'throttle_scope', None))
+        return self.wait_seconds is None
+    
+    def wait(self):
+        return self.wait_seconds
+
+
+class LoginUsernameThrottle(BaseThrottle):
+    """
+    Throttle logins per submitted username under the ``login-username``
+    scope, whatever address they come from. The username is hashed so any
+    value is a valid cache key.
+    """
+    
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        if not settings.THROTTLE_ENABLED:
+            return True
+        username = request.data.get(get_user_model().USERNAME_FIELD)
+        if not isinstance(username, str) or not username.strip():
+            return True
+        digest = hashlib.sha256(username.strip().lower().encode()).hexdigest()
+        self.wait_seconds = take_token('login-username', request_role(request), f'username:{digest}')
+        return self.wait_seconds is None
+    
+    def wait(self):
+        return self.wait_seconds
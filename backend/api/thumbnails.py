@@ -0,0 +1,134 @@
+"""
+Resized derivatives of uploaded images (book covers, profile pictures)
+
+Each original ``book_covers/foo.jpeg`` gets one file per configured size and
+format, stored next to it as ``book_covers/derivatives/foo_<size>.<ext>``.
+Derivative names are a pure function of the original name, so serializers
+can build URLs without touching the database. Derivatives are built once the
+upload has committed. Until they exist, list serializers return null rather
+than the multi-megabyte original (``ready_derivative_url``); whoever builds
+them bumps the owner's cache generation so cached lists pick them up.
+"""
+import io
+import logging
+import posixpath
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = {'icon': 100, 'thumb': 300, 'medium': 600}
+DEFAULT_FORMATS = ('webp', 'jpeg')
+
+_PIL_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+
+# Seconds a missing derivative is remembered, so list rows don't hit storage each time
+PENDING_TIMEOUT = 30
+
+
+def get_sizes():
+    return getattr(settings, 'IMAGE_DERIVATIVE_SIZES', DEFAULT_SIZES)
+
+
+def get_formats():
+    return getattr(settings, 'IMAGE_DERIVATIVE_FORMATS', DEFAULT_FORMATS)
+
+
+def derivative_name(name, size, fmt='webp'):
+    """Storage name of the ``size``/``fmt`` derivative of the original ``name``"""
+    directory, filename = posixpath.split(name)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, 'derivatives', f'{stem}_{size}.{fmt}')
+
+
+def derivative_url(field_file, size='thumb', fmt='webp'):
+    """URL of a derivative for an ImageField value, or None if there is no image"""
+    if not field_file:
+        return None
+    return default_storage.url(derivative_name(field_file.name, size, fmt))
+
+
+def derivative_urls(field_file):
+    """All derivative URLs of an image, keyed by size then format"""
+    if not field_file:
+        return None
+    return {
+        size: {fmt: derivative_url(field_file, size, fmt) for fmt in get_formats()}
+        for size in get_sizes()
+    }
+
+
+def _ready_key(target):
+    return f'derivative:{target}'
+
+
+def derivative_ready(name, size, fmt='webp'):
+    """
+    Whether a derivative exists. Built ones stay, so a yes is cached for good;
+    a no only for PENDING_TIMEOUT, and ``build_derivatives`` overwrites it.
+    """
+    target = derivative_name(name, size, fmt)
+    ready = cache.get(_ready_key(target))
+    if ready is None:
+        ready = default_storage.exists(target)
+        cache.set(_ready_key(target), ready, None if ready else PENDING_TIMEOUT)
+    return ready
+
+
+def ready_derivative_url(field_file, size='thumb', fmt='webp'):
+    """URL of a derivative, or None if there is no image or it is still being built"""
+    if not field_file or not derivative_ready(field_file.name, size, fmt):
+        return None
+    return derivative_url(field_file, size, fmt)
+
+
+def has_derivatives(name):
+    sizes, formats = get_sizes(), get_formats()
+    return all(
+        default_storage.exists(derivative_name(name, size, fmt))
+        for size in sizes for fmt in formats
+    )
+
+
+def build_derivatives(name, force=False):
+    """
+    Generate every size/format derivative for the stored image ``name``.
+
+    Returns the number of files written. Safe to call in a worker process:
+    it only needs configured settings, not the app registry.
+    """
+    if not force and has_derivatives(name):
+        return 0
+
+    try:
+        with default_storage.open(name, 'rb') as original:
+            image = Image.open(original)
+            image = ImageOps.exif_transpose(image)
+            image.load()
+    except (FileNotFoundError, UnidentifiedImageError, OSError) as exc:
+        logger.warning("Cannot build derivatives for %s: %s", name, exc)
+        return 0
+
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    quality = getattr(settings, 'IMAGE_DERIVATIVE_QUALITY', 80)
+    written = 0
+    for size, edge in get_sizes().items():
+        resized = image.copy()
+        resized.thumbnail((edge, edge), Image.LANCZOS)
+        for fmt in get_formats():
+            buffer = io.BytesIO()
+            resized.save(buffer, _PIL_FORMATS[fmt], quality=quality, optimize=True)
+            target = derivative_name(name, size, fmt)
+            if default_storage.exists(target):
+                default_storage.delete(target)
+            default_storage.save(target, ContentFile(buffer.getvalue()))
+            cache.set(_ready_key(target), True, None)
+            written += 1
+    return written
+
@@ -1,17 +1,27 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import (
-    TokenObtainPairView,
     TokenRefreshView,
     TokenVerifyView,
 )
 
+from . import async_views
 from .views import (
     UserViewSet,
     CategoryViewSet,
     BookViewSet,
+    BookCopyViewSet,
     TransactionViewSet,
     ReservationViewSet,
+    DashboardViewSet,
+    AnalyticsViewSet,
+    CirculationEventViewSet,
+    LoginView,
+    EventStreamView,
+    EventStreamTicketView,
+    MetricsView,
+    ProfileListView,
+    ProfileDetailView,
 )
 
 # DRF Router
@@ -19,15 +29,41 @@ router = DefaultRouter()
 router.register('users', UserViewSet, basename='user')
 router.register('categories', CategoryViewSet, basename='category')
 router.register('books', BookViewSet, basename='book')
+router.register('copies', BookCopyViewSet, basename='copy')
 router.register('transactions', TransactionViewSet, basename='transaction')
 router.register('reservations', ReservationViewSet, basename='reservation')
+router.register('dashboard', DashboardViewSet, basename='dashboard')
+router.register('analytics', AnalyticsViewSet, basename='analytics')
+router.register('events', CirculationEventViewSet, basename='circulation-event')
+
+# Async (ASGI) versions of the read-heavy endpoints, see api/async_views.py
+async_urlpatterns = [
+    path('books/', async_views.book_list, name='async-book-list'),
+    path('books/statistics/', async_views.book_statistics, name='async-book-statistics'),
+    path('transactions/active/', async_views.transactions_active, name='async-transaction-active'),
+    path('transactions/overdue/', async_views.transactions_overdue, name='async-transaction-overdue'),
+    path('transactions/statistics/', async_views.transaction_statistics, name='async-transaction-statistics'),
+    path('users/me/', async_views.me, name='async-user-me'),
+]
 
 urlpatterns = [
     # JWT Authentication
-    path('auth/login/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('auth/login/', LoginView.as_view(), name='token_obtain_pair'),
     path('auth/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('auth/verify/', TokenVerifyView.as_view(), name='token_verify'),
 
+    # Server-sent circulation events for staff dashboards
+    path('stream/', EventStreamView.as_view(), name='event-stream'),
+    path('stream/ticket/', EventStreamTicketView.as_view(), name='event-stream-ticket'),
+
+    # Prometheus metrics (staff, or scrapers with METRICS_TOKEN)
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+
+    # Stored request profiles (staff; see api/profiling.py)
+    path('profiles/', ProfileListView.as_view(), name='profile-list'),
+    path('profiles/<str:report_id>/', ProfileDetailView.as_view(), name='profile-detail'),
+
     # API endpoints
+    path('async/', include(async_urlpatterns)),
     path('', include(router.urls)),
 ]
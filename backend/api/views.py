@@ -1,40 +1,89 @@
+import asyncio
+import heapq
+from operator import attrgetter
+
 from django.shortcuts import render
 
 # Create your views here.
-from rest_framework import viewsets, status, filters
+from rest_framework import mixins, viewsets, status, filters
+from rest_framework.views import APIView
 from rest_framework.decorators import action
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework_simplejwt.views import TokenObtainPairView
 from django.contrib.auth import get_user_model
-from django.db.models import Q, Sum
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.db.models import Count, F, FilteredRelation, Q, Sum
 from django_filters.rest_framework import DjangoFilterBackend
 
-from catalog.models import Category, Book
-from transactions.models import Transaction, Reservation
+from catalog.isbn import InvalidISBN, clean_isbn, normalize_isbn
+from catalog.models import Category, Book, BookCopy, BookDemandForecast, BookRecommendation
+from catalog.querysets import count_subquery
+from library_backend.routers import primary_reads
+from transactions.models import CirculationEvent, Transaction, TransactionHistory, Reservation
 from .serializers import (
     UserSerializer, UserRegistrationSerializer, UserProfileSerializer,
-    CategorySerializer, BookSerializer, BookListSerializer,
-    TransactionSerializer, TransactionCreateSerializer, TransactionReturnSerializer,
-    ReservationSerializer
+    CategorySerializer, BookSerializer, BookListSerializer, BookCopySerializer, BookBulkUpdateSerializer,
+    TransactionSerializer, TransactionHistorySerializer, TransactionCreateSerializer, TransactionReturnSerializer,
+    ReservationSerializer, BookDemandForecastSerializer, CirculationEventSerializer, member_loan_totals,
+)
+from .filters import (
+    BookFilter, TransactionFilter, ReservationFilter, UserFilter, AcquisitionFilter, CirculationEventFilter,
+    isbn_lookup_q
+)
+from .authentication import (
+    CachedJWTAuthentication, MetricsTokenAuthentication, StreamTicketAuthentication, issue_stream_ticket,
 )
-from .filters import BookFilter, TransactionFilter, ReservationFilter, UserFilter
-from .permissions import IsStaffOrReadOnly, IsOwnerOrStaff, IsStaffUser
+from .bulk import bulk_update_books
+from .cache import cache_response, response_cache_key
+from .events import KEEPALIVE, broker, format_dropped, format_event
+from .inventory import reconcile_inventory, scan_discrepancies
+from .pagination import SinceCursorPagination, non_negative_int
+from .metrics import registry
+from .profiling import list_reports, load_report
+from .renderers import EventStreamRenderer
+from .permissions import IsStaffOrReadOnly, IsOwnerOrStaff, IsStaffUser, IsStaffOrLocalRequest, is_staff_request
+from .throttling import LoginUsernameThrottle, ScopedTokenBucketThrottle
 
 User = get_user_model()
 
+TRANSACTION_RELATED = ('user', 'book', 'copy', 'issued_by', 'returned_to')
+
+
+def transaction_history(**filters):
+    """
+    Serialized live and archived transactions matching ``filters``, newest
+    first. Both querysets are already ordered by ``-issue_date``, so they
+    are merged without sorting.
+    """
+    live = Transaction.objects.filter(**filters).select_related(*TRANSACTION_RELATED)
+    archived = TransactionHistory.objects.filter(**filters).select_related(*TRANSACTION_RELATED)
+    by_model = {Transaction: TransactionSerializer(), TransactionHistory: TransactionHistorySerializer()}
+    return [
+        by_model[type(row)].to_representation(row)
+        for row in heapq.merge(live, archived, key=attrgetter('issue_date'), reverse=True)
+    ]
+
 
 class UserViewSet(viewsets.ModelViewSet):
     """
     ViewSet for User model
     Provides CRUD operations for users
     """
-    queryset = User.objects.all()
+    queryset = User.objects.annotate(
+        _books_issued_count=count_subquery(Transaction.objects.filter(return_date__isnull=True), 'user')
+    )
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated, IsStaffOrReadOnly]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_class = UserFilter
     search_fields = ['username', 'email', 'first_name', 'last_name', 'library_card_number']
+    # Set per action through @action(throttle_scope=...), see api/throttling.py
+    throttle_scope = None
     ordering_fields = ['username', 'date_joined', 'user_type']
     ordering = ['-date_joined']
 
@@ -67,19 +116,17 @@ class UserViewSet(viewsets.ModelViewSet):
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
-    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated], throttle_scope='export')
     def transactions(self, request, pk=None):
-        """Get all transactions for a user"""
+        """Get all transactions for a user, including archived ones"""
         user = self.get_object()
-        transactions = Transaction.objects.filter(user=user)
-        serializer = TransactionSerializer(transactions, many=True)
-        return Response(serializer.data)
+        return Response(transaction_history(user=user))
     
     @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
     def reservations(self, request, pk=None):
         """Get all reservations for a user"""
         user = self.get_object()
-        reservations = Reservation.objects.filter(user=user)
+        reservations = Reservation.objects.filter(user=user).select_related('user', 'book')
         serializer = ReservationSerializer(reservations, many=True)
         return Response(serializer.data)
 
@@ -89,7 +136,7 @@ class CategoryViewSet(viewsets.ModelViewSet):
     ViewSet for Category model
     Provides CRUD operations for categories
     """
-    queryset = Category.objects.all()
+    queryset = Category.objects.annotate(_books_count=count_subquery(Book.objects.all(), 'category'))
     serializer_class = CategorySerializer
     permission_classes = [IsAuthenticated, IsStaffOrReadOnly]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
@@ -97,11 +144,15 @@ class CategoryViewSet(viewsets.ModelViewSet):
     ordering_fields = ['name', 'created_at']
     ordering = ['name']
     
+    @cache_response('catalog.Category', 'catalog.Book')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
     @action(detail=True, methods=['get'])
     def books(self, request, pk=None):
         """Get all books in a category"""
         category = self.get_object()
-        books = Book.objects.filter(category=category)
+        books = Book.objects.filter(category=category).select_related('category')
         serializer = BookListSerializer(books, many=True)
         return Response(serializer.data)
 
@@ -119,13 +170,24 @@ class BookViewSet(viewsets.ModelViewSet):
     search_fields = ['title', 'author', 'isbn', 'keywords', 'description']
     ordering_fields = ['title', 'author', 'publication_date', 'added_date']
     ordering = ['-added_date']
+    throttle_scope = None
+    MAX_ISBN_BATCH = 200
     
     def get_serializer_class(self):
         if self.action == 'list':
             return BookListSerializer
         return BookSerializer
     
+    @cache_response('catalog.Book', 'catalog.Category')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @cache_response('catalog.Book', 'catalog.Category')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
     @action(detail=False, methods=['get'])
+    @cache_response('catalog.Book', 'catalog.Category')
     def available(self, request):
         """Get all available books"""
         books = self.queryset.filter(status='available', available_copies__gt=0)
@@ -136,15 +198,99 @@ class BookViewSet(viewsets.ModelViewSet):
         serializer = BookListSerializer(books, many=True)
         return Response(serializer.data)
     
-    @action(detail=True, methods=['get'])
+    @action(detail=False, methods=['get'], url_path=r'by-isbn/(?P<code>[^/]+)')
+    def by_isbn(self, request, code=None):
+        """Look up a book by any ISBN form (ISBN-10, ISBN-13, hyphenated)"""
+        book = self.queryset.filter(isbn_lookup_q([code])).first()
+        if book is None:
+            return Response({'error': 'No book found for this ISBN'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(BookSerializer(book).data)
+    
+    @action(detail=False, methods=['post'], url_path='by-isbn', permission_classes=[IsAuthenticated],
+            throttle_scope='export')
+    def by_isbn_batch(self, request):
+        """Resolve a batch of scanned ISBNs in a single query"""
+        codes = request.data.get('codes')
+        if not isinstance(codes, list) or not codes:
+            return Response({'codes': 'A non-empty list of ISBNs is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(codes) > self.MAX_ISBN_BATCH:
+            return Response(
+                {'codes': f'At most {self.MAX_ISBN_BATCH} ISBNs per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        codes = [str(code) for code in codes]
+        books = list(self.queryset.filter(isbn_lookup_q(codes)))
+        by_isbn13 = {book.isbn: book for book in books}
+        by_isbn10 = {book.isbn_10: book for book in books if book.isbn_10}
+        
+        results = {}
+        for code in codes:
+            try:
+                isbn13, isbn10 = normalize_isbn(code)
+            except InvalidISBN:
+                isbn13, isbn10 = clean_isbn(code), None
+            book = by_isbn13.get(isbn13) or by_isbn10.get(isbn10)
+            results[code] = BookListSerializer(book).data if book else None
+        return Response({'results': results})
+    
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated, IsStaffUser])
+    def bulk_update(self, request):
+        """
+        Apply one patch to many books with set-based UPDATEs:
+        ``{"ids": [...] | "filter": {BookFilter params}, "patch": {field: value}}``
+        """
+        serializer = BookBulkUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        
+        if 'ids' in data:
+            books = Book.objects.filter(pk__in=data['ids'])
+        else:
+            filterset = BookFilter(data=data['filter'], queryset=Book.objects.all(), request=request)
+            # An unknown key would be ignored by the filterset and widen the update
+            unknown = sorted(set(data['filter']) - set(filterset.filters))
+            if unknown:
+                return Response(
+                    {'filter': f"Unknown filters: {', '.join(unknown)}"}, status=status.HTTP_400_BAD_REQUEST
+                )
+            if not filterset.is_valid():
+                return Response({'filter': filterset.errors}, status=status.HTTP_400_BAD_REQUEST)
+            books = filterset.qs
+            # Values a filter method treats as "no filter" (available=false) narrow nothing either
+            if not books.query.where:
+                return Response(
+                    {'filter': "The filter matches every book; give ids or a narrower filter"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        updated, status_changed = bulk_update_books(books, data['patch'])
+        result = {'updated': updated, 'status_changed': status_changed}
+        if 'ids' in data:
+            result['not_found'] = len(set(data['ids'])) - updated
+        return Response(result)
+    
+    @action(detail=True, methods=['get'], throttle_scope='export')
     def transactions(self, request, pk=None):
-        """Get all transactions for a book"""
+        """Get all transactions for a book, including archived ones"""
         book = self.get_object()
-        transactions = Transaction.objects.filter(book=book)
-        serializer = TransactionSerializer(transactions, many=True)
-        return Response(serializer.data)
+        return Response(transaction_history(book=book))
     
-    @action(detail=False, methods=['get'])
+    @action(detail=True, methods=['get'])
+    @cache_response('catalog.Book', 'catalog.BookRecommendation')
+    def similar(self, request, pk=None):
+        """Books most often borrowed by this book's borrowers, best first (see api/recommendations.py)"""
+        book = self.get_object()
+        recommendation = BookRecommendation.objects.filter(book=book).first()
+        neighbors = recommendation.neighbors if recommendation else []
+        books = self.queryset.in_bulk([book_id for book_id, _ in neighbors])
+        return Response([
+            {**BookListSerializer(books[book_id]).data, 'score': score}
+            for book_id, score in neighbors
+            if book_id in books  # deleted since the last build
+        ])
+    
+    @action(detail=False, methods=['get'], throttle_scope='statistics')
+    @cache_response('catalog.Book', 'transactions.Transaction')
     def statistics(self, request):
         """Get book statistics"""
         total_books = Book.objects.count()
@@ -160,12 +306,67 @@ class BookViewSet(viewsets.ModelViewSet):
         })
 
 
+class BookCopyViewSet(viewsets.ModelViewSet):
+    """
+    ViewSet for BookCopy model
+    Manages physical copies and resolves barcode scans at the desk
+    """
+    queryset = BookCopy.objects.select_related('book').all()
+    serializer_class = BookCopySerializer
+    permission_classes = [IsAuthenticated, IsStaffOrReadOnly]
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filterset_fields = ['book', 'state', 'condition']
+    search_fields = ['barcode', 'book__title']
+    ordering_fields = ['barcode', 'created_at']
+    ordering = ['barcode']
+    
+    @action(detail=False, methods=['get'], url_path=r'scan/(?P<barcode>[^/]+)',
+            permission_classes=[IsAuthenticated, IsStaffUser])
+    def scan(self, request, barcode=None):
+        """Resolve a scanned barcode to its copy, book and active loan in one query"""
+        copy = (
+            BookCopy.objects
+            .select_related('book__category')
+            .annotate(active_loan=FilteredRelation(
+                'transactions', condition=Q(transactions__return_date__isnull=True)
+            ))
+            .annotate(
+                loan_id=F('active_loan__id'),
+                loan_user_id=F('active_loan__user_id'),
+                loan_username=F('active_loan__user__username'),
+                loan_issue_date=F('active_loan__issue_date'),
+                loan_due_date=F('active_loan__due_date'),
+                loan_status=F('active_loan__status'),
+            )
+            .filter(barcode=barcode)
+            .first()
+        )
+        if copy is None:
+            return Response({'error': 'Unknown barcode'}, status=status.HTTP_404_NOT_FOUND)
+        
+        active_loan = None
+        if copy.loan_id is not None:
+            active_loan = {
+                'id': copy.loan_id,
+                'user': copy.loan_user_id,
+                'username': copy.loan_username,
+                'issue_date': copy.loan_issue_date,
+                'due_date': copy.loan_due_date,
+                'status': copy.loan_status,
+            }
+        return Response({
+            'copy': BookCopySerializer(copy).data,
+            'book': BookListSerializer(copy.book).data,
+            'active_loan': active_loan,
+        })
+
+
 class TransactionViewSet(viewsets.ModelViewSet):
     """
     ViewSet for Transaction model
     Handles book issue and return operations
     """
-    queryset = Transaction.objects.select_related('user', 'book', 'issued_by', 'returned_to').all()
+    queryset = Transaction.objects.select_related('user', 'book', 'copy', 'issued_by', 'returned_to').all()
     serializer_class = TransactionSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
@@ -173,6 +374,7 @@ class TransactionViewSet(viewsets.ModelViewSet):
     search_fields = ['user__username', 'book__title', 'book__isbn']
     ordering_fields = ['issue_date', 'due_date', 'return_date']
     ordering = ['-issue_date']
+    throttle_scope = None
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -183,7 +385,7 @@ class TransactionViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """Filter queryset based on user role"""
-        if self.request.user.is_staff:
+        if is_staff_request(self.request):
             return self.queryset
         # Non-staff users can only see their own transactions
         return self.queryset.filter(user=self.request.user)
@@ -250,12 +452,14 @@ class TransactionViewSet(viewsets.ModelViewSet):
         serializer = TransactionSerializer(active_transactions, many=True)
         return Response(serializer.data)
     
-    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated, IsStaffUser])
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated, IsStaffUser],
+            throttle_scope='statistics')
+    @cache_response('transactions.Transaction', 'transactions.TransactionHistory')
     def statistics(self, request):
         """Get transaction statistics"""
         from django.utils import timezone
         
-        total_transactions = Transaction.objects.count()
+        total_transactions = Transaction.objects.count() + TransactionHistory.objects.count()
         active_transactions = Transaction.objects.filter(return_date__isnull=True).count()
         overdue_transactions = Transaction.objects.filter(
             return_date__isnull=True,
@@ -289,7 +493,7 @@ class ReservationViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """Filter queryset based on user role"""
-        if self.request.user.is_staff:
+        if is_staff_request(self.request):
             return self.queryset
         # Non-staff users can only see their own reservations
         return self.queryset.filter(user=self.request.user)
@@ -302,7 +506,7 @@ class ReservationViewSet(viewsets.ModelViewSet):
     def cancel(self, request, pk=None):
         """Cancel a reservation"""
         reservation = self.get_object()
-        if reservation.user != request.user and not request.user.is_staff:
+        if reservation.user != request.user and not is_staff_request(request):
             return Response(
                 {'error': 'You can only cancel your own reservations'},
                 status=status.HTTP_403_FORBIDDEN
@@ -324,3 +528,251 @@ class ReservationViewSet(viewsets.ModelViewSet):
             return self.get_paginated_response(serializer.data)
         serializer = ReservationSerializer(active_reservations, many=True)
         return Response(serializer.data)
+
+
+class DashboardViewSet(viewsets.ViewSet):
+    """
+    Everything the dashboard pages show, in one request.
+    The library-wide figures are cached per role; the caller's own loans are not.
+    """
+    permission_classes = [IsAuthenticated]
+    LIBRARY_DEPENDENCIES = (
+        'catalog.Book', 'transactions.Transaction', 'transactions.TransactionHistory',
+        'transactions.Reservation', settings.AUTH_USER_MODEL,
+    )
+    throttle_scope = None
+    
+    @action(detail=False, methods=['get'], throttle_scope='statistics')
+    def summary(self, request):
+        """Library statistics for the caller's role plus the caller's own loans"""
+        key = response_cache_key(self, request, {}, self.LIBRARY_DEPENDENCIES)
+        library = cache.get(key)
+        if library is None:
+            with primary_reads():
+                library = self.library_summary(is_staff_request(request))
+            cache.set(key, library, settings.RESPONSE_CACHE_TIMEOUT)
+        return Response({**library, 'me': self.own_summary(request.user)})
+    
+    def library_summary(self, staff):
+        """One aggregate query per table; members only get the catalogue figures"""
+        from django.utils import timezone
+        
+        books = Book.objects.aggregate(
+            total_books=Count('id'),
+            available_books=Count('id', filter=Q(status='available', available_copies__gt=0)),
+            total_copies=Sum('total_copies', default=0),
+            available_copies=Sum('available_copies', default=0),
+        )
+        if not staff:
+            return {'books': books}
+        
+        now = timezone.localtime()
+        month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        open_loans = Q(return_date__isnull=True)
+        transactions = Transaction.objects.aggregate(
+            live=Count('id'),
+            active_transactions=Count('id', filter=open_loans),
+            overdue_transactions=Count('id', filter=open_loans & Q(due_date__lt=now.date())),
+            issued_this_month=Count('id', filter=Q(issue_date__gte=month_start)),
+            total_unpaid_fines=Sum('fine_amount', filter=Q(fine_paid=False), default=0),
+        )
+        transactions['total_transactions'] = transactions.pop('live') + TransactionHistory.objects.count()
+        transactions['total_unpaid_fines'] = float(transactions['total_unpaid_fines'])
+        books['issued_books'] = transactions['active_transactions']
+        
+        reservations = Reservation.objects.aggregate(
+            total_reservations=Count('id'),
+            active_reservations=Count('id', filter=Q(status='active')),
+        )
+        members = User.objects.exclude(user_type='staff').aggregate(
+            total_members=Count('id'),
+            active_members=Count('id', filter=Q(status='active')),
+            new_this_month=Count('id', filter=Q(date_joined__gte=month_start)),
+        )
+        return {
+            'books': books,
+            'transactions': transactions,
+            'reservations': reservations,
+            'members': members,
+        }
+    
+    def own_summary(self, user):
+        totals = member_loan_totals(user)
+        active_loans = (
+            Transaction.objects.filter(user=user, return_date__isnull=True).select_related(*TRANSACTION_RELATED)
+        )
+        return {
+            **totals,
+            'current_fine': float(totals['current_fine']),
+            'active_loans': TransactionSerializer(active_loans, many=True).data,
+            'active_reservations': Reservation.objects.filter(user=user, status='active').count(),
+        }
+
+
+class AnalyticsViewSet(viewsets.GenericViewSet):
+    """
+    Staff reports. ``acquisition`` ranks books by how many copies they are
+    short (precomputed by ``python manage.py build_acquisition_report``, see
+    api/acquisition.py). ``inventory`` checks books' counters against their
+    loans and copies live (api/inventory.py).
+    """
+    INVENTORY_SCAN_DEFAULT = 1000
+    INVENTORY_SCAN_MAX = 10000
+    queryset = BookDemandForecast.objects.select_related('book__category')
+    serializer_class = BookDemandForecastSerializer
+    permission_classes = [IsAuthenticated, IsStaffUser]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_class = AcquisitionFilter
+    ordering_fields = ['copy_delta', 'utilization', 'hold_pressure', 'forecast_loans', 'loans']
+    ordering = ['-copy_delta', '-hold_pressure']
+    throttle_scope = None
+    
+    @action(detail=False, methods=['get'], throttle_scope='statistics')
+    @cache_response('catalog.BookDemandForecast')
+    def acquisition(self, request):
+        """Books ranked by suggested copy delta, largest shortfall first"""
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+    
+    @action(detail=False, methods=['get', 'post'], throttle_scope='statistics')
+    def inventory(self, request):
+        """
+        GET checks the ``?limit=`` books after book id ``?after=`` and lists
+        those whose available_copies, total_copies or status disagree with
+        their open loans and copies; pass ``next_after`` back to continue.
+        POST corrects every book and returns the counts.
+        """
+        if request.method == 'POST':
+            discrepancies, updated = reconcile_inventory(fix=True)
+            return Response({'discrepancies': len(discrepancies), 'updated': updated})
+        after = non_negative_int(request, 'after', 0)
+        limit = non_negative_int(request, 'limit', self.INVENTORY_SCAN_DEFAULT) or self.INVENTORY_SCAN_DEFAULT
+        results, next_after = scan_discrepancies(after, min(limit, self.INVENTORY_SCAN_MAX))
+        return Response({'next_after': next_after, 'has_more': next_after is not None, 'results': results})
+
+
+class CirculationEventViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+    """
+    The append-only circulation log, oldest first. Jobs keep the
+    ``next_since`` of each page and pass it back as ``?since=`` to read only
+    what happened since their last run (see SinceCursorPagination).
+    """
+    queryset = CirculationEvent.objects.all()
+    serializer_class = CirculationEventSerializer
+    permission_classes = [IsAuthenticated, IsStaffUser]
+    pagination_class = SinceCursorPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = CirculationEventFilter
+
+
+class EventStreamTicketView(APIView):
+    """
+    A short-lived ticket for ``/api/stream/?ticket=``, so the access token
+    never appears in a URL
+    """
+    permission_classes = [IsAuthenticated, IsStaffUser]
+    
+    def post(self, request):
+        return Response({
+            'ticket': issue_stream_ticket(request.user),
+            'expires_in': settings.EVENT_STREAM_TICKET_TTL,
+        })
+
+
+class LoginView(TokenObtainPairView):
+    """
+    JWT login, throttled per client address under the ``login`` scope and
+    per submitted username under ``login-username``
+    """
+    throttle_scope = 'login'
+    throttle_classes = [ScopedTokenBucketThrottle, LoginUsernameThrottle]
+
+
+class EventStreamView(APIView):
+    """
+    Server-sent events for staff dashboards: ``book.availability_changed``,
+    ``transaction.issued``/``transaction.returned`` and ``reservation.*``.
+    EventSource cannot send headers, so it connects with a ``?ticket=`` from
+    EventStreamTicketView. Reconnecting clients resume from ``Last-Event-ID``,
+    or from ``?last_event_id=`` when they reopen with a fresh ticket.
+    """
+    authentication_classes = [StreamTicketAuthentication, CachedJWTAuthentication]
+    permission_classes = [IsAuthenticated, IsStaffUser]
+    renderer_classes = [EventStreamRenderer, JSONRenderer]
+    
+    def get(self, request):
+        try:
+            last_event_id = int(request.headers.get('Last-Event-ID') or request.query_params.get('last_event_id', ''))
+        except ValueError:
+            last_event_id = None
+        
+        if isinstance(request._request, ASGIRequest):
+            stream = self.async_stream(last_event_id)
+        else:
+            stream = self.sync_stream(last_event_id)
+        response = StreamingHttpResponse(stream, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    
+    @staticmethod
+    def messages(subscription):
+        events, dropped = subscription.drain()
+        if dropped:
+            yield format_dropped(dropped)
+        for event in events:
+            yield format_event(event)
+    
+    def sync_stream(self, last_event_id):
+        # Holds a worker thread per connection; serve streams under ASGI in production
+        subscription = broker.subscribe(last_event_id)
+        try:
+            yield f"retry: {settings.EVENT_STREAM_RETRY_MS}\n\n"
+            while True:
+                if subscription.wait(settings.EVENT_STREAM_HEARTBEAT):
+                    yield from self.messages(subscription)
+                else:
+                    yield KEEPALIVE
+        finally:
+            broker.unsubscribe(subscription)
+    
+    async def async_stream(self, last_event_id):
+        subscription = broker.subscribe(last_event_id, loop=asyncio.get_running_loop())
+        try:
+            yield f"retry: {settings.EVENT_STREAM_RETRY_MS}\n\n"
+            while True:
+                if await subscription.wait_async(settings.EVENT_STREAM_HEARTBEAT):
+                    for message in self.messages(subscription):
+                        yield message
+                else:
+                    yield KEEPALIVE
+        finally:
+            broker.unsubscribe(subscription)
+
+
+class MetricsView(APIView):
+    """Request metrics of this process in Prometheus text format"""
+    authentication_classes = [MetricsTokenAuthentication, CachedJWTAuthentication]
+    permission_classes = [IsStaffOrLocalRequest]
+    
+    def get(self, request):
+        return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class ProfileListView(APIView):
+    """Stored request profiles (see api/profiling.py), newest first"""
+    permission_classes = [IsAuthenticated, IsStaffUser]
+    
+    def get(self, request):
+        return Response(list_reports())
+
+
+class ProfileDetailView(APIView):
+    """One stored request profile"""
+    permission_classes = [IsAuthenticated, IsStaffUser]
+    
+    def get(self, request, report_id):
+        report = load_report(report_id)
+        if report is None:
+            return Response({'detail': 'Profile not found.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(report)
@@ -0,0 +1,23 @@
+"""
+Performance benchmarks for the library backend
+
+Each module is runnable from the backend directory, e.g.::
+
+    python -m benchmarks.connection_cost --iterations 500
+"""
+import os
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'library_backend.settings')
+    import django
+    django.setup()
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
@@ -0,0 +1,330 @@
+"""
+End-to-end API benchmarks at several dataset sizes and concurrency levels
+
+By default every dataset size is seeded into a throwaway test database
+(``seed_library``) and requests go through Django's test client, so the
+numbers cover routing, middleware, authentication, serialization and the
+database but not an HTTP server::
+
+    python -m benchmarks.api_suite --sizes small,medium --concurrency 1,8
+
+``--url`` drives a running server instead; seed its database first, start
+the server with ``THROTTLE_ENABLED=False`` and pass a staff account that was
+created there::
+
+    python -m benchmarks.api_suite --url http://127.0.0.1:8000 --username seed_0000012 --password password
+
+Results are compared with the committed baseline (benchmarks/baselines/
+api_suite.json): rows whose p95 latency or throughput moved past
+``--threshold`` are flagged, and ``--fail-on-regression`` turns them into a
+non-zero exit status. ``--output`` writes the results as JSON and
+``--save-baseline`` replaces the baseline. Baselines are only comparable
+between runs on the same machine and database backend.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+
+from . import percentile, setup_django
+from .client import HTTPClient, obtain_token
+
+BASELINE = Path(__file__).resolve().parent / 'baselines' / 'api_suite.json'
+
+# seed_library options per dataset size
+SIZES = {
+    'small': {'users': 200, 'books': 1000, 'loans': 10000},
+    'medium': {'users': 2000, 'books': 10000, 'loans': 100000},
+    'large': {'users': 20000, 'books': 100000, 'loans': 1000000},
+}
+SEED_PASSWORD = 'benchmark'
+
+ENDPOINTS = {
+    'book_list': '/api/books/',
+    'book_search': '/api/books/?search=garden',
+    'book_statistics': '/api/books/statistics/',
+    'transaction_statistics': '/api/transactions/statistics/',
+    'me': '/api/users/me/',
+    # One issue_book followed by the return_book of that loan
+    'issue_return': None,
+}
+
+
+class DjangoClient(threading.local):
+    """In-process counterpart of ``HTTPClient``: one test client per thread"""
+    
+    def __init__(self, token=None):
+        from django.test import Client
+        self.client = Client(**({'HTTP_AUTHORIZATION': f'Bearer {token}'} if token else {}))
+    
+    def request(self, method, path, data=None):
+        response = self.client.generic(
+            method, path, json.dumps(data) if data is not None else '', content_type='application/json'
+        )
+        return response.status_code, response.content
+    
+    def get(self, path):
+        return self.request('GET', path)[0]
+
+
+class Circulation:
+    """
+    Issues a book and returns it again. Iterations spread over many readers
+    and titles so concurrent ones don't compete for the same copy.
+    """
+    
+    def __init__(self, client):
+        self.due_date = str(date.today() + timedelta(days=14))
+        # Readers with room for more than one loan, since concurrent iterations may share one
+        self.readers = self.collect(
+            client, '/api/users/?user_type=student&status=active',
+            lambda user: user['max_books_allowed'] - user['books_issued_count'] > 1,
+        )
+        self.books = self.collect(client, '/api/books/available/')
+        if not (self.readers and self.books):
+            raise SystemExit("issue_return needs active students and available books in the database")
+    
+    @staticmethod
+    def collect(client, path, keep=lambda row: True, pages=10):
+        ids = []
+        for page in range(1, pages + 1):
+            status, content = client.request('GET', f"{path}{'&' if '?' in path else '?'}page={page}")
+            if status != 200:
+                break
+            data = json.loads(content)
+            ids.extend(row['id'] for row in data['results'] if keep(row))
+            if not data['next']:
+                break
+        return ids
+    
+    def __call__(self, client, index):
+        status, content = client.request('POST', '/api/transactions/issue_book/', {
+            'user': self.readers[index % len(self.readers)],
+            'book': self.books[index % len(self.books)],
+            'due_date': self.due_date,
+        })
+        if status != 201:
+            return False
+        status, _ = client.request('POST', '/api/transactions/return_book/', {
+            'transaction_id': json.loads(content)['id'],
+        })
+        return status == 200
+
+
+def run_case(client, operation, requests, concurrency):
+    def one(index):
+        start = time.perf_counter()
+        try:
+            ok = operation(client, index)
+        except Exception:
+            ok = False
+        return (time.perf_counter() - start) * 1000, ok
+    
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+    
+    samples = [ms for ms, ok in results if ok]
+    return {
+        'requests': requests,
+        'errors': len(results) - len(samples),
+        'rps': round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(samples, 50), 2),
+        'p95_ms': round(percentile(samples, 95), 2),
+        'p99_ms': round(percentile(samples, 99), 2),
+    }
+
+
+def operation_for(name, path, client, cached):
+    if path is None:
+        return Circulation(client)
+    separator = '&' if '?' in path else '?'
+    if cached:
+        return lambda client, index: client.get(path) == 200
+    # A unique throwaway parameter gives every request its own response cache key
+    return lambda client, index: client.get(f'{path}{separator}_bench={index}') == 200
+
+
+def bench_dataset(make_client, token, args):
+    rows = []
+    login_client = make_client(token)
+    for concurrency in args.concurrency:
+        for name in args.endpoint or ENDPOINTS:
+            operation = operation_for(name, ENDPOINTS[name], login_client, args.cached)
+            client = make_client(token)
+            run_case(client, operation, min(20, args.requests), concurrency)  # warm up
+            rows.append({
+                'endpoint': name, 'concurrency': concurrency,
+                **run_case(client, operation, args.requests, concurrency),
+            })
+    return rows
+
+
+def seed_dataset(size):
+    from django.contrib.auth import get_user_model
+    from django.core.cache import cache
+    from django.core.management import call_command
+    
+    call_command('flush', interactive=False, verbosity=0)
+    cache.clear()
+    started = time.monotonic()
+    call_command('seed_library', password=SEED_PASSWORD, stdout=io.StringIO(), **SIZES[size])
+    print(f"Seeded '{size}' ({', '.join(f'{k}={v}' for k, v in SIZES[size].items())}) "
+          f"in {time.monotonic() - started:.0f}s")
+    return get_user_model().objects.filter(username__startswith='seed_', is_staff=True).order_by('username').first()
+
+
+def run_in_process(args):
+    setup_django()
+    from django.db import connection
+    from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+    
+    # DEBUG off, as in production: no per-query logging. No throttling either,
+    # since one user sends every request
+    setup_test_environment(debug=False)
+    override_settings(THROTTLE_ENABLED=False).enable()
+    temp_dir = None
+    if connection.vendor == 'sqlite':
+        # A file rather than the shared in-memory database, so threads can write concurrently
+        temp_dir = tempfile.TemporaryDirectory()
+        connection.settings_dict['TEST']['NAME'] = os.path.join(temp_dir.name, 'benchmark.sqlite3')
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        results = []
+        for size in args.sizes:
+            staff = seed_dataset(size)
+            token = obtain_token(DjangoClient(), staff.username, SEED_PASSWORD)
+            for row in bench_dataset(DjangoClient, token, args):
+                results.append({'size': size, **row})
+                print_row(results[-1])
+        return results, connection.vendor
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+
+def run_against_server(args):
+    if not (args.username and args.password):
+        raise SystemExit("--url needs --username and --password")
+    token = obtain_token(HTTPClient(args.url), args.username, args.password)
+    results = []
+    for row in bench_dataset(lambda token: HTTPClient(args.url, token), token, args):
+        results.append({'size': args.label, **row})
+        print_row(results[-1])
+    return results, 'server'
+
+
+def print_row(row, note=''):
+    print(f"{row['size']:<8} {row['endpoint']:<24} {row['concurrency']:>4} {row['rps']:>9.1f} "
+          + ' '.join(f"{row[key]:>8.1f}ms" for key in ('p50_ms', 'p95_ms', 'p99_ms'))
+          + f" {row['errors']:>6}{note}")
+
+
+def compare(results, baseline, threshold):
+    """Rows slower than the baseline by more than ``threshold``, with a description each"""
+    previous = {(row['size'], row['endpoint'], row['concurrency']): row for row in baseline['results']}
+    regressions = []
+    for row in results:
+        base = previous.get((row['size'], row['endpoint'], row['concurrency']))
+        if base is None:
+            continue
+        problems = []
+        if base['p95_ms'] and row['p95_ms'] > base['p95_ms'] * (1 + threshold):
+            problems.append(f"p95 {base['p95_ms']:.1f}ms -> {row['p95_ms']:.1f}ms")
+        if base['rps'] and row['rps'] < base['rps'] * (1 - threshold):
+            problems.append(f"rps {base['rps']:.1f} -> {row['rps']:.1f}")
+        if row['errors'] > base['errors']:
+            problems.append(f"errors {base['errors']} -> {row['errors']}")
+        if problems:
+            regressions.append(f"{row['size']} {row['endpoint']} c={row['concurrency']}: {', '.join(problems)}")
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def csv_list(cast=str):
+    return lambda value: [cast(item) for item in value.split(',') if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=csv_list(), default=['small'],
+                        help=f"Comma-separated dataset sizes: {', '.join(SIZES)} (default: small)")
+    parser.add_argument('--concurrency', type=csv_list(int), default=[1, 8],
+                        help="Comma-separated concurrency levels (default: 1,8)")
+    parser.add_argument('--requests', type=int, default=200, help="Requests per endpoint and level")
+    parser.add_argument('--endpoint', action='append', choices=sorted(ENDPOINTS),
+                        help="Only run these endpoints (repeatable)")
+    parser.add_argument('--cached', action='store_true', help="Allow response cache hits")
+    parser.add_argument('--url', help="Benchmark a running server instead of an in-process test database")
+    parser.add_argument('--label', default='server', help="Dataset label for --url results")
+    parser.add_argument('--username', help="Staff account on the --url server")
+    parser.add_argument('--password')
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    parser.add_argument('--baseline', default=str(BASELINE), help="Baseline to compare with")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="Relative change in p95 or throughput that counts as a regression (default: 0.25)")
+    parser.add_argument('--fail-on-regression', action='store_true')
+    parser.add_argument('--save-baseline', action='store_true', help="Write the results to --baseline")
+    args = parser.parse_args()
+    
+    unknown = set(args.sizes) - set(SIZES)
+    if unknown:
+        parser.error(f"unknown size(s): {', '.join(sorted(unknown))}")
+    
+    print(f"{'size':<8} {'endpoint':<24} {'conc':>4} {'req/s':>9} "
+          f"{'p50':>10} {'p95':>10} {'p99':>10} {'errors':>6}")
+    results, database = run_against_server(args) if args.url else run_in_process(args)
+    report = {
+        'revision': git_revision(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'database': database,
+        'requests': args.requests,
+        'cached': args.cached,
+        'results': results,
+    }
+    
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + '\n')
+    if args.save_baseline:
+        Path(args.baseline).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.baseline).write_text(json.dumps(report, indent=2) + '\n')
+        print(f"Saved baseline to {args.baseline}")
+        return
+    
+    if not Path(args.baseline).exists():
+        print("No baseline to compare with; create one with --save-baseline")
+        return
+    baseline = json.loads(Path(args.baseline).read_text())
+    regressions = compare(results, baseline, args.threshold)
+    print(f"\nCompared with baseline {baseline.get('revision') or ''} ({baseline.get('created')}, "
+          f"{baseline.get('database')}): {len(regressions)} regression(s)")
+    for line in regressions:
+        print(f"  {line}")
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Load test: sync (WSGI) endpoints against their async (ASGI) versions
+
+Start both stacks with the same number of worker processes and throttling
+off, e.g.::
+
+    export THROTTLE_ENABLED=False
+    gunicorn library_backend.wsgi -w 4 -b 127.0.0.1:8000
+    gunicorn library_backend.asgi -w 4 -k uvicorn.workers.UvicornWorker -b 127.0.0.1:8001
+
+then drive each endpoint on both with the same concurrency::
+
+    python -m benchmarks.async_load --username admin --password secret --concurrency 64 [--json]
+
+Every request carries a unique throwaway query parameter so the response
+cache is bypassed and both stacks do the full database work; pass
+``--cached`` to measure cache hits instead.
+"""
+import argparse
+import http.client
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import percentile
+from .client import HTTPClient, obtain_token
+
+# name -> path on the sync stack; the async stack serves it under /api/async/
+ENDPOINTS = {
+    'book_list': '/api/books/?search=the',
+    'book_statistics': '/api/books/statistics/',
+    'me': '/api/users/me/',
+    'transactions_active': '/api/transactions/active/',
+    'transactions_overdue': '/api/transactions/overdue/',
+    'transaction_statistics': '/api/transactions/statistics/',
+}
+
+
+def async_path(path):
+    return '/api/async/' + path[len('/api/'):]
+
+
+def run_load(base_url, token, path, requests, concurrency, cached):
+    client = HTTPClient(base_url, token)
+    separator = '&' if '?' in path else '?'
+    
+    def one(index):
+        url = path if cached else f'{path}{separator}nocache={index}'
+        start = time.perf_counter()
+        try:
+            ok = client.get(url) == 200
+        except (http.client.HTTPException, OSError):
+            ok = False
+        return (time.perf_counter() - start) * 1000, ok
+    
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+    
+    samples = [ms for ms, ok in results if ok]
+    return {
+        'requests': requests,
+        'errors': sum(1 for _, ok in results if not ok),
+        'rps': len(samples) / elapsed if elapsed else 0.0,
+        'mean_ms': statistics.fmean(samples) if samples else 0.0,
+        'p50_ms': percentile(samples, 50),
+        'p95_ms': percentile(samples, 95),
+        'p99_ms': percentile(samples, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sync-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--async-url', default='http://127.0.0.1:8001')
+    parser.add_argument('--username', help="Staff account used to obtain a JWT")
+    parser.add_argument('--password')
+    parser.add_argument('--token', help="Use this access token instead of logging in")
+    parser.add_argument('--requests', type=int, default=1000, help="Requests per endpoint and stack")
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--endpoint', action='append', choices=sorted(ENDPOINTS),
+                        help="Only run these endpoints (repeatable)")
+    parser.add_argument('--cached', action='store_true', help="Allow response cache hits")
+    parser.add_argument('--json', action='store_true', help="Print machine-readable results")
+    args = parser.parse_args()
+    
+    token = args.token
+    if not token:
+        if not (args.username and args.password):
+            parser.error("pass --token or --username/--password")
+        token = obtain_token(HTTPClient(args.sync_url), args.username, args.password)
+    
+    results = {}
+    for name in args.endpoint or ENDPOINTS:
+        path = ENDPOINTS[name]
+        results[name] = {}
+        for stack, base_url, stack_path in (
+            ('sync', args.sync_url, path),
+            ('async', args.async_url, async_path(path)),
+        ):
+            run_load(base_url, token, stack_path, min(50, args.requests), args.concurrency, args.cached)  # warm up
+            results[name][stack] = run_load(
+                base_url, token, stack_path, args.requests, args.concurrency, args.cached
+            )
+    
+    if args.json:
+        print(json.dumps({
+            'requests': args.requests, 'concurrency': args.concurrency,
+            'cached': args.cached, 'results': results,
+        }, indent=2))
+        return
+    
+    print(f"{args.requests} requests per endpoint, concurrency {args.concurrency}")
+    print(f"{'endpoint':<24} {'stack':<6} {'req/s':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'errors':>7}")
+    for name, stacks in results.items():
+        for stack, result in stacks.items():
+            print(f"{name:<24} {stack:<6} {result['rps']:>9.1f} " + ' '.join(
+                f"{result[key]:>7.1f}ms" for key in ('p50_ms', 'p95_ms', 'p99_ms')
+            ) + f" {result['errors']:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Minimal HTTP/JSON client for driving a running server from load-generating threads
+"""
+import http.client
+import json
+import threading
+from urllib.parse import urlsplit
+
+
+class HTTPClient(threading.local):
+    """One keep-alive connection per load-generating thread"""
+    
+    def __init__(self, base_url, token=None):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.headers = {'Authorization': f'Bearer {token}'} if token else {}
+        self.conn = None
+    
+    def request(self, method, path, data=None):
+        """Send a request and return ``(status, body bytes)``"""
+        headers = dict(self.headers)
+        body = None
+        if data is not None:
+            body = json.dumps(data)
+            headers['Content-Type'] = 'application/json'
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            try:
+                self.conn.request(method, path, body, headers)
+                response = self.conn.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, OSError):
+                # Server closed the keep-alive connection; retry once on a new one
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+    
+    def get(self, path):
+        return self.request('GET', path)[0]
+
+
+def obtain_token(client, username, password):
+    """Log in through /api/auth/login/ and return the access token"""
+    status, content = client.request('POST', '/api/auth/login/', {'username': username, 'password': password})
+    data = json.loads(content or b'{}')
+    if status != 200:
+        raise SystemExit(f"Login failed ({status}): {data}")
+    return data['access']
@@ -0,0 +1,87 @@
+"""
+Per-request database connection cost
+
+Simulates the request lifecycle (request_started -> one query ->
+request_finished) and times it with connections closed after every request,
+with persistent connections (CONN_MAX_AGE) and with the in-process pool.
+
+    python -m benchmarks.connection_cost --iterations 500 [--json]
+"""
+import argparse
+import json
+import statistics
+import time
+
+from . import percentile, setup_django
+
+POOLED_ENGINES = {
+    'mysql': 'library_backend.db.mysql_pool',
+}
+
+
+def run_mode(alias, iterations):
+    from django.core.signals import request_finished, request_started
+    from django.db import connections
+    
+    connection = connections[alias]
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        request_started.send(sender=None)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+        request_finished.send(sender=None)
+        samples.append((time.perf_counter() - start) * 1000)
+    connection.close()
+    return {
+        'mean_ms': statistics.fmean(samples),
+        'p50_ms': percentile(samples, 50),
+        'p95_ms': percentile(samples, 95),
+        'p99_ms': percentile(samples, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--max-age', type=int, default=60, help="CONN_MAX_AGE for the persistent mode")
+    parser.add_argument('--json', action='store_true', help="Print machine-readable results")
+    args = parser.parse_args()
+    
+    setup_django()
+    from django.db import connections
+    
+    base = dict(connections['default'].settings_dict)
+    vendor = connections['default'].vendor
+    modes = {
+        'per_request': {**base, 'CONN_MAX_AGE': 0},
+        'persistent': {**base, 'CONN_MAX_AGE': args.max_age},
+    }
+    if vendor in POOLED_ENGINES:
+        modes['pooled'] = {**base, 'ENGINE': POOLED_ENGINES[vendor], 'CONN_MAX_AGE': 0,
+                           'POOL_SIZE': base.get('POOL_SIZE') or 10}
+    
+    results = {}
+    for name, settings_dict in modes.items():
+        alias = f'bench_{name}'
+        connections.settings[alias] = settings_dict
+        run_mode(alias, min(20, args.iterations))  # warm up
+        results[name] = run_mode(alias, args.iterations)
+    
+    if args.json:
+        print(json.dumps({'vendor': vendor, 'iterations': args.iterations, 'results': results}, indent=2))
+        return
+    
+    print(f"{vendor}: {args.iterations} simulated requests per mode")
+    print(f"{'mode':<12} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for name, result in results.items():
+        print(f"{name:<12} " + ' '.join(
+            f"{result[key]:>7.3f}ms" for key in ('mean_ms', 'p50_ms', 'p95_ms', 'p99_ms')
+        ))
+    if 'pooled' not in results:
+        print(f"(no pooled backend for {vendor}; pooled mode skipped)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+Offline quality and timing benchmark for the co-borrow recommender
+
+Generates a synthetic borrowing history where each patron reads mostly from
+a few favourite topics, with popularity skewed within every topic. One
+borrowed book per patron is held out. The patron's other books are indexed
+with ``CoBorrowIndex`` (api/recommendations.py), and every neighbour list is
+computed::
+
+    python -m benchmarks.recommendations --users 5000 --books 20000 --loans 200000
+
+The benchmark reports:
+- time to build the index and all neighbour lists
+- hit rate at K: how often the held-out book is among the K books
+  recommended from the patron's other books, by summing the scores of their
+  neighbours. A recommend-the-bestsellers baseline is shown for comparison.
+- time for an incremental rebuild after ``--new-loans`` more loans
+
+No database is needed.
+"""
+import argparse
+import random
+import time
+from collections import Counter, defaultdict
+from itertools import accumulate
+
+from . import setup_django
+
+
+def synthetic_history(users, books, loans, topics, seed):
+    """``(user, book)`` pairs: 80% from the patron's favourite topics, Zipf-skewed"""
+    rng = random.Random(seed)
+    topic_books = defaultdict(list)
+    for book in range(books):
+        topic_books[book % topics].append(book)
+    # Popularity within a topic falls off with rank
+    cum_weights = {
+        topic: list(accumulate(1 / (rank + 1) ** 1.1 for rank in range(len(members))))
+        for topic, members in topic_books.items()
+    }
+    global_weights = list(accumulate(1 / (rank + 1) ** 1.1 for rank in range(books)))
+    favourites = [rng.sample(range(topics), rng.randint(1, 3)) for _ in range(users)]
+    
+    pairs = []
+    for _ in range(loans):
+        user = rng.randrange(users)
+        if rng.random() < 0.8:
+            topic = rng.choice(favourites[user])
+            book = rng.choices(topic_books[topic], cum_weights=cum_weights[topic])[0]
+        else:
+            book = rng.choices(range(books), cum_weights=global_weights)[0]
+        pairs.append((user, book))
+    return pairs
+
+
+def hold_out(pairs, seed):
+    """Split off one book per patron with at least three distinct books"""
+    rng = random.Random(seed)
+    baskets = defaultdict(set)
+    for user, book in pairs:
+        baskets[user].add(book)
+    held_out = {
+        user: rng.choice(sorted(basket)) for user, basket in baskets.items() if len(basket) >= 3
+    }
+    training = [(user, book) for user, book in pairs if held_out.get(user) != book]
+    return training, held_out, baskets
+
+
+def evaluate(neighbor_lists, popularity, held_out, baskets, k, sample, seed):
+    """Hit rate at ``k`` of the recommender and of the popularity baseline"""
+    rng = random.Random(seed)
+    users = sorted(held_out)
+    users = rng.sample(users, min(sample, len(users)))
+    hits = baseline_hits = 0
+    for user in users:
+        seen = baskets[user] - {held_out[user]}
+        scores = Counter()
+        for book in seen:
+            for other, score in neighbor_lists.get(book, ()):
+                if other not in seen:
+                    scores[other] += score
+        recommended = [book for book, _ in scores.most_common(k)]
+        hits += held_out[user] in recommended
+        bestsellers = [book for book in popularity if book not in seen][:k]
+        baseline_hits += held_out[user] in bestsellers
+    return hits / len(users), baseline_hits / len(users), len(users)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--books', type=int, default=20000)
+    parser.add_argument('--loans', type=int, default=200000)
+    parser.add_argument('--topics', type=int, default=200)
+    parser.add_argument('--neighbors', type=int, default=20, help="Neighbours kept per book (K)")
+    parser.add_argument('--min-support', type=int, default=2)
+    parser.add_argument('--eval-users', type=int, default=2000, help="Patrons sampled for the hit rate")
+    parser.add_argument('--new-loans', type=int, default=1000, help="Loans added before the incremental rebuild")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    
+    setup_django()
+    from api.recommendations import CoBorrowIndex
+    
+    pairs = synthetic_history(args.users, args.books, args.loans, args.topics, args.seed)
+    training, held_out, baskets = hold_out(pairs, args.seed)
+    print(f"{args.users} patrons, {args.books} books, {args.loans} loans, {args.topics} topics; "
+          f"{len(held_out)} patrons with a held-out book")
+    
+    started = time.perf_counter()
+    index = CoBorrowIndex(training)
+    index_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    rows = dict(index.rows(range(len(index)), args.neighbors, args.min_support))
+    rows_seconds = time.perf_counter() - started
+    print(f"Index: {index_seconds:.2f}s; neighbour lists for {len(rows)} books: {rows_seconds:.2f}s "
+          f"({len(rows) / rows_seconds:.0f} books/s)")
+    print(f"Books with recommendations: {sum(1 for row in rows.values() if row)} "
+          f"(average {sum(len(row) for row in rows.values()) / max(len(rows), 1):.1f} neighbours)")
+    
+    popularity = [book for book, _ in Counter(book for _, book in set(training)).most_common()]
+    hit_rate, baseline, sampled = evaluate(
+        rows, popularity, held_out, baskets, args.neighbors, args.eval_users, args.seed
+    )
+    print(f"Hit rate@{args.neighbors} over {sampled} patrons: {hit_rate:.3f} "
+          f"(most-popular baseline {baseline:.3f})")
+    
+    rng = random.Random(args.seed + 1)
+    new_pairs = [(rng.randrange(args.users), rng.randrange(args.books)) for _ in range(args.new_loans)]
+    started = time.perf_counter()
+    index = CoBorrowIndex(training + new_pairs)
+    affected = index.affected_by({book for _, book in new_pairs})
+    for _ in index.rows(sorted(affected), args.neighbors, args.min_support):
+        pass
+    print(f"Incremental rebuild after {args.new_loans} loans: {len(affected)} of {len(index)} books "
+          f"recomputed in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Category, Book
+from .models import Category, Book, BookCopy
+from .querysets import count_subquery
 
 
 @admin.register(Category)
@@ -7,6 +8,21 @@ class CategoryAdmin(admin.ModelAdmin):
     list_display = ('name', 'books_count', 'created_at')
     search_fields = ('name', 'description')
     ordering = ('name',)
+    
+    def get_queryset(self, request):
+        # One correlated subquery instead of a COUNT per row (Category.books_count reads it)
+        return super().get_queryset(request).annotate(_books_count=count_subquery(Book.objects.all(), 'category'))
+    
+    def books_count(self, obj):
+        return obj.books_count
+    books_count.short_description = "Books"
+    books_count.admin_order_field = '_books_count'
+
+
+class BookCopyInline(admin.TabularInline):
+    model = BookCopy
+    extra = 0
+    fields = ('barcode', 'condition', 'location', 'state', 'acquired_date')
 
 
 @admin.register(Book)
@@ -16,6 +32,11 @@ class BookAdmin(admin.ModelAdmin):
     search_fields = ('title', 'author', 'isbn', 'isbn_10', 'call_number', 'keywords')
     ordering = ('-created_at',)
     readonly_fields = ('added_date', 'created_at', 'updated_at')
+    list_select_related = ('category',)
+    autocomplete_fields = ('category',)
+    # Skip the unfiltered COUNT(*) over the whole table on every changelist page
+    show_full_result_count = False
+    inlines = [BookCopyInline]
     
     fieldsets = (
         ('Basic Information', {
@@ -40,4 +61,15 @@ class BookAdmin(admin.ModelAdmin):
             'fields': ('added_date', 'created_at', 'updated_at'),
             'classes': ('collapse',)
         }),
-    )
\ No newline at end of file
+    )
+
+
+@admin.register(BookCopy)
+class BookCopyAdmin(admin.ModelAdmin):
+    list_display = ('barcode', 'book', 'state', 'condition', 'location', 'acquired_date')
+    list_filter = ('state', 'condition')
+    search_fields = ('barcode', 'book__title', 'book__isbn')
+    list_select_related = ('book',)
+    raw_id_fields = ('book',)
+    show_full_result_count = False
+    ordering = ('barcode',)
@@ -0,0 +1,84 @@
+"""
+ISBN normalization and conversion helpers
+
+Scanners, publishers and staff write ISBNs in many shapes
+("978-0-306-40615-7", "0 306 40615 2", "030640615x"). Everything stored on
+``Book`` goes through ``normalize_isbn`` so that lookups can be plain indexed
+equality matches.
+"""
+import re
+
+_STRIP_RE = re.compile(r'[\s\-]')
+
+
+class InvalidISBN(ValueError):
+    """Raised when a value is not a well-formed ISBN-10 or ISBN-13"""
+
+
+def clean_isbn(value):
+    """Strip separators and upper-case the ISBN-10 check character"""
+    if value is None:
+        return ''
+    value = _STRIP_RE.sub('', str(value)).upper()
+    if value.startswith('ISBN'):
+        value = value[4:].lstrip(':')
+    return value
+
+
+def isbn10_check_digit(first_nine):
+    """Check character for the first nine digits of an ISBN-10"""
+    total = sum((10 - i) * int(d) for i, d in enumerate(first_nine))
+    check = (11 - total % 11) % 11
+    return 'X' if check == 10 else str(check)
+
+
+def isbn13_check_digit(first_twelve):
+    """Check digit for the first twelve digits of an ISBN-13"""
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(first_twelve))
+    return str((10 - total % 10) % 10)
+
+
+def is_valid_isbn10(value):
+    return (
+        len(value) == 10
+        and value[:9].isdigit()
+        and (value[9].isdigit() or value[9] == 'X')
+        and isbn10_check_digit(value[:9]) == value[9]
+    )
+
+
+def is_valid_isbn13(value):
+    return (
+        len(value) == 13
+        and value.isdigit()
+        and value[:3] in ('978', '979')
+        and isbn13_check_digit(value[:12]) == value[12]
+    )
+
+
+def isbn10_to_isbn13(isbn10):
+    body = '978' + isbn10[:9]
+    return body + isbn13_check_digit(body)
+
+
+def isbn13_to_isbn10(isbn13):
+    """ISBN-10 form of an ISBN-13, or None for the 979 prefix which has none"""
+    if not isbn13.startswith('978'):
+        return None
+    body = isbn13[3:12]
+    return body + isbn10_check_digit(body)
+
+
+def normalize_isbn(value):
+    """
+    Return the ``(isbn13, isbn10)`` pair for any ISBN form
+
+    ``isbn10`` is None for 979-prefixed ISBNs. Raises ``InvalidISBN`` if the
+    value has the wrong length or a bad check digit.
+    """
+    code = clean_isbn(value)
+    if is_valid_isbn13(code):
+        return code, isbn13_to_isbn10(code)
+    if is_valid_isbn10(code):
+        return isbn10_to_isbn13(code), code
+    raise InvalidISBN(f"'{value}' is not a valid ISBN-10 or ISBN-13")
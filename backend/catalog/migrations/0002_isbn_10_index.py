@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:50
+
+from django.db import migrations, models
+
+from catalog.isbn import InvalidISBN, normalize_isbn
+
+
+def normalize_existing_isbns(apps, schema_editor):
+    Book = apps.get_model('catalog', 'Book')
+    taken = set(Book.objects.values_list('isbn', flat=True))
+    for book in Book.objects.only('pk', 'isbn', 'isbn_10').iterator():
+        for candidate in (book.isbn, book.isbn_10):
+            try:
+                isbn13, isbn10 = normalize_isbn(candidate)
+            except InvalidISBN:
+                continue
+            # Leave the row alone rather than collide with another book
+            if isbn13 != book.isbn and isbn13 in taken:
+                break
+            taken.add(isbn13)
+            Book.objects.filter(pk=book.pk).update(isbn=isbn13, isbn_10=isbn10)
+            break
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='isbn_10',
+            field=models.CharField(blank=True, db_index=True, help_text='10 Character ISBN number', max_length=10, null=True),
+        ),
+        migrations.RunPython(normalize_existing_isbns, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0002_isbn_10_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookCopy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('barcode', models.CharField(help_text='Barcode printed on the copy', max_length=32, unique=True)),
+                ('condition', models.CharField(choices=[('new', 'New'), ('good', 'Good'), ('fair', 'Fair'), ('poor', 'Poor')], default='good', max_length=20)),
+                ('location', models.CharField(blank=True, help_text="Defaults to the book's shelf location", max_length=100)),
+                ('state', models.CharField(choices=[('available', 'Available'), ('on_loan', 'On Loan'), ('on_hold', 'On Hold Shelf'), ('maintenance', 'Under Maintenance'), ('lost', 'Lost'), ('withdrawn', 'Withdrawn')], default='available', max_length=20)),
+                ('acquired_date', models.DateField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='copies', to='catalog.book')),
+            ],
+            options={
+                'verbose_name': 'Book Copy',
+                'verbose_name_plural': 'Book Copies',
+                'ordering': ['barcode'],
+                'indexes': [models.Index(fields=['book', 'state'], name='catalog_boo_book_id_9dd6e1_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0003_book_copy'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['added_date'], name='catalog_boo_added_d_343173_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['publication_date'], name='catalog_boo_publica_ab6929_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['price'], name='catalog_boo_price_779a36_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['status', 'available_copies', 'total_copies'], name='catalog_boo_status_7e9c7d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookcopy',
+            index=models.Index(fields=['state'], name='catalog_boo_state_b46d0a_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0004_book_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookRecommendation',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recommendation', serialize=False, to='catalog.book')),
+                ('neighbors', models.JSONField(default=list, help_text='[[book id, score], ...] in descending score order')),
+                ('last_transaction_id', models.BigIntegerField(default=0, help_text='Newest Transaction counted when this row was built')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Book Recommendation',
+                'verbose_name_plural': 'Book Recommendations',
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_book_recommendation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookDemandForecast',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='demand_forecast', serialize=False, to='catalog.book')),
+                ('total_copies', models.IntegerField(help_text='Copies when the report was built')),
+                ('loans', models.IntegerField(help_text='Loans started within the window')),
+                ('utilization', models.FloatField(help_text='Loan-days over copy-days within the window')),
+                ('active_holds', models.IntegerField()),
+                ('hold_pressure', models.FloatField(help_text='Active holds per copy')),
+                ('average_loan_days', models.FloatField()),
+                ('forecast_loans', models.FloatField(help_text='Expected loans over the horizon, queued holds included')),
+                ('suggested_copies', models.IntegerField()),
+                ('copy_delta', models.IntegerField(help_text='suggested_copies - total_copies')),
+                ('window_days', models.IntegerField()),
+                ('horizon_days', models.IntegerField()),
+                ('computed_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Book Demand Forecast',
+                'verbose_name_plural': 'Book Demand Forecasts',
+                'ordering': ['-copy_delta', '-hold_pressure'],
+                'indexes': [models.Index(fields=['copy_delta', 'hold_pressure'], name='catalog_boo_copy_de_c82259_idx')],
+            },
+        ),
+    ]
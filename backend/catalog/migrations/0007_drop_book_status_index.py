@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:23
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0006_book_demand_forecast'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='book',
+            name='catalog_boo_status_b30b19_idx',
+        ),
+    ]
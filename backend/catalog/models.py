@@ -1,6 +1,9 @@
 from django.db import models
+from django.db.models import Count, Q
 from django.core.validators import MinValueValidator
 
+from .isbn import InvalidISBN, clean_isbn, normalize_isbn
+
 
 class Category(models.Model):
     """
@@ -21,7 +24,9 @@ class Category(models.Model):
     
     @property
     def books_count(self):
-        """Count of books in this category"""
+        """Count of books in this category (from the ``_books_count`` annotation when present)"""
+        if '_books_count' in self.__dict__:
+            return self._books_count
         return self.books.count()
 
 
@@ -48,7 +53,8 @@ class Book(models.Model):
     title = models.CharField(max_length=255)
     subtitle = models.CharField(max_length=255, blank=True, null=True)
     isbn = models.CharField(max_length=13, unique=True, help_text="13 Character ISBN number")
-    isbn_10 = models.CharField(max_length=10, blank=True, null=True, help_text="10 Character ISBN number")
+    isbn_10 = models.CharField(max_length=10, blank=True, null=True, db_index=True,
+                               help_text="10 Character ISBN number")
     
     # Author and Publisher Information
     author = models.CharField(max_length=255)
@@ -87,6 +93,9 @@ class Book(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Changes to these are pushed to the event stream (api/events.py)
+    AVAILABILITY_FIELDS = ('status', 'available_copies', 'total_copies')
+    
     class Meta:
         ordering = ['-created_at']
         verbose_name = 'Book'
@@ -95,9 +104,27 @@ class Book(models.Model):
             models.Index(fields=['isbn']),
             models.Index(fields=['title']),
             models.Index(fields=['author']),
-            models.Index(fields=['status']),
+            # List ordering, publication_year and price range filters
+            models.Index(fields=['added_date']),
+            models.Index(fields=['publication_date']),
+            models.Index(fields=['price']),
+            # status and available filters, and the copy sums in statistics (covering)
+            models.Index(fields=['status', 'available_copies', 'total_copies']),
         ]
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_availability = instance.availability_state()
+        # Lets post_save skip thumbnails when the cover is unchanged (api/signals.py)
+        if 'cover_image' in instance.__dict__:
+            instance._loaded_images = {'cover_image': instance.__dict__['cover_image'] or None}
+        return instance
+    
+    def availability_state(self):
+        """Loaded availability fields (deferred ones are left out, never fetched)"""
+        return {name: self.__dict__[name] for name in self.AVAILABILITY_FIELDS if name in self.__dict__}
+    
     def __str__(self):
         return f"{self.title} by {self.author}"
     
@@ -111,8 +138,143 @@ class Book(models.Model):
         """Calculate number of issued copies"""
         return self.total_copies - self.available_copies
     
+    def normalize_isbns(self):
+        """Store canonical ISBN-13/ISBN-10 and derive whichever one is missing"""
+        for candidate in (self.isbn, self.isbn_10):
+            try:
+                self.isbn, self.isbn_10 = normalize_isbn(candidate)
+                return
+            except InvalidISBN:
+                continue
+        # Legacy values that fail the checksum are kept, minus separators
+        self.isbn = clean_isbn(self.isbn)
+        self.isbn_10 = clean_isbn(self.isbn_10) or None
+    
+    def refresh_inventory(self):
+        """
+        Recompute total_copies/available_copies from BookCopy rows.
+        Books without copy records keep their hand-maintained counters.
+        """
+        counts = self.copies.aggregate(
+            tracked=Count('id'),
+            total=Count('id', filter=~Q(state__in=BookCopy.OUT_OF_STOCK_STATES)),
+            available=Count('id', filter=Q(state='available')),
+        )
+        if not counts['tracked']:
+            return
+        self.total_copies = counts['total']
+        self.available_copies = counts['available']
+        if self.status in ('available', 'issued'):
+            self.status = 'available' if self.available_copies > 0 else 'issued'
+        self.save(update_fields=['total_copies', 'available_copies', 'status', 'updated_at'])
+    
     def save(self, *args, **kwargs):
-        """Override save to ensure available_copies doesn't exceed total_copies"""
+        """Override save to normalize ISBNs and ensure available_copies doesn't exceed total_copies"""
+        self.normalize_isbns()
         if self.available_copies > self.total_copies:
             self.available_copies = self.total_copies
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+
+class BookCopy(models.Model):
+    """
+    Physical copy of a book, identified by its barcode
+    """
+    STATE_CHOICES = (
+        ('available', 'Available'),
+        ('on_loan', 'On Loan'),
+        ('on_hold', 'On Hold Shelf'),
+        ('maintenance', 'Under Maintenance'),
+        ('lost', 'Lost'),
+        ('withdrawn', 'Withdrawn'),
+    )
+    # Copies in these states no longer count towards Book.total_copies
+    OUT_OF_STOCK_STATES = ('lost', 'withdrawn')
+    
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='copies')
+    barcode = models.CharField(max_length=32, unique=True, help_text="Barcode printed on the copy")
+    condition = models.CharField(max_length=20, choices=Book.CONDITION_CHOICES, default='good')
+    location = models.CharField(max_length=100, blank=True, help_text="Defaults to the book's shelf location")
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default='available')
+    acquired_date = models.DateField(blank=True, null=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['barcode']
+        verbose_name = 'Book Copy'
+        verbose_name_plural = 'Book Copies'
+        indexes = [
+            models.Index(fields=['book', 'state']),
+            models.Index(fields=['state']),
+        ]
+    
+    def __str__(self):
+        return f"{self.barcode} ({self.book.title})"
+    
+    def save(self, *args, **kwargs):
+        """Override save to keep the book's copy counters in sync"""
+        if not self.location:
+            self.location = self.book.location
+        super().save(*args, **kwargs)
+        self.book.refresh_inventory()
+    
+    def delete(self, *args, **kwargs):
+        book = self.book
+        result = super().delete(*args, **kwargs)
+        book.refresh_inventory()
+        return result
+
+
+class BookRecommendation(models.Model):
+    """
+    Books most often borrowed by the same patrons as ``book``, best first.
+    Built by ``python manage.py build_recommendations`` (api/recommendations.py).
+    """
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='recommendation')
+    neighbors = models.JSONField(default=list, help_text="[[book id, score], ...] in descending score order")
+    last_transaction_id = models.BigIntegerField(
+        default=0, help_text="Newest Transaction counted when this row was built"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Book Recommendation'
+        verbose_name_plural = 'Book Recommendations'
+    
+    def __str__(self):
+        return f"Recommendations for book {self.book_id}"
+
+
+class BookDemandForecast(models.Model):
+    """
+    Utilization, hold pressure and forecast demand of a book, with the copy
+    count that would serve it. Built by ``python manage.py build_acquisition_report``
+    (api/acquisition.py).
+    """
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='demand_forecast')
+    total_copies = models.IntegerField(help_text="Copies when the report was built")
+    loans = models.IntegerField(help_text="Loans started within the window")
+    utilization = models.FloatField(help_text="Loan-days over copy-days within the window")
+    active_holds = models.IntegerField()
+    hold_pressure = models.FloatField(help_text="Active holds per copy")
+    average_loan_days = models.FloatField()
+    forecast_loans = models.FloatField(help_text="Expected loans over the horizon, queued holds included")
+    suggested_copies = models.IntegerField()
+    copy_delta = models.IntegerField(help_text="suggested_copies - total_copies")
+    window_days = models.IntegerField()
+    horizon_days = models.IntegerField()
+    computed_at = models.DateTimeField()
+    
+    class Meta:
+        ordering = ['-copy_delta', '-hold_pressure']
+        verbose_name = 'Book Demand Forecast'
+        verbose_name_plural = 'Book Demand Forecasts'
+        indexes = [
+            # The report's default ranking
+            models.Index(fields=['copy_delta', 'hold_pressure']),
+        ]
+    
+    def __str__(self):
+        return f"Demand forecast for book {self.book_id}"
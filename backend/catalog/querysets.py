@@ -0,0 +1,12 @@
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(queryset, field):
+    """
+    Per-row count of ``queryset`` rows whose ``field`` points at the outer
+    row, as a correlated subquery. Unlike ``Count()`` over a join it adds no
+    GROUP BY, so list ordering keeps its index and paginator counts ignore it.
+    """
+    counts = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(count=Count('pk'))
+    return Coalesce(Subquery(counts.values('count')), 0)
@@ -0,0 +1,7 @@
+from django.dispatch import Signal
+
+# Sent once per chunk of a set-based UPDATE of many books (api/bulk.py), in
+# place of a post_save per book. Arguments: book_ids, fields (the names set)
+# and availability ({book id: new availability_state()} for the books whose
+# status changed).
+books_updated = Signal()
@@ -1,3 +1,121 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase
+
+from .isbn import InvalidISBN, isbn10_to_isbn13, isbn13_to_isbn10, normalize_isbn
+from .models import Book, BookCopy, Category
+
+
+class ISBNTests(SimpleTestCase):
+    """catalog/isbn.py"""
+    
+    def test_conversion_recomputes_the_check_digit(self):
+        self.assertEqual(isbn10_to_isbn13('0306406152'), '9780306406157')
+        self.assertEqual(isbn13_to_isbn10('9780306406157'), '0306406152')
+        # A check value of 10 is written X in ISBN-10 only
+        self.assertEqual(isbn13_to_isbn10('9780804429573'), '080442957X')
+        self.assertEqual(isbn10_to_isbn13('080442957X'), '9780804429573')
+        # 979 ISBNs have no ISBN-10 form
+        self.assertIsNone(isbn13_to_isbn10('9791090636071'))
+    
+    def test_normalize_accepts_any_written_form(self):
+        for value in ('978-0-306-40615-7', '0 306 40615 2', 'ISBN: 0-306-40615-2', '9780306406157'):
+            self.assertEqual(normalize_isbn(value), ('9780306406157', '0306406152'), value)
+        self.assertEqual(normalize_isbn('0-8044-2957-x'), ('9780804429573', '080442957X'))
+        self.assertEqual(normalize_isbn('979-10-90636-07-1'), ('9791090636071', None))
+    
+    def test_normalize_rejects_bad_checksums_and_lengths(self):
+        for value in ('978-0-306-40615-8', '0306406153', '030640615', '9770306406157', None):
+            with self.assertRaises(InvalidISBN, msg=value):
+                normalize_isbn(value)
+
+
+class BookISBNTests(TestCase):
+    """Book.normalize_isbns on save"""
+    
+    def create(self, **fields):
+        return Book.objects.create(
+            title='Book', author='Author', publisher='Publisher', location='A1', call_number='CN-1',
+            category=Category.objects.create(name='Fiction'), price=Decimal('20.00'), **fields,
+        )
+    
+    def test_hyphenated_isbn_is_stored_in_both_forms(self):
+        book = self.create(isbn='978-0-306-40615-7')
+        book.refresh_from_db()
+        self.assertEqual((book.isbn, book.isbn_10), ('9780306406157', '0306406152'))
+    
+    def test_isbn_10_alone_fills_in_the_isbn_13(self):
+        book = self.create(isbn='', isbn_10='0-8044-2957-x')
+        self.assertEqual((book.isbn, book.isbn_10), ('9780804429573', '080442957X'))
+    
+    def test_legacy_value_failing_the_checksum_is_kept_without_separators(self):
+        book = self.create(isbn='978-0-306-40615-8')
+        self.assertEqual((book.isbn, book.isbn_10), ('9780306406158', None))
+
+
+class BookCopyInventoryTests(TestCase):
+    """Copy state changes keep the book's counters in sync (Book.refresh_inventory)"""
+    
+    def setUp(self):
+        self.book = Book.objects.create(
+            title='Book', author='Author', publisher='Publisher', isbn='9780306406157',
+            location='A1', call_number='CN-1', category=Category.objects.create(name='Fiction'),
+            price=Decimal('20.00'), total_copies=5, available_copies=5,
+        )
+    
+    def counters(self):
+        self.book.refresh_from_db()
+        return self.book.status, self.book.total_copies, self.book.available_copies
+    
+    def test_copies_replace_the_hand_kept_counters(self):
+        first = BookCopy.objects.create(book=self.book, barcode='BC-1')
+        self.assertEqual(first.location, 'A1')
+        self.assertEqual(self.counters(), ('available', 1, 1))
+        BookCopy.objects.create(book=self.book, barcode='BC-2', state='maintenance')
+        self.assertEqual(self.counters(), ('available', 2, 1))
+    
+    def test_state_changes_move_the_counters(self):
+        copies = [BookCopy.objects.create(book=self.book, barcode=f'BC-{i}') for i in range(2)]
+        copies[0].state = 'on_loan'
+        copies[0].save()
+        self.assertEqual(self.counters(), ('available', 2, 1))
+        copies[1].state = 'on_hold'
+        copies[1].save()
+        # None left on the shelf
+        self.assertEqual(self.counters(), ('issued', 2, 0))
+        # Lost and withdrawn copies leave the stock altogether
+        copies[1].state = 'lost'
+        copies[1].save()
+        self.assertEqual(self.counters(), ('issued', 1, 0))
+        copies[0].state = 'available'
+        copies[0].save()
+        self.assertEqual(self.counters(), ('available', 1, 1))
+    
+    def test_deleting_a_copy_recounts(self):
+        keep = BookCopy.objects.create(book=self.book, barcode='BC-1')
+        BookCopy.objects.create(book=self.book, barcode='BC-2').delete()
+        self.assertEqual(self.counters(), ('available', 1, 1))
+        keep.state = 'on_loan'
+        keep.save()
+        self.assertEqual(self.counters(), ('issued', 1, 0))
+    
+    def test_status_set_by_staff_is_kept(self):
+        Book.objects.filter(pk=self.book.pk).update(status='maintenance')
+        self.book.refresh_from_db()
+        BookCopy.objects.create(book=self.book, barcode='BC-1')
+        self.assertEqual(self.counters(), ('maintenance', 1, 1))
+    
+    def test_loans_lend_and_return_the_copy_on_the_shelf(self):
+        from django.contrib.auth import get_user_model
+        from transactions.models import Transaction
+        member = get_user_model().objects.create_user('member', password='x', user_type='student')
+        copy = BookCopy.objects.create(book=self.book, barcode='BC-1')
+        loan = Transaction.objects.create(user=member, book=self.book, due_date=self.book.created_at.date())
+        self.assertEqual(loan.copy, copy)
+        copy.refresh_from_db()
+        self.assertEqual(copy.state, 'on_loan')
+        self.assertEqual(self.counters(), ('issued', 1, 0))
+        loan.mark_as_returned()
+        copy.refresh_from_db()
+        self.assertEqual(copy.state, 'available')
+        self.assertEqual(self.counters(), ('available', 1, 1))
@@ -0,0 +1,18 @@
+"""
+MySQL backend with an in-process connection pool
+
+Enable with DB_POOL_SIZE > 0 (see library_backend/settings.py).
+"""
+from django.db.backends.mysql import base
+
+from ..pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    
+    def is_raw_connection_usable(self, connection):
+        try:
+            connection.ping()
+        except base.Database.Error:
+            return False
+        return True
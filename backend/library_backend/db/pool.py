@@ -0,0 +1,120 @@
+"""
+In-process database connection pool
+
+Django has no connection pool for MySQL. Under ASGI every request runs its
+ORM calls on a worker thread and closes the connection at the end, so
+CONN_MAX_AGE does not help there. ``PooledDatabaseWrapperMixin`` hands
+closed connections back to a per-process pool instead of tearing them down,
+and the next ``connect()`` on any thread reuses one after a liveness check.
+"""
+import threading
+import time
+from queue import Empty, Full, LifoQueue
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """Thread-safe LIFO pool of idle DB-API connections"""
+    
+    def __init__(self, size, max_age):
+        self.size = size
+        self.max_age = max_age
+        self._idle = LifoQueue(maxsize=size)
+    
+    def acquire(self, is_usable):
+        """Pop a healthy idle connection, or return None if there is none"""
+        while True:
+            try:
+                connection, created_at = self._idle.get_nowait()
+            except Empty:
+                return None, None
+            if self._expired(created_at) or not is_usable(connection):
+                self._discard(connection)
+                continue
+            return connection, created_at
+    
+    def release(self, connection, created_at):
+        if self._expired(created_at):
+            self._discard(connection)
+            return
+        try:
+            self._idle.put_nowait((connection, created_at))
+        except Full:
+            self._discard(connection)
+    
+    def clear(self):
+        while True:
+            try:
+                connection, _ = self._idle.get_nowait()
+            except Empty:
+                return
+            self._discard(connection)
+    
+    @property
+    def idle_count(self):
+        return self._idle.qsize()
+    
+    def _expired(self, created_at):
+        return self.max_age is not None and time.monotonic() - created_at > self.max_age
+    
+    @staticmethod
+    def _discard(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+def get_pool(alias, size, max_age):
+    with _pools_lock:
+        if alias not in _pools:
+            _pools[alias] = ConnectionPool(size, max_age)
+        return _pools[alias]
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    Mix into a backend's DatabaseWrapper to pool its connections.
+    
+    Reads ``POOL_SIZE`` (idle connections kept per process) and
+    ``POOL_MAX_AGE`` (seconds before a connection is recycled) from the
+    DATABASES entry.
+    """
+    
+    @property
+    def pool(self):
+        return get_pool(
+            self.alias,
+            self.settings_dict.get('POOL_SIZE', 10),
+            self.settings_dict.get('POOL_MAX_AGE', 300),
+        )
+    
+    def get_new_connection(self, conn_params):
+        connection, created_at = self.pool.acquire(self.is_raw_connection_usable)
+        if connection is None:
+            connection = super().get_new_connection(conn_params)
+            created_at = time.monotonic()
+        self._pool_created_at = created_at
+        return connection
+    
+    def is_raw_connection_usable(self, connection):
+        try:
+            cursor = connection.cursor()
+            cursor.execute('SELECT 1')
+            cursor.close()
+        except Exception:
+            return False
+        return True
+    
+    def _close(self):
+        if self.connection is None:
+            return
+        # Connections in a broken or transactional state are never reused
+        if self.in_atomic_block or self.errors_occurred:
+            return super()._close()
+        with self.wrap_database_errors:
+            if not self.get_autocommit():
+                self.connection.rollback()
+        self.pool.release(self.connection, getattr(self, '_pool_created_at', time.monotonic()))
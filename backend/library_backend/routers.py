@@ -0,0 +1,112 @@
+"""
+Database routing for read replicas
+
+Reads go to a replica only while a request that opted in is being handled
+(see ``api.middleware.ReplicaRoutingMiddleware``): a safe-method request on
+one of ``settings.REPLICA_READ_URL_NAMES`` from a user who has not written
+anything in the last ``REPLICA_STICKY_SECONDS``. Everything else, including
+management commands and background jobs, uses ``default``.
+
+Whatever goes into the shared cache is read under ``primary_reads()``: the
+cache serves every user, including the writer pinned to the primary, so an
+entry filled from a lagging replica would hide their own write from them.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+_replica_reads = ContextVar('replica_reads', default=None)
+
+
+def sticky_key(user_id):
+    return f'replica:sticky:{user_id}'
+
+
+def pin_to_primary(user_id):
+    """Keep ``user_id``'s reads on the primary until replicas have caught up"""
+    cache.set(sticky_key(user_id), True, settings.REPLICA_STICKY_SECONDS)
+
+
+class ReplicaReads:
+    """
+    Per-request routing decision: off until the route allows replica reads,
+    and resolved lazily once the user is known
+    """
+    
+    def __init__(self, request):
+        self.request = request
+        self.allowed = False
+        self._pinned = None
+    
+    @property
+    def pinned(self):
+        if self._pinned is None:
+            user = getattr(self.request, 'user', None)
+            if user is None or not user.is_authenticated:
+                # Authentication hasn't run yet (or never will); don't memoize
+                return False
+            self._pinned = bool(cache.get(sticky_key(user.pk)))
+        return self._pinned
+
+
+def is_primary_alias(alias):
+    """
+    Whether ``alias`` points at the primary database itself, as replicas do
+    during tests (TEST MIRROR). Reading through the primary's connection then
+    avoids a second connection that can't see uncommitted test data.
+    """
+    replica, primary = connections[alias].settings_dict, connections['default'].settings_dict
+    return all(replica.get(key) == primary.get(key) for key in ('ENGINE', 'NAME', 'HOST', 'PORT'))
+
+
+def begin_request(request):
+    """
+    Track ``request``'s routing in the current context; returns a reset token.
+    Reads stay on the primary until ``allow_replica_reads(request)``, which
+    may run in another context of the same request (sync_to_async).
+    """
+    request.replica_reads = ReplicaReads(request)
+    return _replica_reads.set(request.replica_reads)
+
+
+def allow_replica_reads(request):
+    request.replica_reads.allowed = True
+
+
+def end_request(token):
+    _replica_reads.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """Send the current context's reads to the primary, e.g. to fill a cache"""
+    token = _replica_reads.set(None)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        state = _replica_reads.get()
+        if state is None or not state.allowed or state.pinned:
+            return 'default'
+        replicas = [alias for alias in settings.DATABASE_REPLICAS if not is_primary_alias(alias)]
+        return random.choice(replicas) if replicas else 'default'
+    
+    def db_for_write(self, model, **hints):
+        return 'default'
+    
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        databases = {'default', *settings.DATABASE_REPLICAS}
+        return obj1._state.db in databases and obj2._state.db in databases
+    
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
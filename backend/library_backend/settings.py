@@ -2,6 +2,7 @@
 Django settings for library management system.
 """
 import os
+from datetime import timedelta
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -38,6 +39,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.SlowQueryMiddleware',
+    'api.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -46,6 +50,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'library_backend.urls'
@@ -69,22 +74,163 @@ TEMPLATES = [
 WSGI_APPLICATION = 'library_backend.wsgi.application'
 ASGI_APPLICATION = 'library_backend.asgi.application'
 
-# Database configuration - MySQL
-DATABASES = {
+# Database configuration - MySQL (DB_ENGINE=sqlite for a local file database)
+# DB_CONN_MAX_AGE keeps connections open between requests (seconds, 0 to close
+# after each request). Under ASGI set DB_POOL_SIZE instead: connections are
+# then returned to an in-process pool (library_backend/db/pool.py) at the end
+# of every request and reused by the next one.
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '0'))
+
+DB_ENGINE = os.getenv('DB_ENGINE', 'mysql')
+
+if DB_ENGINE == 'sqlite':
+    # Local development / CI without a MySQL server
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / os.getenv('DB_NAME', 'db.sqlite3'),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'library_backend.db.mysql_pool' if DB_POOL_SIZE else 'django.db.backends.mysql',
+            'NAME': os.getenv('DB_NAME', 'library_db'),
+            'USER': os.getenv('DB_USER', 'root'),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+            'PORT': os.getenv('DB_PORT', '3306'),
+            'CONN_MAX_AGE': 0 if DB_POOL_SIZE else int(os.getenv('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True',
+            'POOL_SIZE': DB_POOL_SIZE,
+            'POOL_MAX_AGE': int(os.getenv('DB_POOL_MAX_AGE', '300')),
+            'OPTIONS': {
+                'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
+                'charset': 'utf8mb4',
+            },
+        }
+    }
+
+# Read replicas - comma-separated HOST[:PORT] entries (or file names with
+# DB_ENGINE=sqlite). Safe-method requests on REPLICA_READ_URL_NAMES read from
+# them, see library_backend/routers.py. Replicas mirror 'default' in tests.
+DATABASE_REPLICAS = []
+for index, replica in enumerate(filter(None, os.getenv('DB_REPLICAS', '').split(','))):
+    alias = f'replica_{index}'
+    replica_settings = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+    if DB_ENGINE == 'sqlite':
+        replica_settings['NAME'] = BASE_DIR / replica.strip()
+    else:
+        host, _, port = replica.strip().partition(':')
+        replica_settings.update(HOST=host, PORT=port or DATABASES['default']['PORT'])
+    DATABASES[alias] = replica_settings
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['library_backend.routers.ReplicaRouter']
+
+# Seconds a user's reads stay on the primary after they write something
+REPLICA_STICKY_SECONDS = int(os.getenv('DB_REPLICA_STICKY_SECONDS', '10'))
+
+# URL names (router basename-action) whose GETs may be served by a replica
+REPLICA_READ_URL_NAMES = [
+    'category-list', 'category-detail', 'category-books',
+    'book-list', 'book-detail', 'book-available', 'book-statistics',
+    'book-by-isbn', 'book-transactions', 'book-similar',
+    'copy-list',
+    'transaction-list', 'transaction-statistics',
+    'reservation-list',
+    'user-list',
+    'async-book-list', 'async-book-statistics', 'async-transaction-statistics',
+    'dashboard-summary', 'analytics-acquisition',
+]
+
+# Cache - no external services required by default. Local memory is per
+# process, but token revocation, response-cache invalidation and replica
+# stickiness must be seen by every worker process, so with DEBUG off
+# CACHE_REQUIRE_SHARED makes `check` reject it (api/checks.py). Use
+# CACHE_BACKEND=file on a single host, or redis / memcached with
+# CACHE_LOCATION set to the server's URL (needs redis or pymemcache).
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+    'memcached': 'django.core.cache.backends.memcached.PyMemcacheCache',
+}
+CACHE_REQUIRE_SHARED = os.getenv('CACHE_REQUIRE_SHARED', str(not DEBUG)) == 'True'
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem')
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
-        'NAME': os.getenv('DB_NAME', 'library_db'),
-        'USER': os.getenv('DB_USER', 'root'),
-        'PASSWORD': os.getenv('DB_PASSWORD', ''),
-        'HOST': os.getenv('DB_HOST', 'localhost'),
-        'PORT': os.getenv('DB_PORT', '3306'),
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': os.getenv('CACHE_LOCATION', 'library-cache'),
+        'TIMEOUT': 300,
+        # Client options for redis / memcached; MAX_ENTRIES only culls locmem and file
         'OPTIONS': {
-            'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
-            'charset': 'utf8mb4',
-        },
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', '5000')),
+        } if CACHE_BACKEND in ('locmem', 'file') else {},
     }
 }
 
+# Seconds a cached API response may be served (see api/cache.py)
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', '300'))
+
+# Request metrics (see api/metrics.py), served at /api/metrics/ to staff and
+# to scrapers sending "Authorization: Bearer $METRICS_TOKEN". Addresses in
+# METRICS_ALLOWED_IPS need no token; none by default, since behind a reverse
+# proxy every request arrives from the proxy's address. Requests running more
+# queries than their route's budget are logged as possible N+1 patterns.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = [ip for ip in os.getenv('METRICS_ALLOWED_IPS', '').split(',') if ip]
+METRICS_QUERY_BUDGET = int(os.getenv('METRICS_QUERY_BUDGET', '20'))
+METRICS_QUERY_BUDGETS = {
+    # URL name -> budget, for routes that legitimately need more (or fewer)
+}
+
+# Request throttling (see api/throttling.py): token buckets per scope, with
+# a rate per role (staff, a user_type or anonymous; 'default' for the rest).
+# THROTTLE_STORE=local counts in each process, 'cache' shares the counts
+# between processes through the default cache.
+THROTTLE_ENABLED = os.getenv('THROTTLE_ENABLED', 'True') == 'True'
+THROTTLE_STORE = os.getenv('THROTTLE_STORE', 'local')
+THROTTLE_RATES = {
+    'search': {'default': '60/min', 'staff': '300/min'},
+    'export': {'default': '10/min', 'staff': '60/min'},
+    'statistics': {'default': '30/min', 'staff': '120/min'},
+    'login': {'default': '10/min'},
+    'login-username': {'default': '20/hour'},
+    'writes': {'default': '30/min', 'faculty': '60/min', 'staff': '600/min', 'anonymous': '20/hour'},
+}
+
+# Slow-query log (see api/slow_queries.py): statements taking at least
+# SLOW_QUERY_THRESHOLD_MS are appended to SLOW_QUERY_LOG with their
+# fingerprint and call site; python manage.py slow_queries ranks them
+SLOW_QUERY_LOG_ENABLED = os.getenv('SLOW_QUERY_LOG_ENABLED', 'True') == 'True'
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', '100'))
+SLOW_QUERY_LOG = os.getenv('SLOW_QUERY_LOG', str(BASE_DIR / 'logs' / 'slow_queries.jsonl'))
+SLOW_QUERY_LOG_MAX_BYTES = int(os.getenv('SLOW_QUERY_LOG_MAX_BYTES', str(50 * 1024 * 1024)))
+
+# Request profiling (see api/profiling.py). Staff send X-Profile: 1 or
+# ?_profile=1; PROFILING_SAMPLE_RATE = N also profiles one in N requests.
+# Reports are kept in PROFILING_DIR, newest PROFILING_MAX_REPORTS only.
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False') == 'True'
+PROFILING_SAMPLE_RATE = int(os.getenv('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_DIR = os.getenv('PROFILING_DIR', str(BASE_DIR / 'profiles'))
+PROFILING_MAX_REPORTS = int(os.getenv('PROFILING_MAX_REPORTS', '200'))
+
+# Server-sent event stream (see api/events.py): events buffered per client
+# before the oldest are dropped, replay history for reconnects, keepalive
+# interval in seconds and the reconnect delay suggested to EventSource
+EVENT_STREAM_BUFFER = int(os.getenv('EVENT_STREAM_BUFFER', '100'))
+EVENT_STREAM_HISTORY = int(os.getenv('EVENT_STREAM_HISTORY', '500'))
+EVENT_STREAM_HEARTBEAT = int(os.getenv('EVENT_STREAM_HEARTBEAT', '15'))
+EVENT_STREAM_RETRY_MS = 5000
+# Seconds a ticket from POST /api/stream/ticket/ may be used to connect
+EVENT_STREAM_TICKET_TTL = int(os.getenv('EVENT_STREAM_TICKET_TTL', '60'))
+
+# Returned, settled loans older than this move to TransactionHistory
+# (python manage.py archive_transactions)
+TRANSACTION_ARCHIVE_MONTHS = int(os.getenv('TRANSACTION_ARCHIVE_MONTHS', '24'))
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -118,13 +264,18 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Resized copies of uploaded images (longest edge in pixels), see api/thumbnails.py
+IMAGE_DERIVATIVE_SIZES = {'icon': 100, 'thumb': 300, 'medium': 600}
+IMAGE_DERIVATIVE_FORMATS = ('webp', 'jpeg')
+IMAGE_DERIVATIVE_QUALITY = int(os.getenv('IMAGE_DERIVATIVE_QUALITY', '80'))
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -136,8 +287,26 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.ScopedTokenBucketThrottle',
+    ],
+    # Trusted proxies in front of the app: the client address is taken from
+    # that many entries into X-Forwarded-For; 0 uses REMOTE_ADDR and ignores
+    # the header, which any client can forge
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', '0')),
 }
 
+# JWT settings
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=int(os.getenv('JWT_ACCESS_MINUTES', '60'))),
+    'REFRESH_TOKEN_LIFETIME': timedelta(days=int(os.getenv('JWT_REFRESH_DAYS', '7'))),
+    'TOKEN_OBTAIN_SERIALIZER': 'api.authentication.LibraryTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'api.authentication.LibraryTokenRefreshSerializer',
+}
+
+# Seconds an authenticated user row is served from cache (see api/authentication.py)
+AUTH_USER_CACHE_TTL = int(os.getenv('AUTH_USER_CACHE_TTL', '60'))
+
 # CORS settings
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -1,5 +1,11 @@
 from django.contrib import admin
-from .models import Transaction, Reservation
+from django.db import transaction
+from django.utils import timezone
+from api.cache import bump_generation
+from api.events import publish_on_commit
+from api.inventory import restock_returned_loans
+from catalog.models import Book, BookCopy
+from .models import CirculationEvent, Transaction, TransactionHistory, Reservation
 
 
 @admin.register(Transaction)
@@ -9,6 +15,9 @@ class TransactionAdmin(admin.ModelAdmin):
     search_fields = ('user__username', 'user__email', 'book__title', 'book__isbn')
     ordering = ('-issue_date',)
     readonly_fields = ('issue_date', 'created_at', 'updated_at', 'is_overdue', 'days_overdue')
+    list_select_related = ('user', 'book')
+    autocomplete_fields = ('user', 'book', 'issued_by', 'returned_to')
+    show_full_result_count = False
     
     fieldsets = (
         ('Transaction Details', {
@@ -32,15 +41,65 @@ class TransactionAdmin(admin.ModelAdmin):
     actions = ['mark_as_returned']
     
     def mark_as_returned(self, request, queryset):
-        """Admin action to mark transactions as returned"""
-        count = 0
-        for transaction in queryset.filter(return_date__isnull=True):
-            transaction.mark_as_returned(returned_to=request.user)
-            count += 1
+        """
+        Admin action to mark transactions as returned, set-based: one UPDATE
+        for the loans, one for their copies and one INSERT for the events,
+        then only the returned books' counters change (restock_returned_loans).
+        Fines are not recalculated; Transaction.mark_as_returned sets the
+        return date before its overdue check, so it never assesses one either.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            loans = list(
+                queryset.filter(return_date__isnull=True).select_for_update()
+                .values('pk', 'user_id', 'book_id', 'copy_id', 'due_date')
+            )
+            ids = [loan['pk'] for loan in loans]
+            count = Transaction.objects.filter(pk__in=ids).update(
+                return_date=now, status='returned', returned_to=request.user, updated_at=now
+            )
+            BookCopy.objects.filter(pk__in=[loan['copy_id'] for loan in loans if loan['copy_id']]).update(
+                state='available', updated_at=now
+            )
+            books_changed = restock_returned_loans(loans, now)
+            # Last, as appending events serializes the transaction until commit
+            CirculationEvent.append([
+                CirculationEvent(
+                    kind=CirculationEvent.RETURN, user_id=loan['user_id'], book_id=loan['book_id'],
+                    loan_id=loan['pk'], actor=request.user, occurred_at=now,
+                )
+                for loan in loans
+            ])
+        # QuerySet.update() sends no signals, so invalidate cached responses
+        # and notify event streams here
+        bump_generation(Transaction._meta.label)
+        if books_changed:
+            bump_generation(Book._meta.label)
+        for loan in loans:
+            publish_on_commit('transaction.returned', {
+                'id': loan['pk'], 'user': loan['user_id'], 'book': loan['book_id'], 'copy': loan['copy_id'],
+                'status': 'returned', 'due_date': loan['due_date'], 'return_date': now,
+            })
         self.message_user(request, f"{count} transaction(s) marked as returned.")
     mark_as_returned.short_description = "Mark selected as returned"
 
 
+@admin.register(TransactionHistory)
+class TransactionHistoryAdmin(admin.ModelAdmin):
+    list_display = ('original_id', 'user', 'book', 'issue_date', 'return_date', 'status', 'fine_amount', 'archived_at')
+    list_filter = ('status', 'archived_at')
+    search_fields = ('user__username', 'user__email', 'book__title', 'book__isbn')
+    ordering = ('-issue_date',)
+    list_select_related = ('user', 'book')
+    show_full_result_count = False
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Reservation)
 class ReservationAdmin(admin.ModelAdmin):
     list_display = ('user', 'book', 'reservation_date', 'expiry_date', 'status', 'notified')
@@ -48,11 +107,50 @@ class ReservationAdmin(admin.ModelAdmin):
     search_fields = ('user__username', 'user__email', 'book__title', 'book__isbn')
     ordering = ('-reservation_date',)
     readonly_fields = ('reservation_date', 'created_at', 'updated_at', 'is_expired')
+    list_select_related = ('user', 'book')
+    autocomplete_fields = ('user', 'book')
+    show_full_result_count = False
     
     actions = ['cancel_reservations']
     
     def cancel_reservations(self, request, queryset):
         """Admin action to cancel reservations"""
-        count = queryset.filter(status='active').update(status='cancelled')
+        active = list(queryset.filter(status='active'))
+        with transaction.atomic():
+            count = Reservation.objects.filter(pk__in=[r.pk for r in active]).update(status='cancelled')
+            # update() bypasses Reservation.save(), so log the cancellations here
+            CirculationEvent.append([
+                CirculationEvent(
+                    kind=CirculationEvent.HOLD_CANCELLED, user_id=reservation.user_id,
+                    book_id=reservation.book_id, hold_id=reservation.pk,
+                )
+                for reservation in active
+            ])
+        # QuerySet.update() sends no signals, so invalidate cached responses
+        # and notify event streams here
+        bump_generation(Reservation._meta.label)
+        for reservation in active:
+            reservation.status = 'cancelled'
+            publish_on_commit('reservation.cancelled', {
+                'id': reservation.pk, 'user': reservation.user_id,
+                'book': reservation.book_id, 'status': reservation.status,
+            })
         self.message_user(request, f"{count} reservation(s) cancelled.")
-    cancel_reservations.short_description = "Cancel selected reservations"
\ No newline at end of file
+    cancel_reservations.short_description = "Cancel selected reservations"
+
+
+@admin.register(CirculationEvent)
+class CirculationEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'occurred_at', 'user_id', 'book_id', 'loan_id', 'hold_id', 'amount', 'due_date')
+    list_filter = ('kind',)
+    ordering = ('-id',)
+    show_full_result_count = False
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
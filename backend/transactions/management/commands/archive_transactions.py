@@ -0,0 +1,80 @@
+import calendar
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from api.cache import bump_generation
+from transactions.models import Transaction, TransactionHistory
+
+
+def months_ago(moment, months):
+    year, month = divmod(moment.year * 12 + moment.month - 1 - months, 12)
+    day = min(moment.day, calendar.monthrange(year, month + 1)[1])
+    return moment.replace(year=year, month=month + 1, day=day)
+
+
+class Command(BaseCommand):
+    help = "Move closed transactions older than N months into TransactionHistory"
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months', type=int, default=settings.TRANSACTION_ARCHIVE_MONTHS,
+            help="Archive loans returned more than this many months ago "
+                 "(default: TRANSACTION_ARCHIVE_MONTHS)"
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Rows moved per database transaction (default: 1000)"
+        )
+        parser.add_argument(
+            '--max-batches', type=int, default=None,
+            help="Stop after this many batches; run again to continue"
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Only report how many transactions would be archived"
+        )
+    
+    def handle(self, *args, **options):
+        if options['months'] < 1 or options['batch_size'] < 1:
+            raise CommandError("--months and --batch-size must be positive")
+        
+        cutoff = months_ago(timezone.now(), options['months'])
+        candidates = TransactionHistory.archivable(cutoff)
+        
+        if options['dry_run']:
+            self.stdout.write(f"{candidates.count()} transaction(s) returned before {cutoff:%Y-%m-%d} would be archived.")
+            return
+        
+        # Each batch is copied and deleted atomically, so an interrupted run
+        # leaves every row in exactly one table and simply continues next time
+        moved = batches = 0
+        last_pk = 0
+        while options['max_batches'] is None or batches < options['max_batches']:
+            with db_transaction.atomic():
+                chunk = list(
+                    candidates.filter(pk__gt=last_pk).order_by('pk')
+                    .select_for_update()[:options['batch_size']]
+                )
+                if not chunk:
+                    break
+                TransactionHistory.objects.bulk_create(
+                    [TransactionHistory.from_transaction(row) for row in chunk],
+                    ignore_conflicts=True,
+                )
+                Transaction.objects.filter(pk__in=[row.pk for row in chunk]).delete()
+            
+            last_pk = chunk[-1].pk
+            moved += len(chunk)
+            batches += 1
+            self.stdout.write(f"Archived {moved} transaction(s)...")
+        
+        if moved:
+            # bulk_create sends no signals; deletes already bumped Transaction
+            bump_generation(TransactionHistory._meta.label)
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {moved} transaction(s) returned before {cutoff:%Y-%m-%d} in {batches} batch(es)."
+        ))
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0003_book_copy'),
+        ('transactions', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='copy',
+            field=models.ForeignKey(blank=True, help_text='Physical copy lent out (books without copy records leave this empty)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='transactions', to='catalog.bookcopy'),
+        ),
+    ]
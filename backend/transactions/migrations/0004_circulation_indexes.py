@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0004_book_query_indexes'),
+        ('transactions', '0003_transaction_copy'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['book', 'status'], name='transaction_book_id_97f41d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['status', 'reservation_date'], name='transaction_status_57ea9a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['reservation_date'], name='transaction_reserva_4c15e7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['return_date', 'due_date'], name='transaction_return__9d93bf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'return_date'], name='transaction_user_id_14897f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['status', 'issue_date'], name='transaction_status_1fc3ec_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['issue_date'], name='transaction_issue_d_cbcc84_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['fine_paid', 'fine_amount'], name='transaction_fine_pa_a86d87_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0004_book_query_indexes'),
+        ('transactions', '0004_circulation_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_id', models.BigIntegerField(help_text='Primary key the row had in Transaction', unique=True)),
+                ('issue_date', models.DateTimeField()),
+                ('due_date', models.DateField()),
+                ('return_date', models.DateTimeField()),
+                ('status', models.CharField(choices=[('issued', 'Issued'), ('returned', 'Returned'), ('overdue', 'Overdue'), ('lost', 'Lost')], max_length=20)),
+                ('fine_amount', models.DecimalField(decimal_places=2, default=0.0, max_digits=10)),
+                ('fine_paid', models.BooleanField(default=False)),
+                ('remarks', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transaction_history', to='catalog.book')),
+                ('copy', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='transaction_history', to='catalog.bookcopy')),
+                ('issued_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('returned_to', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transaction_history', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Transaction History',
+                'verbose_name_plural': 'Transaction History',
+                'ordering': ['-issue_date'],
+                'indexes': [models.Index(fields=['user', 'issue_date'], name='transaction_user_id_f9d1ee_idx'), models.Index(fields=['book', 'issue_date'], name='transaction_book_id_3addb2_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:46
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0006_book_demand_forecast'),
+        ('transactions', '0005_transaction_history'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CirculationEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.PositiveSmallIntegerField(choices=[(1, 'issue'), (2, 'return'), (3, 'renew'), (4, 'fine_assessed'), (5, 'fine_paid'), (6, 'hold_placed'), (7, 'hold_fulfilled'), (8, 'hold_cancelled'), (9, 'hold_expired')])),
+                ('occurred_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('loan_id', models.BigIntegerField(blank=True, help_text='Transaction the event belongs to', null=True)),
+                ('hold_id', models.BigIntegerField(blank=True, help_text='Reservation the event belongs to', null=True)),
+                ('amount', models.DecimalField(blank=True, decimal_places=2, help_text='Fine assessed or paid', max_digits=10, null=True)),
+                ('due_date', models.DateField(blank=True, help_text='Due date set by an issue or renewal', null=True)),
+                ('actor', models.ForeignKey(blank=True, db_constraint=False, help_text='Staff member who issued or received the book', null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('book', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='catalog.book')),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Circulation Event',
+                'verbose_name_plural': 'Circulation Events',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['book', 'id'], name='transaction_book_id_9f061d_idx'), models.Index(fields=['user', 'id'], name='transaction_user_id_ff5b6f_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:03
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def seed_counter(apps, schema_editor):
+    CirculationEvent = apps.get_model('transactions', 'CirculationEvent')
+    CirculationEventCounter = apps.get_model('transactions', 'CirculationEventCounter')
+    last = CirculationEvent.objects.aggregate(last=Max('id'))['last'] or 0
+    CirculationEventCounter.objects.create(pk=1, value=last)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0006_circulation_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CirculationEventCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='circulationevent',
+            name='id',
+            field=models.BigIntegerField(primary_key=True, serialize=False),
+        ),
+        migrations.RunPython(seed_counter, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,10 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.utils import timezone
-from catalog.models import Book
+from catalog.models import Book, BookCopy
 
 
 class Transaction(models.Model):
@@ -19,6 +21,14 @@ class Transaction(models.Model):
     # Relationships
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='transactions')
     book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='transactions')
+    copy = models.ForeignKey(
+        BookCopy,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='transactions',
+        help_text="Physical copy lent out (books without copy records leave this empty)"
+    )
     
     # Transaction Details
     issue_date = models.DateTimeField(auto_now_add=True)
@@ -60,8 +70,47 @@ class Transaction(models.Model):
             models.Index(fields=['user', 'status']),
             models.Index(fields=['book', 'status']),
             models.Index(fields=['due_date']),
+            # active/overdue: return_date IS NULL [AND due_date < today]
+            models.Index(fields=['return_date', 'due_date']),
+            # a member's open loans: user = X AND return_date IS NULL
+            models.Index(fields=['user', 'return_date']),
+            models.Index(fields=['status', 'issue_date']),
+            models.Index(fields=['issue_date']),
+            # unpaid fines: fine_paid = false [AND fine_amount > 0], SUM(fine_amount) (covering)
+            models.Index(fields=['fine_paid', 'fine_amount']),
         ]
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets post_save tell a return apart from later edits (api/signals.py)
+        instance._loaded_return_date = instance.__dict__.get('return_date')
+        instance._loaded_circulation = instance.circulation_state()
+        return instance
+    
+    def circulation_state(self):
+        """Loaded fields whose changes are logged as CirculationEvent rows"""
+        return {name: self.__dict__.get(name) for name in ('return_date', 'due_date', 'fine_amount', 'fine_paid')}
+    
+    def circulation_changes(self, is_new):
+        """``(kind, extra fields)`` of the CirculationEvent rows this save should log"""
+        if is_new:
+            return [(CirculationEvent.ISSUE, {'actor_id': self.issued_by_id, 'due_date': self.due_date})]
+        loaded = getattr(self, '_loaded_circulation', None)
+        if loaded is None:
+            return []
+        changes = []
+        if self.return_date and loaded['return_date'] is None:
+            changes.append((CirculationEvent.RETURN, {'actor_id': self.returned_to_id}))
+        elif not self.return_date and loaded['due_date'] is not None and self.due_date != loaded['due_date']:
+            changes.append((CirculationEvent.RENEW, {'due_date': self.due_date}))
+        assessed = Decimal(str(self.fine_amount or 0)) - Decimal(str(loaded['fine_amount'] or 0))
+        if assessed > 0:
+            changes.append((CirculationEvent.FINE_ASSESSED, {'amount': assessed}))
+        if self.fine_paid and loaded['fine_paid'] is False:
+            changes.append((CirculationEvent.FINE_PAID, {'amount': self.fine_amount}))
+        return changes
+    
     def __str__(self):
         return f"{self.user.username} - {self.book.title} ({self.status})"
     
@@ -100,6 +149,31 @@ class Transaction(models.Model):
             return self.days_overdue * fine_per_day
         return 0.00
     
+    def claim_copy(self):
+        """
+        Put the requested copy, or else the first copy of the book on the
+        shelf, on loan. The UPDATE only matches a copy still on the shelf, so
+        two concurrent issues never lend the same copy: the loser of a race
+        moves on to the next candidate. Returns False for books without copy
+        records, and raises ValidationError when every copy is taken.
+        """
+        on_shelf = BookCopy.objects.filter(book=self.book, state='available')
+        if self.copy is not None:
+            if not on_shelf.filter(pk=self.copy.pk).update(state='on_loan', updated_at=timezone.now()):
+                raise ValidationError({'copy': "Copy is no longer available"})
+            return True
+        copies = list(self.book.copies.order_by('pk'))
+        if not copies:
+            return False
+        for candidate in copies:
+            if candidate.state == 'available' and on_shelf.filter(pk=candidate.pk).update(
+                state='on_loan', updated_at=timezone.now()
+            ):
+                self.copy = candidate
+                return True
+        raise ValidationError("Book is not available for issue")
+    
+    @transaction.atomic(savepoint=False)
     def mark_as_returned(self, returned_to=None):
         """Mark transaction as returned"""
         self.return_date = timezone.now()
@@ -111,31 +185,129 @@ class Transaction(models.Model):
             self.fine_amount = self.calculate_fine()
         
         # Update book availability
-        self.book.available_copies += 1
-        if self.book.available_copies > 0:
-            self.book.status = 'available'
-        self.book.save()
+        if self.copy is not None:
+            self.copy.book = self.book
+            self.copy.state = 'available'
+            self.copy.save()
+        else:
+            self.book.available_copies += 1
+            if self.book.available_copies > 0:
+                self.book.status = 'available'
+            self.book.save()
         
         self.save()
     
     def save(self, *args, **kwargs):
-        """Override save to update book status"""
+        """Override save to update book status and log circulation events"""
         is_new = self.pk is None
         
-        if is_new:
-            # For new transactions, reduce available copies
-            if self.book.available_copies > 0:
-                self.book.available_copies -= 1
-                if self.book.available_copies == 0:
-                    self.book.status = 'issued'
-                self.book.save()
-        
-        # Update status based on dates
-        if not self.return_date and self.is_overdue:
-            self.status = 'overdue'
-            self.fine_amount = self.calculate_fine()
-        
-        super().save(*args, **kwargs)
+        # The book or copy counters, the loan and its events change together.
+        # Like Model.save_base, no savepoint: a failure rolls back the caller too
+        with transaction.atomic(savepoint=False):
+            if is_new and self.claim_copy():
+                self.copy.book = self.book
+                self.copy.state = 'on_loan'
+                self.book.refresh_inventory()
+            elif is_new:
+                # For new transactions, reduce available copies
+                if self.book.available_copies > 0:
+                    self.book.available_copies -= 1
+                    if self.book.available_copies == 0:
+                        self.book.status = 'issued'
+                    self.book.save()
+            
+            # Update status based on dates
+            if not self.return_date and self.is_overdue:
+                self.status = 'overdue'
+                self.fine_amount = self.calculate_fine()
+            
+            changes = self.circulation_changes(is_new)
+            super().save(*args, **kwargs)
+            CirculationEvent.log(self, changes, loan_id=self.pk)
+            self._loaded_circulation = self.circulation_state()
+
+
+class TransactionHistory(models.Model):
+    """
+    Archived copy of a closed transaction (see the ``archive_transactions`` command)
+    
+    Old returned loans are moved here so the live ``Transaction`` table and
+    its indexes only hold recent and open loans.
+    """
+    original_id = models.BigIntegerField(unique=True, help_text="Primary key the row had in Transaction")
+    
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='transaction_history')
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='transaction_history')
+    copy = models.ForeignKey(
+        BookCopy,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='transaction_history'
+    )
+    
+    issue_date = models.DateTimeField()
+    due_date = models.DateField()
+    return_date = models.DateTimeField()
+    
+    status = models.CharField(max_length=20, choices=Transaction.STATUS_CHOICES)
+    fine_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    fine_paid = models.BooleanField(default=False)
+    
+    issued_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='+'
+    )
+    returned_to = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    remarks = models.TextField(blank=True, null=True)
+    
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    # Archived loans are closed by definition
+    is_overdue = False
+    days_overdue = 0
+    
+    COPIED_FIELDS = (
+        'user_id', 'book_id', 'copy_id', 'issue_date', 'due_date', 'return_date',
+        'status', 'fine_amount', 'fine_paid', 'issued_by_id', 'returned_to_id',
+        'remarks', 'created_at', 'updated_at',
+    )
+    
+    class Meta:
+        ordering = ['-issue_date']
+        verbose_name = 'Transaction History'
+        verbose_name_plural = 'Transaction History'
+        indexes = [
+            models.Index(fields=['user', 'issue_date']),
+            models.Index(fields=['book', 'issue_date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.book.title} ({self.status}, archived)"
+    
+    @classmethod
+    def archivable(cls, before):
+        """Live transactions returned before ``before`` with no fine left to collect"""
+        return Transaction.objects.filter(return_date__lt=before).filter(
+            models.Q(fine_paid=True) | models.Q(fine_amount=0)
+        )
+    
+    @classmethod
+    def from_transaction(cls, transaction):
+        return cls(
+            original_id=transaction.pk,
+            **{field: getattr(transaction, field) for field in cls.COPIED_FIELDS}
+        )
 
 
 class Reservation(models.Model):
@@ -165,6 +337,18 @@ class Reservation(models.Model):
         verbose_name = 'Reservation'
         verbose_name_plural = 'Reservations'
         unique_together = ['user', 'book', 'status']
+        indexes = [
+            # holds queue for a title: book = X AND status = 'active'
+            models.Index(fields=['book', 'status']),
+            models.Index(fields=['status', 'reservation_date']),
+            models.Index(fields=['reservation_date']),
+        ]
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
     
     def __str__(self):
         return f"{self.user.username} - {self.book.title} ({self.status})"
@@ -178,3 +362,126 @@ class Reservation(models.Model):
         """Cancel the reservation"""
         self.status = 'cancelled'
         self.save()
+    
+    def save(self, *args, **kwargs):
+        """Override save to log holds placed, fulfilled, cancelled or expired"""
+        if self.pk is None:
+            changes = [(CirculationEvent.HOLD_PLACED, {})]
+        elif self.status != getattr(self, '_loaded_status', self.status):
+            changes = [(kind, {}) for kind in [CirculationEvent.HOLD_KINDS.get(self.status)] if kind]
+        else:
+            changes = []
+        if changes:
+            with transaction.atomic(savepoint=False):
+                super().save(*args, **kwargs)
+                CirculationEvent.log(self, changes, hold_id=self.pk)
+        else:
+            super().save(*args, **kwargs)
+        self._loaded_status = self.status
+
+
+class CirculationEventCounter(models.Model):
+    """Last id handed out to a CirculationEvent: a single row, see ``CirculationEvent.append``"""
+    value = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return str(self.value)
+
+
+class CirculationEvent(models.Model):
+    """
+    Append-only log of circulation: one row per issue, return, renewal, fine
+    assessed or paid, and hold placed or closed.
+    
+    Rows are written in the same database transaction as the change they
+    record (Transaction.save, Reservation.save) and are never updated, so
+    jobs can follow the log from the last id they processed
+    (``/api/events/?since=``) instead of rescanning the mutable tables.
+    References are plain ids without constraints or cascades, so the log
+    outlives the users, books, loans and holds it mentions.
+    
+    Ids come from CirculationEventCounter rather than an auto-increment
+    sequence. Taking ids locks the counter row until the transaction
+    commits, so ids become visible in commit order and a reader that has
+    seen id N will never find a smaller one appear later. The price is that
+    transactions logging events commit one at a time from that point on, so
+    callers append events last.
+    """
+    ISSUE, RETURN, RENEW, FINE_ASSESSED, FINE_PAID = 1, 2, 3, 4, 5
+    HOLD_PLACED, HOLD_FULFILLED, HOLD_CANCELLED, HOLD_EXPIRED = 6, 7, 8, 9
+    KIND_CHOICES = (
+        (ISSUE, 'issue'),
+        (RETURN, 'return'),
+        (RENEW, 'renew'),
+        (FINE_ASSESSED, 'fine_assessed'),
+        (FINE_PAID, 'fine_paid'),
+        (HOLD_PLACED, 'hold_placed'),
+        (HOLD_FULFILLED, 'hold_fulfilled'),
+        (HOLD_CANCELLED, 'hold_cancelled'),
+        (HOLD_EXPIRED, 'hold_expired'),
+    )
+    # Reservation.status a hold moves to -> kind logged
+    HOLD_KINDS = {'fulfilled': HOLD_FULFILLED, 'cancelled': HOLD_CANCELLED, 'expired': HOLD_EXPIRED}
+    
+    id = models.BigIntegerField(primary_key=True)
+    kind = models.PositiveSmallIntegerField(choices=KIND_CHOICES)
+    occurred_at = models.DateTimeField(default=timezone.now)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+'
+    )
+    book = models.ForeignKey(Book, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    loan_id = models.BigIntegerField(blank=True, null=True, help_text="Transaction the event belongs to")
+    hold_id = models.BigIntegerField(blank=True, null=True, help_text="Reservation the event belongs to")
+    actor = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, db_constraint=False,
+        null=True, blank=True, related_name='+', help_text="Staff member who issued or received the book"
+    )
+    amount = models.DecimalField(
+        max_digits=10, decimal_places=2, blank=True, null=True, help_text="Fine assessed or paid"
+    )
+    due_date = models.DateField(blank=True, null=True, help_text="Due date set by an issue or renewal")
+    
+    class Meta:
+        ordering = ['id']
+        verbose_name = 'Circulation Event'
+        verbose_name_plural = 'Circulation Events'
+        indexes = [
+            models.Index(fields=['book', 'id']),
+            models.Index(fields=['user', 'id']),
+        ]
+    
+    def __str__(self):
+        return f"#{self.pk} {self.get_kind_display()} (book {self.book_id}, user {self.user_id})"
+    
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError("Circulation events are append-only")
+        self.append([self])
+    
+    def delete(self, *args, **kwargs):
+        raise ValueError("Circulation events are append-only")
+    
+    @classmethod
+    def append(cls, events):
+        """Insert unsaved ``events`` under the next ids of the counter, in order"""
+        if not events:
+            return []
+        with transaction.atomic(savepoint=False):
+            # The UPDATE takes the row lock that orders the transactions
+            counter = CirculationEventCounter.objects.filter(pk=1)
+            if not counter.update(value=models.F('value') + len(events)):
+                # Only after the table was emptied outside migrations (e.g. a flush)
+                start = cls.objects.aggregate(last=models.Max('id'))['last'] or 0
+                CirculationEventCounter.objects.create(pk=1, value=start + len(events))
+            last = counter.values_list('value', flat=True).get()
+            for offset, event in enumerate(events, start=last - len(events) + 1):
+                event.id = offset
+            return cls.objects.bulk_create(events)
+    
+    @classmethod
+    def log(cls, source, changes, **ids):
+        """Write one row per ``(kind, extra fields)`` in ``changes`` for a loan or hold"""
+        cls.append([
+            cls(kind=kind, user_id=source.user_id, book_id=source.book_id, **ids, **extra)
+            for kind, extra in changes
+        ])
@@ -1,3 +1,274 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+
+from catalog.models import Book, BookCopy, Category
+from .models import CirculationEvent, CirculationEventCounter, Reservation, Transaction
+
+User = get_user_model()
+
+
+class CirculationEventTests(TestCase):
+    """Events written by Transaction.save and Reservation.save"""
+    
+    def setUp(self):
+        self.staff = User.objects.create_user('librarian', password='x', is_staff=True, user_type='staff')
+        self.member = User.objects.create_user('member', password='x', user_type='student')
+        self.book = Book.objects.create(
+            title='Book', author='Author', publisher='Publisher', isbn='9780306406157',
+            location='A1', call_number='CN-1', category=Category.objects.create(name='Fiction'),
+            price=Decimal('20.00'), total_copies=2, available_copies=2,
+        )
+        self.today = timezone.now().date()
+    
+    def events(self):
+        return list(CirculationEvent.objects.values_list('kind', flat=True))
+    
+    def test_loan_lifecycle_logs_each_change_once(self):
+        loan = Transaction.objects.create(
+            user=self.member, book=self.book, due_date=self.today + timedelta(days=7), issued_by=self.staff,
+        )
+        loan.due_date = self.today + timedelta(days=14)
+        loan.save()
+        loan.remarks = 'Slightly worn'
+        loan.save()
+        loan.fine_amount = Decimal('3.00')
+        loan.save()
+        loan.fine_paid = True
+        loan.save()
+        loan.mark_as_returned(returned_to=self.staff)
+        
+        self.assertEqual(self.events(), [
+            CirculationEvent.ISSUE, CirculationEvent.RENEW, CirculationEvent.FINE_ASSESSED,
+            CirculationEvent.FINE_PAID, CirculationEvent.RETURN,
+        ])
+        issue, renew, assessed, paid, returned = CirculationEvent.objects.all()
+        self.assertEqual((issue.actor_id, issue.due_date), (self.staff.pk, self.today + timedelta(days=7)))
+        self.assertEqual(renew.due_date, self.today + timedelta(days=14))
+        self.assertEqual((assessed.amount, paid.amount), (Decimal('3.00'), Decimal('3.00')))
+        self.assertEqual(returned.actor_id, self.staff.pk)
+        self.assertEqual({event.loan_id for event in (issue, returned)}, {loan.pk})
+    
+    def test_reloaded_loan_logs_against_the_loaded_values(self):
+        loan = Transaction.objects.create(user=self.member, book=self.book, due_date=self.today, issued_by=self.staff)
+        loan = Transaction.objects.get(pk=loan.pk)
+        loan.save()
+        loan.due_date = self.today + timedelta(days=7)
+        loan.save()
+        self.assertEqual(self.events(), [CirculationEvent.ISSUE, CirculationEvent.RENEW])
+    
+    def test_holds_log_placement_and_closing(self):
+        expiry = timezone.now() + timedelta(days=7)
+        for status in ('fulfilled', 'cancelled', 'expired'):
+            hold = Reservation.objects.create(user=self.member, book=self.book, expiry_date=expiry)
+            hold.notified = True
+            hold.save()
+            hold.status = status
+            hold.save()
+            # Saving again without a status change logs nothing more
+            hold.save()
+        self.assertEqual(self.events(), [
+            CirculationEvent.HOLD_PLACED, CirculationEvent.HOLD_FULFILLED,
+            CirculationEvent.HOLD_PLACED, CirculationEvent.HOLD_CANCELLED,
+            CirculationEvent.HOLD_PLACED, CirculationEvent.HOLD_EXPIRED,
+        ])
+    
+    def test_existing_events_cannot_be_changed_or_deleted(self):
+        Transaction.objects.create(user=self.member, book=self.book, due_date=self.today, issued_by=self.staff)
+        event = CirculationEvent.objects.get()
+        event.kind = CirculationEvent.RETURN
+        with self.assertRaisesMessage(ValueError, 'append-only'):
+            event.save()
+        with self.assertRaisesMessage(ValueError, 'append-only'):
+            event.delete()
+        self.assertEqual(self.events(), [CirculationEvent.ISSUE])
+    
+    def test_ids_are_taken_from_the_counter_in_order(self):
+        start = CirculationEventCounter.objects.get(pk=1).value
+        CirculationEvent(kind=CirculationEvent.ISSUE, user=self.member, book=self.book).save()
+        CirculationEvent.append([
+            CirculationEvent(kind=CirculationEvent.RENEW, user=self.member, book=self.book),
+            CirculationEvent(kind=CirculationEvent.RETURN, user=self.member, book=self.book),
+        ])
+        self.assertEqual(
+            list(CirculationEvent.objects.values_list('id', 'kind')),
+            [(start + 1, CirculationEvent.ISSUE), (start + 2, CirculationEvent.RENEW),
+             (start + 3, CirculationEvent.RETURN)],
+        )
+        # A missing counter row restarts after the largest id
+        CirculationEventCounter.objects.all().delete()
+        event, = CirculationEvent.append([CirculationEvent(kind=CirculationEvent.RENEW, user=self.member, book=self.book)])
+        self.assertEqual(event.pk, start + 4)
+        self.assertEqual(CirculationEventCounter.objects.get(pk=1).value, start + 4)
+
+
+class AdminBulkReturnTests(TestCase):
+    """TransactionAdmin.mark_as_returned"""
+    
+    def setUp(self):
+        self.staff = User.objects.create_user('librarian', password='x', is_staff=True, user_type='staff')
+        self.member = User.objects.create_user('member', password='x', user_type='student')
+        category = Category.objects.create(name='Fiction')
+        self.books = [
+            Book.objects.create(
+                title=f'Book {i}', author='Author', publisher='Publisher', isbn=isbn,
+                location='A1', call_number=f'CN-{i}', category=category, price=Decimal('20.00'),
+                total_copies=2, available_copies=2,
+            )
+            for i, isbn in enumerate(['9780306406157', '9780262033848', '9780131103627'])
+        ]
+        BookCopy.objects.create(book=self.books[1], barcode='BC-0001')
+    
+    def lend(self, book):
+        return Transaction.objects.create(
+            user=self.member, book=book, due_date=timezone.now().date() + timedelta(days=7), issued_by=self.staff,
+        )
+    
+    def mark_as_returned(self, queryset):
+        from .admin import TransactionAdmin
+        request = RequestFactory().post('/admin/')
+        request.user = self.staff
+        model_admin = TransactionAdmin(Transaction, admin.site)
+        with mock.patch.object(model_admin, 'message_user'), self.captureOnCommitCallbacks(execute=True):
+            model_admin.mark_as_returned(request, queryset)
+    
+    def test_only_the_returned_books_change(self):
+        plain, tracked, other = self.books
+        loans = [self.lend(plain), self.lend(plain), self.lend(tracked)]
+        # Hand-edited drift on a book the action does not return
+        Book.objects.filter(pk=other.pk).update(available_copies=0, status='issued')
+        # And on a returned one, where adding a copy per loan would overshoot
+        Book.objects.filter(pk=plain.pk).update(available_copies=1)
+        
+        self.mark_as_returned(Transaction.objects.filter(pk__in=[loan.pk for loan in loans]))
+        
+        counters = {
+            pk: rest for pk, *rest in Book.objects.values_list('pk', 'status', 'available_copies', 'total_copies')
+        }
+        # Two copies back, capped at the two it owns
+        self.assertEqual(counters[plain.pk], ['available', 2, 2])
+        # Recounted from its single copy
+        self.assertEqual(counters[tracked.pk], ['available', 1, 1])
+        self.assertEqual(counters[other.pk], ['issued', 0, 2])
+        self.assertFalse(Transaction.objects.filter(return_date__isnull=True).exists())
+        self.assertEqual(CirculationEvent.objects.filter(kind=CirculationEvent.RETURN).count(), 3)
+
+
+class ArchiveTransactionsTests(TestCase):
+    """python manage.py archive_transactions"""
+    
+    def setUp(self):
+        self.member = User.objects.create_user('member', password='x', user_type='student')
+        book = Book.objects.create(
+            title='Book', author='Author', publisher='Publisher', isbn='9780306406157',
+            location='A1', call_number='CN-1', category=Category.objects.create(name='Fiction'),
+            price=Decimal('20.00'), total_copies=10, available_copies=10,
+        )
+        long_ago = timezone.now() - timedelta(days=3 * 365)
+        for _ in range(5):
+            loan = Transaction.objects.create(user=self.member, book=book, due_date=long_ago.date())
+            Transaction.objects.filter(pk=loan.pk).update(return_date=long_ago, status='returned', fine_amount=0)
+        self.loan_ids = sorted(Transaction.objects.values_list('pk', flat=True))
+    
+    def archive(self, **options):
+        from io import StringIO
+        from django.core.management import call_command
+        call_command('archive_transactions', batch_size=2, stdout=StringIO(), **options)
+    
+    def test_interrupted_run_resumes_without_losing_or_duplicating_rows(self):
+        from .models import TransactionHistory
+        bulk_create = TransactionHistory.objects.bulk_create
+        calls = []
+        
+        def fail_second_batch(rows, **kwargs):
+            calls.append(len(rows))
+            created = bulk_create(rows, **kwargs)
+            if len(calls) == 2:
+                raise RuntimeError("worker killed")
+            return created
+        
+        with mock.patch.object(TransactionHistory.objects, 'bulk_create', side_effect=fail_second_batch):
+            with self.assertRaises(RuntimeError):
+                self.archive()
+        # The first batch committed; the second rolled back whole
+        self.assertEqual(sorted(TransactionHistory.objects.values_list('original_id', flat=True)), self.loan_ids[:2])
+        self.assertEqual(sorted(Transaction.objects.values_list('pk', flat=True)), self.loan_ids[2:])
+        
+        self.archive(max_batches=1)
+        self.archive()
+        self.assertEqual(sorted(TransactionHistory.objects.values_list('original_id', flat=True)), self.loan_ids)
+        self.assertFalse(Transaction.objects.exists())
+
+
+class CopyClaimTests(TestCase):
+    """Transaction.claim_copy: concurrent issues never lend the same copy"""
+    
+    def setUp(self):
+        self.staff = User.objects.create_user('librarian', password='x', is_staff=True, user_type='staff')
+        self.member = User.objects.create_user('member', password='x', user_type='student')
+        self.book = Book.objects.create(
+            title='Book', author='Author', publisher='Publisher', isbn='9780306406157',
+            location='A1', call_number='CN-1', category=Category.objects.create(name='Fiction'),
+            price=Decimal('20.00'), total_copies=1, available_copies=1,
+        )
+        self.copies = [BookCopy.objects.create(book=self.book, barcode=f'BC-{i}') for i in range(2)]
+    
+    def taken_after_lookup(self, copy):
+        """Execute wrapper: another issue takes ``copy`` right after the first read of the copies"""
+        raced = []
+        
+        def wrapper(execute, sql, params, many, context):
+            result = execute(sql, params, many, context)
+            if not raced and sql.startswith('SELECT') and 'catalog_bookcopy' in sql:
+                raced.append(sql)
+                BookCopy.objects.filter(pk=copy.pk).update(state='on_loan')
+            return result
+        return connection.execute_wrapper(wrapper)
+    
+    def lend(self, **fields):
+        return Transaction.objects.create(
+            user=self.member, book=self.book, due_date=timezone.now().date() + timedelta(days=7),
+            issued_by=self.staff, **fields,
+        )
+    
+    def states(self):
+        return list(BookCopy.objects.order_by('pk').values_list('state', flat=True))
+    
+    def test_loser_of_a_race_takes_the_next_copy(self):
+        with self.taken_after_lookup(self.copies[0]):
+            loan = self.lend()
+        self.assertEqual(loan.copy, self.copies[1])
+        self.assertEqual(self.states(), ['on_loan', 'on_loan'])
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.status, self.book.available_copies), ('issued', 0))
+    
+    def test_issue_fails_when_the_last_copy_is_taken_meanwhile(self):
+        self.copies[1].state = 'maintenance'
+        self.copies[1].save()
+        with self.assertRaises(ValidationError), transaction.atomic(), self.taken_after_lookup(self.copies[0]):
+            self.lend()
+        # The rollback also undid the racing update, which in production had committed
+        self.assertFalse(Transaction.objects.exists())
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.status, self.book.available_copies), ('available', 1))
+    
+    def test_scanned_copy_taken_after_validation_is_rejected(self):
+        from rest_framework.test import APIClient
+        client = APIClient()
+        client.force_authenticate(self.staff)
+        with transaction.atomic(), self.taken_after_lookup(self.copies[0]):
+            response = client.post(
+                '/api/transactions/issue_book/',
+                {'user': self.member.pk, 'copy': self.copies[0].pk, 'due_date': str(timezone.now().date())},
+                format='json',
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'copy': ['Copy is no longer available']})
+        self.assertFalse(Transaction.objects.exists())
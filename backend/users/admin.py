@@ -9,6 +9,7 @@ class UserAdmin(BaseUserAdmin):
     list_filter = ('user_type', 'status', 'is_staff', 'is_superuser', 'is_active')
     search_fields = ('username', 'first_name', 'last_name', 'email', 'library_card_number')
     ordering = ('-date_joined',)
+    show_full_result_count = False
     
     fieldsets = BaseUserAdmin.fieldsets + (
         ('Library Information', {
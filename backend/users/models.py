@@ -33,6 +33,10 @@ class User(AbstractUser):
     profile_picture = models.ImageField(upload_to='profile_pictures/', blank=True, null=True)
     library_card_number = models.CharField(max_length=20, unique=True, blank=True, null=True)
     max_books_allowed = models.IntegerField(default=5)
+    token_version = models.PositiveIntegerField(
+        default=0, editable=False,
+        help_text="Bumped whenever issued JWTs must stop working"
+    )
     membership_start_date = models.DateField(auto_now_add=True)
     membership_end_date = models.DateField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -42,10 +46,46 @@ class User(AbstractUser):
         ordering = ['-created_at']
         verbose_name = 'User'
         verbose_name_plural = 'Users'
+        indexes = [
+            models.Index(fields=['date_joined']),
+            models.Index(fields=['user_type', 'status']),
+            models.Index(fields=['status']),
+        ]
+    
+    # Changing any of these revokes the user's outstanding tokens
+    TOKEN_SENSITIVE_FIELDS = ('password', 'is_active', 'is_staff', 'user_type', 'status')
     
     def __str__(self):
         return f"{self.get_full_name()} ({self.username})"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_token_state = instance._token_state()
+        # Lets post_save skip thumbnails when the picture is unchanged (api/signals.py)
+        if 'profile_picture' in instance.__dict__:
+            instance._loaded_images = {'profile_picture': instance.__dict__['profile_picture'] or None}
+        return instance
+    
+    def _token_state(self):
+        # Read __dict__ directly so deferred fields are never fetched here
+        return {
+            name: self.__dict__[name]
+            for name in self.TOKEN_SENSITIVE_FIELDS if name in self.__dict__
+        }
+    
+    def save(self, *args, **kwargs):
+        """Override save to revoke tokens when access-relevant fields change"""
+        loaded = getattr(self, '_loaded_token_state', None)
+        current = self._token_state()
+        if loaded and any(current.get(name, value) != value for name, value in loaded.items()):
+            self.token_version += 1
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'token_version'}
+        super().save(*args, **kwargs)
+        self._loaded_token_state = self._token_state()
+    
     @property
     def is_membership_active(self):
         """Check if user's membership is active"""
@@ -56,7 +96,9 @@ class User(AbstractUser):
     
     @property
     def books_issued_count(self):
-        """Count of currently issued books"""
+        """Count of currently issued books (from the ``_books_issued_count`` annotation when present)"""
+        if '_books_issued_count' in self.__dict__:
+            return self._books_issued_count
         return self.transactions.filter(return_date__isnull=True).count()
     
     @property
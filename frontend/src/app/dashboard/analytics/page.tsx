@@ -12,13 +12,13 @@ import {
   FiCalendar,
   FiActivity,
 } from 'react-icons/fi';
-import { bookService, transactionService } from '@/lib/api';
+import { dashboardService } from '@/lib/api';
 
 interface Stats {
   totalBooks: number;
   availableBooks: number;
   issuedBooks: number;
-  totalMembers: number;
+  activeMembers: number;
   activeTransactions: number;
   overdueBooks: number;
   totalFines: number;
@@ -35,7 +35,7 @@ export default function AnalyticsPage() {
     totalBooks: 0,
     availableBooks: 0,
     issuedBooks: 0,
-    totalMembers: 0,
+    activeMembers: 0,
     activeTransactions: 0,
     overdueBooks: 0,
     totalFines: 0,
@@ -52,20 +52,20 @@ export default function AnalyticsPage() {
   const fetchAnalytics = async () => {
     try {
       setLoading(true);
-      const [bookStats, transStats] = await Promise.all([
-        bookService.getStatistics(),
-        transactionService.getStatistics(),
-      ]);
+      const summary = await dashboardService.getSummary();
+      const bookStats = summary.books || {};
+      const transStats = summary.transactions || {};
+      const memberStats = summary.members || {};
 
       setStats({
         totalBooks: bookStats.total_books || 0,
         availableBooks: bookStats.available_books || 0,
         issuedBooks: bookStats.issued_books || 0,
-        totalMembers: 1234, // Mock data
+        activeMembers: memberStats.active_members || 0,
         activeTransactions: transStats.active_transactions || 0,
         overdueBooks: transStats.overdue_transactions || 0,
         totalFines: transStats.total_unpaid_fines || 0,
-        thisMonthIssues: 245, // Mock data
+        thisMonthIssues: transStats.issued_this_month || 0,
         trend: {
           books: 12.5,
           members: 8.3,
@@ -91,7 +91,7 @@ export default function AnalyticsPage() {
     },
     {
       title: 'Active Members',
-      value: stats.totalMembers,
+      value: stats.activeMembers,
       change: stats.trend.members,
       icon: <FiUsers className="text-2xl" />,
       color: 'from-purple-500 to-purple-600',
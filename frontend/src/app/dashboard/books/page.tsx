@@ -34,7 +34,8 @@ interface Book {
   description: string;
   publisher: string;
   publication_date: string;
-  cover_image?: string;
+  cover_thumb_url?: string;
+  cover_medium_url?: string;
 }
 
 interface NewBookForm {
@@ -396,7 +397,7 @@ export default function BooksPage() {
               >
                 <div className="aspect-[3/4] bg-gradient-to-br from-primary-100 to-purple-100 flex items-center justify-center relative overflow-hidden">
                   <BookCover
-                    coverImage={book.cover_image}
+                    coverImage={book.cover_thumb_url}
                     title={book.title}
                     author={book.author}
                   />
@@ -474,7 +475,7 @@ export default function BooksPage() {
               <div className="mb-6">
                 <div className="aspect-[3/4] max-w-xs mx-auto bg-gradient-to-br from-primary-100 to-purple-100 rounded-lg overflow-hidden shadow-sm">
                   <BookCover
-                    coverImage={selectedBook.cover_image}
+                    coverImage={selectedBook.cover_medium_url}
                     title={selectedBook.title}
                     author={selectedBook.author}
                   />
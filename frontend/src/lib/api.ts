@@ -280,4 +280,13 @@ export const reservationService = {
   },
 };
 
+// ============= DASHBOARD SERVICES =============
+export const dashboardService = {
+  // Book, transaction, reservation and member stats plus the caller's own loans
+  getSummary: async () => {
+    const response = await api.get('/dashboard/summary/');
+    return response.data;
+  },
+};
+
 export default api;